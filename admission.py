@@ -0,0 +1,289 @@
+# admission.py
+# Admission control for LLM-backed endpoints (/chat, /chat/stream, /analyze-economic).
+#
+# Two layers, checked in order:
+#   1. Token buckets: one per user (authenticated) or per IP (guests), plus a
+#      per-IP bucket for everyone. Empty bucket -> 429 with Retry-After.
+#   2. A global concurrency cap (MAX_ACTIVE) with a bounded priority queue in
+#      front of it. Authenticated users are served before guests; a full queue
+#      evicts the newest guest to make room for an authenticated caller. If the
+#      expected wait exceeds QUEUE_TIMEOUT we shed immediately instead of queueing.
+#
+# Buckets live in-process by default; ADMISSION_STORE=mongo shares them across
+# workers through the `rate_limits` collection (atomic pipeline update, TTL-expired).
+# The concurrency cap / queue is always per worker.
+#
+# Usage (explicit acquire/release so streaming routes can hold the slot until
+# the last byte is sent):
+#     ticket = await admission.acquire("chat", user_id, client_ip(request))
+#     try: ... finally: admission.release(ticket)
+
+import asyncio
+import heapq
+import itertools
+import os
+import threading
+import time
+
+from fastapi import HTTPException
+
+ADMISSION_STORE = os.getenv("ADMISSION_STORE", "memory")
+MAX_ACTIVE = int(os.getenv("ADMISSION_MAX_ACTIVE", "32"))
+MAX_QUEUE = int(os.getenv("ADMISSION_MAX_QUEUE", "100"))
+QUEUE_TIMEOUT = float(os.getenv("ADMISSION_QUEUE_TIMEOUT", "10"))
+# proxies in front of us that append to X-Forwarded-For (0: ignore the header)
+TRUSTED_PROXY_HOPS = int(os.getenv("TRUSTED_PROXY_HOPS", "1"))
+
+# bucket kind -> (burst capacity, refill per minute)
+LIMITS = {
+    "user":  (int(os.getenv("RATE_USER_BURST", "10")), float(os.getenv("RATE_USER_PER_MIN", "20"))),
+    "guest": (int(os.getenv("RATE_GUEST_BURST", "3")), float(os.getenv("RATE_GUEST_PER_MIN", "5"))),
+    "ip":    (int(os.getenv("RATE_IP_BURST", "30")), float(os.getenv("RATE_IP_PER_MIN", "60"))),
+}
+
+PRIORITY_AUTHENTICATED = 0
+PRIORITY_GUEST = 1
+
+
+def client_ip(request) -> str:
+    """Address our trusted proxy saw, else the socket peer.
+
+    Each proxy appends the peer it received from, so only the last
+    TRUSTED_PROXY_HOPS entries of X-Forwarded-For are ours; anything left of
+    them was sent by the client and can't be used for rate limiting.
+    """
+    fwd = request.headers.get("x-forwarded-for")
+    if fwd and TRUSTED_PROXY_HOPS > 0:
+        hops = [h.strip() for h in fwd.split(",") if h.strip()]
+        if len(hops) >= TRUSTED_PROXY_HOPS:
+            return hops[-TRUSTED_PROXY_HOPS]
+    return request.client.host if request.client else "unknown"
+
+
+def _too_many(retry_after: float, detail: str):
+    return HTTPException(
+        status_code=429,
+        detail=detail,
+        headers={"Retry-After": str(max(1, int(retry_after + 0.999)))},
+    )
+
+
+# --- bucket stores ---
+
+class MemoryBucketStore:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._buckets = {}  # key -> [tokens, updated_monotonic]
+
+    async def take(self, key: str, capacity: int, per_min: float) -> float:
+        """Take one token. Returns 0 if allowed, else seconds until a token is available."""
+        rate = per_min / 60.0
+        now = time.monotonic()
+        with self._lock:
+            tokens, ts = self._buckets.get(key, (capacity, now))
+            tokens = min(capacity, tokens + (now - ts) * rate)
+            if tokens >= 1:
+                self._buckets[key] = [tokens - 1, now]
+                allowed = True
+            else:
+                self._buckets[key] = [tokens, now]
+                allowed = False
+            if len(self._buckets) > 100_000:
+                self._prune(now)
+        return 0.0 if allowed else (1 - tokens) / rate
+
+    def _prune(self, now: float):
+        # caller holds the lock; buckets idle for 10 min are full again anyway
+        self._buckets = {k: v for k, v in self._buckets.items() if now - v[1] < 600}
+
+
+class MongoBucketStore:
+    """Token buckets shared across workers. Refill uses the server clock ($$NOW).
+
+    Runs on the async client: take() is awaited on every admitted request.
+    """
+
+    def __init__(self, db=None):
+        self._db = db
+
+    @property
+    def coll(self):
+        if self._db is None:
+            from mongo_pool import get_async_client
+            self._db = get_async_client("api")["hypewave"]
+        return self._db["rate_limits"]
+
+    async def take(self, key: str, capacity: int, per_min: float) -> float:
+        from pymongo import ReturnDocument
+
+        rate_ms = per_min / 60_000.0
+        now_ms = {"$toLong": "$$NOW"}
+        doc = await self.coll.find_one_and_update(
+            {"_id": key},
+            [
+                {"$set": {"tokens": {"$min": [capacity, {"$add": [
+                    {"$ifNull": ["$tokens", capacity]},
+                    {"$multiply": [{"$subtract": [now_ms, {"$ifNull": ["$ts", now_ms]}]}, rate_ms]},
+                ]}]}, "ts": now_ms}},
+                {"$set": {"allowed": {"$gte": ["$tokens", 1]}}},
+                {"$set": {
+                    "tokens": {"$cond": ["$allowed", {"$subtract": ["$tokens", 1]}, "$tokens"]},
+                    "expires_at": {"$add": ["$$NOW", 600_000]},
+                }},
+            ],
+            upsert=True,
+            return_document=ReturnDocument.AFTER,
+        )
+        if doc["allowed"]:
+            return 0.0
+        return (1 - doc["tokens"]) / (rate_ms * 1000)
+
+
+# --- controller ---
+
+class Ticket:
+    __slots__ = ("route", "user_id", "admitted_at", "released")
+
+    def __init__(self, route: str, user_id: str):
+        self.route = route
+        self.user_id = user_id
+        self.admitted_at = time.monotonic()
+        self.released = False
+
+
+class AdmissionController:
+    def __init__(self, store=None, max_active: int = MAX_ACTIVE, max_queue: int = MAX_QUEUE,
+                 queue_timeout: float = QUEUE_TIMEOUT):
+        self.store = store or (MongoBucketStore() if ADMISSION_STORE == "mongo" else MemoryBucketStore())
+        self.max_active = max_active
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+
+        self.active = 0
+        self._waiters = []            # heap of (priority, seq, future)
+        self._seq = itertools.count()
+        self._service_ewma = 2.0      # seconds a slot is typically held
+
+        self._stats = {"admitted": 0, "queued": 0, "rate_limited": 0, "shed_queue_full": 0,
+                       "shed_deadline": 0, "evicted": 0, "queue_timeouts": 0}
+
+    async def _check_buckets(self, user_id: str, ip: str):
+        authed = user_id and user_id != "guest"
+        kind = "user" if authed else "guest"
+        checks = [(f"{kind}:{user_id if authed else ip}", LIMITS[kind]), (f"ip:{ip}", LIMITS["ip"])]
+        for key, (capacity, per_min) in checks:
+            try:
+                wait = await self.store.take(key, capacity, per_min)
+            except Exception as e:
+                # shared store down: fail open rather than take chat offline
+                print(f"[admission] bucket store error ({key}): {e}")
+                continue
+            if wait > 0:
+                self._stats["rate_limited"] += 1
+                raise _too_many(wait, "Rate limit exceeded")
+
+    def _expected_wait(self, position: int) -> float:
+        # each freed slot admits one waiter; slots free up every ewma / max_active seconds
+        return (position + 1) * self._service_ewma / self.max_active
+
+    async def acquire(self, route: str, user_id: str, ip: str) -> Ticket:
+        await self._check_buckets(user_id, ip)
+
+        ticket = Ticket(route, user_id)
+        if self.active < self.max_active and not self._waiters:
+            self.active += 1
+            self._stats["admitted"] += 1
+            return ticket
+
+        priority = PRIORITY_AUTHENTICATED if user_id and user_id != "guest" else PRIORITY_GUEST
+        ahead = sum(1 for p, _, _ in self._waiters if p <= priority)
+        expected = self._expected_wait(ahead)
+        if expected > self.queue_timeout:
+            self._stats["shed_deadline"] += 1
+            raise _too_many(expected, "Server busy, try again shortly")
+
+        if len(self._waiters) >= self.max_queue:
+            if not self._evict_guest_for(priority):
+                self._stats["shed_queue_full"] += 1
+                raise _too_many(expected, "Server busy, try again shortly")
+
+        fut = asyncio.get_running_loop().create_future()
+        entry = (priority, next(self._seq), fut)
+        heapq.heappush(self._waiters, entry)
+        self._stats["queued"] += 1
+        try:
+            await asyncio.wait_for(asyncio.shield(fut), self.queue_timeout)
+        except asyncio.TimeoutError:
+            self._stats["queue_timeouts"] += 1
+            if fut.done() and not fut.cancelled() and fut.exception() is None:
+                # slot was handed over just as we timed out: give it back
+                self._release_slot()
+            else:
+                self._remove_waiter(entry)
+            raise _too_many(self._expected_wait(len(self._waiters)), "Server busy, try again shortly")
+        except asyncio.CancelledError:
+            if fut.done() and not fut.cancelled() and fut.exception() is None:
+                self._release_slot()
+            else:
+                self._remove_waiter(entry)
+            raise
+        exc = fut.exception()
+        if exc is not None:
+            raise exc
+        self._stats["admitted"] += 1
+        ticket.admitted_at = time.monotonic()
+        return ticket
+
+    def _evict_guest_for(self, priority: int) -> bool:
+        """Queue is full: drop the newest guest waiter if the caller outranks it."""
+        if priority != PRIORITY_AUTHENTICATED:
+            return False
+        guests = [w for w in self._waiters if w[0] == PRIORITY_GUEST]
+        if not guests:
+            return False
+        victim = max(guests, key=lambda w: w[1])
+        self._remove_waiter(victim)
+        if not victim[2].done():
+            victim[2].set_exception(_too_many(self.queue_timeout, "Server busy, try again shortly"))
+        self._stats["evicted"] += 1
+        return True
+
+    def _remove_waiter(self, entry):
+        try:
+            self._waiters.remove(entry)
+            heapq.heapify(self._waiters)
+        except ValueError:
+            pass
+
+    def _release_slot(self):
+        # hand the slot straight to the best waiter, or free it
+        while self._waiters:
+            _, _, fut = heapq.heappop(self._waiters)
+            if not fut.done():
+                fut.set_result(True)
+                return
+        self.active -= 1
+
+    def release(self, ticket: Ticket):
+        """Idempotent; safe to call from both a streaming generator and its background task."""
+        if ticket is None or ticket.released:
+            return
+        ticket.released = True
+        held = time.monotonic() - ticket.admitted_at
+        self._service_ewma = 0.9 * self._service_ewma + 0.1 * held
+        self._release_slot()
+
+    def stats(self) -> dict:
+        return {
+            **self._stats,
+            "store": ADMISSION_STORE,
+            "active": self.active,
+            "max_active": self.max_active,
+            "queued_now": len(self._waiters),
+            "max_queue": self.max_queue,
+            "avg_service_s": round(self._service_ewma, 3),
+        }
+
+
+# Process-wide controller used by api.py
+admission = AdmissionController()
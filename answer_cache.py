@@ -0,0 +1,257 @@
+# answer_cache.py
+# Near-duplicate answer cache in front of /chat.
+#
+# Scope of an entry: (symbol, price bucket). Inside a scope, questions are matched
+#   1. exactly on their normalized form, or
+#   2. approximately with MinHash over the normalized word set + LSH banding,
+#      so "btc long or short?" and "should I long or short $BTC" hit the same answer.
+# No embedding service: everything is local and in-process.
+#
+# An entry dies when its TTL passes or when the live price has moved more than
+# PRICE_MOVE_PCT from the price it was generated at (checked on every lookup,
+# and on demand through invalidate_symbol / on_price).
+#
+# Only standalone questions are cached: no image, no conversation memory in the prompt.
+
+import hashlib
+import math
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+
+TTL_SECONDS = float(os.getenv("ANSWER_CACHE_TTL", "120"))
+PRICE_BUCKET_PCT = float(os.getenv("ANSWER_CACHE_BUCKET_PCT", "0.5"))   # bucket width, % of price
+PRICE_MOVE_PCT = float(os.getenv("ANSWER_CACHE_MOVE_PCT", "0.4"))       # invalidate past this move
+SIMILARITY = float(os.getenv("ANSWER_CACHE_SIMILARITY", "0.7"))         # min estimated Jaccard
+MAX_ENTRIES = int(os.getenv("ANSWER_CACHE_MAX_ENTRIES", "5000"))
+
+NUM_PERM = 64
+BANDS = 16
+ROWS = NUM_PERM // BANDS
+_MERSENNE = (1 << 61) - 1
+_PERMS = [
+    (int.from_bytes(hashlib.blake2b(f"a{i}".encode(), digest_size=8).digest(), "big") % _MERSENNE or 1,
+     int.from_bytes(hashlib.blake2b(f"b{i}".encode(), digest_size=8).digest(), "big") % _MERSENNE)
+    for i in range(NUM_PERM)
+]
+
+STOPWORDS = {
+    "a", "an", "the", "i", "me", "my", "we", "you", "u", "it", "its", "is", "are", "am", "be", "was",
+    "do", "does", "should", "would", "could", "can", "will", "what", "whats", "how", "hows", "think",
+    "about", "on", "for", "to", "in", "of", "at", "or", "and", "right", "now", "today", "rn", "pls",
+    "please", "hey", "hi", "yo", "go", "going", "there", "this", "that", "here", "with", "your", "thoughts",
+}
+SYNONYMS = {
+    "bitcoin": "btc", "ethereum": "eth", "ether": "eth", "solana": "sol", "gold": "xau",
+    "buy": "long", "bullish": "long", "longs": "long", "sell": "short", "bearish": "short", "shorts": "short",
+    "tp": "target", "targets": "target", "sl": "stop", "stoploss": "stop",
+}
+
+
+def normalize(text: str) -> list[str]:
+    words = re.findall(r"[a-z0-9]+", text.lower().replace("$", " "))
+    out = []
+    for w in words:
+        w = SYNONYMS.get(w, w)
+        if w not in STOPWORDS:
+            out.append(w)
+    return out
+
+
+def _hash64(token: str) -> int:
+    return int.from_bytes(hashlib.blake2b(token.encode(), digest_size=8).digest(), "big")
+
+
+def minhash(tokens) -> tuple:
+    hashes = [_hash64(t) for t in set(tokens)] or [0]
+    return tuple(min((a * h + b) % _MERSENNE for h in hashes) for a, b in _PERMS)
+
+
+def similarity(sig_a: tuple, sig_b: tuple) -> float:
+    return sum(1 for x, y in zip(sig_a, sig_b) if x == y) / NUM_PERM
+
+
+def price_bucket(price: float) -> int:
+    # log-spaced buckets: each one PRICE_BUCKET_PCT wide whatever the price level
+    return int(math.floor(math.log(price) / math.log1p(PRICE_BUCKET_PCT / 100)))
+
+
+def current_price(symbol: str):
+    """Live price from the market context snapshot, else the last 1h close."""
+    from market_context import snapshots
+    from market_data_ws import get_latest_ohlc
+
+    price = snapshots.get(symbol, {}).get("price")
+    if price in (None, "N/A"):
+        candles = get_latest_ohlc(f"{symbol}USDT", "1h")
+        price = candles[-1]["close"] if candles else None
+    try:
+        price = float(price)
+    except (TypeError, ValueError):
+        return None
+    return price if price > 0 else None
+
+
+class _Entry:
+    __slots__ = ("id", "scope", "norm", "sig", "answer", "price", "created", "latency", "tokens", "hits")
+
+    def __init__(self, id, scope, norm, sig, answer, price, latency, tokens):
+        self.id = id
+        self.scope = scope
+        self.norm = norm
+        self.sig = sig
+        self.answer = answer
+        self.price = price
+        self.created = time.monotonic()
+        self.latency = latency
+        self.tokens = tokens
+        self.hits = 0
+
+
+class AnswerCache:
+    def __init__(self, price_fn=current_price):
+        self.price_fn = price_fn
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()   # id -> _Entry (LRU order)
+        self._exact = {}                # (scope, norm) -> id
+        self._bands = {}                # (scope, band_no, band) -> set(ids)
+        self._by_symbol = {}            # symbol -> set(ids)
+        self._next_id = 0
+        self._stats = {"lookups": 0, "hits": 0, "exact_hits": 0, "similar_hits": 0, "misses": 0,
+                       "uncacheable": 0, "stores": 0, "expired": 0, "price_invalidated": 0,
+                       "evicted": 0, "latency_saved_s": 0.0, "tokens_saved": 0}
+
+    # --- index maintenance (caller holds the lock) ---
+
+    def _band_keys(self, scope, sig):
+        return [(scope, b, sig[b * ROWS:(b + 1) * ROWS]) for b in range(BANDS)]
+
+    def _remove(self, entry_id, reason: str = None):
+        e = self._entries.pop(entry_id, None)
+        if e is None:
+            return
+        if self._exact.get((e.scope, e.norm)) == entry_id:
+            del self._exact[(e.scope, e.norm)]
+        for key in self._band_keys(e.scope, e.sig):
+            ids = self._bands.get(key)
+            if ids:
+                ids.discard(entry_id)
+                if not ids:
+                    del self._bands[key]
+        sym_ids = self._by_symbol.get(e.scope[0])
+        if sym_ids:
+            sym_ids.discard(entry_id)
+        if reason:
+            self._stats[reason] += 1
+
+    def _alive(self, e: _Entry, price: float, now: float) -> bool:
+        if now - e.created > TTL_SECONDS:
+            self._remove(e.id, "expired")
+            return False
+        if abs(price - e.price) / e.price * 100 > PRICE_MOVE_PCT:
+            self._remove(e.id, "price_invalidated")
+            return False
+        return True
+
+    # --- public API ---
+
+    def lookup(self, symbol: str, question: str):
+        """Cached answer for a near-identical question about `symbol` at today's price, else None."""
+        price = self.price_fn(symbol)
+        norm_tokens = normalize(question)
+        with self._lock:
+            self._stats["lookups"] += 1
+            if price is None or not norm_tokens:
+                self._stats["uncacheable"] += 1
+                return None
+            scope = (symbol, price_bucket(price))
+            norm = " ".join(norm_tokens)
+            now = time.monotonic()
+
+            hit, kind = None, None
+            eid = self._exact.get((scope, norm))
+            if eid is not None and self._alive(self._entries[eid], price, now):
+                hit, kind = self._entries[eid], "exact_hits"
+            else:
+                sig = minhash(norm_tokens)
+                candidates = set()
+                for key in self._band_keys(scope, sig):
+                    candidates |= self._bands.get(key, set())
+                best, best_sim = None, SIMILARITY
+                for cid in candidates:
+                    e = self._entries.get(cid)
+                    if e is None or not self._alive(e, price, now):
+                        continue
+                    sim = similarity(sig, e.sig)
+                    if sim >= best_sim:
+                        best, best_sim = e, sim
+                if best is not None:
+                    hit, kind = best, "similar_hits"
+
+            if hit is None:
+                self._stats["misses"] += 1
+                return None
+            hit.hits += 1
+            self._entries.move_to_end(hit.id)
+            self._stats["hits"] += 1
+            self._stats[kind] += 1
+            self._stats["latency_saved_s"] += hit.latency
+            self._stats["tokens_saved"] += hit.tokens
+            return hit.answer
+
+    def store(self, symbol: str, question: str, answer: str, latency: float = 0.0, tokens: int = 0):
+        """Remember an answer; latency (s) and tokens are what a future hit saves."""
+        price = self.price_fn(symbol)
+        norm_tokens = normalize(question)
+        if price is None or not norm_tokens or not answer:
+            return
+        scope = (symbol, price_bucket(price))
+        norm = " ".join(norm_tokens)
+        sig = minhash(norm_tokens)
+        with self._lock:
+            old = self._exact.get((scope, norm))
+            if old is not None:
+                self._remove(old)
+            self._next_id += 1
+            e = _Entry(self._next_id, scope, norm, sig, answer, price, latency, tokens)
+            self._entries[e.id] = e
+            self._exact[(scope, norm)] = e.id
+            for key in self._band_keys(scope, sig):
+                self._bands.setdefault(key, set()).add(e.id)
+            self._by_symbol.setdefault(symbol, set()).add(e.id)
+            self._stats["stores"] += 1
+            while len(self._entries) > MAX_ENTRIES:
+                self._remove(next(iter(self._entries)), "evicted")
+
+    def on_price(self, symbol: str, price: float):
+        """Drop every entry for `symbol` generated more than PRICE_MOVE_PCT away from `price`."""
+        if not self._by_symbol.get(symbol):
+            return  # called for every ticker update: stay cheap when nothing is cached
+        now = time.monotonic()
+        with self._lock:
+            for eid in list(self._by_symbol.get(symbol, ())):
+                e = self._entries.get(eid)
+                if e is not None:
+                    self._alive(e, price, now)
+
+    def invalidate_symbol(self, symbol: str):
+        with self._lock:
+            for eid in list(self._by_symbol.get(symbol, ())):
+                self._remove(eid, "price_invalidated")
+
+    def stats(self) -> dict:
+        with self._lock:
+            s = dict(self._stats)
+            s["entries"] = len(self._entries)
+        answered = s["lookups"] - s["uncacheable"]
+        s["hit_rate"] = round(s["hits"] / answered, 3) if answered else None
+        s["latency_saved_s"] = round(s["latency_saved_s"], 2)
+        s["ttl_s"] = TTL_SECONDS
+        s["price_move_pct"] = PRICE_MOVE_PCT
+        return s
+
+
+# Process-wide cache used by api.py
+answer_cache = AnswerCache()
@@ -1,35 +1,53 @@
-from fastapi import FastAPI, Query, UploadFile, File, Form, Body, Request, BackgroundTasks, Depends
+from fastapi import FastAPI, Query, UploadFile, File, Form, Body, Request, Response, BackgroundTasks, Depends, HTTPException
 from dotenv import load_dotenv
 from schemas import ChatRequest, ChatResponse
-from db import log_signal, collection, log_chat, chats_coll, votes_coll, users_coll  
+import db_async as adb
 from datetime import datetime, timedelta, timezone
 from pymongo import DESCENDING
-from openai import OpenAI
-from market_context import extract_symbol, get_market_context
+import llm_gateway
+from market_context import extract_symbol, start_market_context_service, price_listeners, market_context_stats
+from prompt_engine import build_chat_messages, prompt_metrics, count_tokens
+from answer_cache import answer_cache
+from image_pipeline import images, read_image
+from idempotency import idempotency, fingerprint, HEADER as IDEMPOTENCY_HEADER
+from chat_memory import get_memory, has_memory, DEFAULT_CONVERSATION
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import StreamingResponse
+from starlette.background import BackgroundTask
 from fastapi.staticfiles import StaticFiles
-from db import get_latest_news, set_user_push_token
 from signal_engine import generate_alerts_for_symbol
-from market_data_ws import get_latest_ohlc, start_ws_listener
+from market_data_ws import start_ws_listener
 from fastapi.staticfiles import StaticFiles
 import asyncio
-import base64, random, os, re, threading
+import json, random, os, re, threading, time
 import cloudinary # type: ignore
 from bson import ObjectId
 from economic_scraper import scrape_marketwatch_calendar
+from economic_analysis import BATCH_SIZE as ECON_BATCH_SIZE, analyses, analyze_batch_async, build_event_prompt, clamp, event_fingerprint, iter_calendar_events
 from contextlib import asynccontextmanager
 from auth_routes import router as auth_router
-from auth_utils import decode_access_token
 from auth_routes import get_current_user
+from auth_cache import auth_cache, get_optional_user, user_id_of
+from jwks_cache import jwks_cache
+from password_pool import passwords
 from pathlib import Path
-from winrate_checker import get_winrate 
 from cleanup_signals import close_signals_once
+from db_indexes import ensure_indexes
+from mongo_pool import pool_metrics
+from write_behind import write_buffer
+from admission import admission, client_ip
+from cursors import encode_cursor, keyset_filter
+from news_feed import news_feed
+from event_broker import broker, EVENT_TYPES
+from signal_watcher import signal_watcher, project, FEED_SOURCE
+from response_cache import response_cache, ResponseCacheMiddleware
+from db import format_signal_doc
+from signal_votes import vote_counters, record_vote, vote_delta, feedback as current_feedback
 from pydantic import BaseModel
 
 load_dotenv()
 
 
-client = OpenAI()
 
 cloudinary.config(
   cloud_name=os.getenv("CLOUDINARY_CLOUD_NAME"),
@@ -39,31 +57,74 @@ cloudinary.config(
 
 @asynccontextmanager
 async def lifespan(app):
-    # ✅ Ensure indexes & default fields once at startup
-    try:
-        # Unique vote per (signal_id, user_id)
-        votes_coll.create_index([("signal_id", 1), ("user_id", 1)], unique=True)
+    await adb.ping()
 
-        users_coll.create_index("apple_sub", unique=True, sparse=True)
+    # ✅ Reconcile declared indexes (db_indexes.INDEXES) & default fields once at startup
+    try:
+        for action in await asyncio.to_thread(ensure_indexes):
+            print("[startup] index", action)
 
         # Seed default feedback counters and normalize status
-        from db import client as _mc
-        _mc["hypewave"]["signals"].update_many(
+        await adb.collection.update_many(
             {"feedback": {"$exists": False}},
             {"$set": {"feedback": {"up": 0, "down": 0}}}
         )
-        _mc["hypewave"]["signals"].update_many({"status": "OPEN"}, {"$set": {"status": "open"}})
+        # Older /signals/feedback calls $push'ed "up"/"down" strings into the counters: count them back
+        # (they have no vote record, so they're anonymous counts; see signal_votes.reconcile)
+        await adb.collection.update_many(
+            {"feedback": {"$type": "array"}},
+            [{"$set": {"feedback": {
+                k: {"$size": {"$filter": {"input": "$feedback", "cond": {"$eq": ["$$this", k]}}}}
+                for k in ("up", "down")
+            }}}, {"$set": {"feedback_anon": "$feedback"}}]
+        )
+        await adb.collection.update_many({"status": "OPEN"}, {"$set": {"status": "open"}})
     except Exception as _e:
         print("[startup] index/defaults error:", _e)
 
+    # ✅ /chat/history reads chat_turns: copy history logged to `chats` before it existed (once)
+    async def _migrate_chats():
+        try:
+            await get_memory().migrate_legacy_chats(adb.chats_coll)
+        except Exception as e:
+            print("[startup] chat history migration error:", e)
+    asyncio.create_task(_migrate_chats())
+
     # ✅ Start WS listener + AI engine
     start_ws_listener()
 
+    # ✅ Start market context snapshots (ticker / mark price streams + long/short refresh)
+    start_market_context_service()
+    price_listeners.append(answer_cache.on_price)  # drop cached answers once price moves
+
+    # ✅ Precomputed economic analyses -> memory (refreshed; the scraper job writes them)
+    asyncio.create_task(analyses.refresh_forever())
+
+    # ✅ News head cache: kept live from the ingestion writes (change stream / polling)
+    asyncio.create_task(news_feed.follow_forever())
+
+    # ✅ Signals change stream -> in-memory view of the feed (first page of /signals/latest)
+    asyncio.create_task(signal_watcher.follow_forever())
+
+    # ✅ Live events for /events/stream: news + signal changes, new alerts
+    broker.bind_loop()
+    news_feed.listeners.append(broker.on_news)
+    signal_watcher.listeners.append(broker.on_signal)
+    asyncio.create_task(broker.follow_alerts_forever())
+    broker.listeners.append(response_cache.on_event)  # live events make cached GETs stale
+
+    # ✅ Google / Apple signing keys, refreshed ahead of expiry so logins verify locally
+    asyncio.create_task(jwks_cache.refresh_forever())
+
+    # ✅ Vote counters: deltas coalesced in memory, one bulk $inc per flush
+    asyncio.create_task(vote_counters.flush_forever())
+    asyncio.create_task(vote_counters.reconcile_recent())   # deltas a crashed worker never flushed
+
     # ✅ Start background closer loop (checks TP/SL hits)
     async def _closer_loop():
         while True:
             try:
-                close_signals_once()
+                await asyncio.to_thread(close_signals_once)
             except Exception as e:
                 print("[closer] error:", e)
             await asyncio.sleep(60)
@@ -71,6 +132,10 @@ async def lifespan(app):
 
     yield
 
+    await vote_counters.flush()
+    # ✅ Drain buffered chat logs / last_seen writes before the worker exits
+    await asyncio.to_thread(write_buffer.stop)
+
 class PushTokenBody(BaseModel):
     expo_push_token: str
 # Create FastAPI app *before* using it
@@ -84,6 +149,9 @@ app.include_router(auth_router)
 
 app.mount("/static", StaticFiles(directory="static"), name="static")
 
+# Shared GET cache (response_cache.ROUTE_TTLS); added first so it sits inside CORS
+app.add_middleware(ResponseCacheMiddleware, cache=response_cache)
+
 app.add_middleware(
     CORSMiddleware,
     allow_origins=["*"],
@@ -109,126 +177,205 @@ def root():
     return {"message": "Hypewave AI is live 🚀"}
 
 # chat pannel backend - GPT + Binance websocksets
+KNOWN_SYMBOLS = ["BTC", "ETH", "SOL", "XAU", "SPX", "NASDAQ"]
+
+def _idempotency_scope(route: str, request: Request, user_id: str) -> str:
+    # guests all share the "guest" id, so scope their keys by IP as well
+    return f"{route}:{user_id}" if user_id != "guest" else f"{route}:guest:{client_ip(request)}"
+
+def _chat_symbol(text: str) -> str:
+    text = text.upper()
+    for sym in KNOWN_SYMBOLS:
+        if f"${sym}" in text or sym in text:
+            return sym
+    return "BTC"
+
+async def _build_chat_messages(input: str, image: tuple[bytes, str] | None, user_id: str = "guest",
+                               conversation_id: str = DEFAULT_CONVERSATION) -> tuple[list[dict], dict]:
+    """Static prefix -> shared per-symbol block -> memory -> user turn (shared by /chat and /chat/stream)."""
+    symbol = _chat_symbol(input)
+    memory = await get_memory().load(user_id, conversation_id)
+
+    image_parts = None
+    if image:
+        # capped, sniffed, downscaled + recompressed off the event loop; detail picked per size
+        image_parts = [await images.chart_part_from(image)]
+
+    messages, prompt_stats = build_chat_messages(symbol, input, image_parts, history=get_memory().as_messages(memory))
+    # standalone = answer depends only on the question + market data -> answer_cache eligible
+    prompt_stats["standalone"] = image is None and not prompt_stats["history_tokens"]
+    return messages, prompt_stats
+
+
 @app.post("/chat")
 async def chat_router(
     request: Request,
+    response: Response,
     input: str = Form(...),
     image: UploadFile = File(None),
     bias: str = Form("neutral"),
     timeframe: str = Form("1H"),
-    entry_intent: str = Form("scalp")
+    entry_intent: str = Form("scalp"),
+    conversation_id: str = Form(DEFAULT_CONVERSATION),
+    user=Depends(get_optional_user)
 ):
+    user_id = user_id_of(user)
+    # (bytes, sha256): the hash keys both the chart dedupe and the idempotency fingerprint
+    chart = await read_image(image) if image else None
+
+    async def answer() -> dict:
+        messages, prompt_stats = await _build_chat_messages(input, chart, user_id, conversation_id)
+        symbol = prompt_stats["symbol"]
+        reply = {"conversation_id": conversation_id} if has_memory(user_id) else {}
+
+        # near-duplicate question at the same price -> no GPT call, no admission slot
+        if prompt_stats["standalone"]:
+            cached = answer_cache.lookup(symbol, input)
+            if cached is not None:
+                await adb.log_chat(user_id, {"input": input}, {"result": cached, "source": "chat.analysis", "cached": True})
+                await get_memory().append_exchange(user_id, conversation_id, input, cached)
+                return {"result": cached, "cached": True, **reply}
+
+        # 429 (rate limit / overload) is raised here, before any GPT work is done
+        ticket = await admission.acquire("chat", user_id, client_ip(request))
+        try:
+            started = time.perf_counter()
+            raw_output = (await llm_gateway.acomplete("chat", messages, max_tokens=1500)).strip()
+            if prompt_stats["standalone"]:
+                answer_cache.store(symbol, input, raw_output, latency=time.perf_counter() - started,
+                                   tokens=prompt_stats["prompt_tokens"] + count_tokens(raw_output))
+
+            await adb.log_chat(user_id, {"input": input}, {"result": raw_output, "source": "chat.analysis"})
+            await get_memory().append_exchange(user_id, conversation_id, input, raw_output)
+
+            return {"result": raw_output, **reply}
+        finally:
+            admission.release(ticket)
+
+    # client retries with the same Idempotency-Key share one GPT call / replay its answer
+    fp = fingerprint(input, conversation_id, chart[1] if chart else None)
     try:
-        # Determine if the user is authenticated
-        token_header = request.headers.get("authorization")
-        user_id = "guest"
-        if token_header:
-            token = token_header.replace("Bearer ", "")
-            payload = decode_access_token(token)
-            if payload:
-                user_id = payload.get("sub", "guest")
-
-        # Extract the symbol
-        KNOWN_SYMBOLS = ["BTC", "ETH", "SOL", "XAU", "SPX", "NASDAQ"]
-
-        def extract_symbol(text: str):
-            text = text.upper()
-            for sym in KNOWN_SYMBOLS:
-                if f"${sym}" in text or sym in text:
-                    return sym
-            return "BTC"
-
-        symbol = extract_symbol(input)
-
-        # Live OHLC
-        ohlc_list = get_latest_ohlc(f"{symbol}USDT", "1h") or []
-        price_data = ohlc_list[-1] if isinstance(ohlc_list, list) and ohlc_list else {}
-
-        price_summary = (
-            f"**Live Price Data for ${symbol}:**\n"
-            f"- Price: ${price_data.get('close', 'N/A')}\n"
-            f"- Open: {price_data.get('open', 'N/A')} | High: {price_data.get('high', 'N/A')} | Low: {price_data.get('low', 'N/A')}\n"
-            f"- Volume: {price_data.get('volume', 'N/A')}\n"
-        )
-
-        market_context = get_market_context(symbol)
-
-        system_prompt = f"""
-You are Hypewave AI, your friendly trading assistant.
-
-Goals:
-- Answer any trading or market-related question confidently.
-- Reference live market data.
-- Offer clear and actionable insights.
-- Format responses in markdown with clear sections.
-
-**Live Data Summary:**
-{price_summary}
-
-**Market Context:**
-{market_context}
-"""
-
-        messages = [{"role": "system", "content": system_prompt}]
-        user_content = {"type": "text", "text": input}
-
-        if image:
-            image_bytes = await image.read()
-            base64_image = base64.b64encode(image_bytes).decode("utf-8")
-            image_message = {
-                "type": "image_url",
-                "image_url": {
-                    "url": f"data:image/png;base64,{base64_image}",
-                    "detail": "high"
-                }
-            }
-            messages.append({"role": "user", "content": [user_content, image_message]})
-        else:
-            messages.append({"role": "user", "content": input})
-
-        response = client.chat.completions.create(
-            model="gpt-4o",
-            messages=messages,
-            max_tokens=1500
-        )
+        payload, replayed = await idempotency.run(_idempotency_scope("chat", request, user_id),
+                                                  request.headers.get(IDEMPOTENCY_HEADER), fp, answer)
+    except HTTPException:
+        raise
+    except Exception as e:
+        return {"result": f"⚠️ Error: {str(e)}"}
+    if replayed:
+        response.headers["Idempotent-Replayed"] = "true"
+    return payload
 
-        raw_output = response.choices[0].message.content.strip()
 
-        log_chat(user_id, {"input": input}, {"result": raw_output, "source": "chat.analysis"})
+def _sse(data: dict, event: str | None = None, event_id: str | None = None) -> str:
+    """Format one Server-Sent Events frame."""
+    lines = []
+    if event_id is not None:
+        lines.append(f"id: {event_id}")
+    if event:
+        lines.append(f"event: {event}")
+    lines.append(f"data: {json.dumps(data, default=str)}")
+    return "\n".join(lines) + "\n\n"
 
-        return {"result": raw_output}
 
+@app.post("/chat/stream")
+async def chat_stream(
+    request: Request,
+    input: str = Form(...),
+    image: UploadFile = File(None),
+    bias: str = Form("neutral"),
+    timeframe: str = Form("1H"),
+    entry_intent: str = Form("scalp"),
+    conversation_id: str = Form(DEFAULT_CONVERSATION),
+    user=Depends(get_optional_user)
+):
+    """
+    Same as /chat, but tokens are pushed as Server-Sent Events while gpt-4o generates:
+      event: token  data: {"token": "..."}      (many)
+      event: done   data: {"result": "<full text>"}
+      event: error  data: {"error": "..."}
+    The full answer is logged to chats once the stream finishes.
+    """
+    user_id = user_id_of(user)
+    messages, prompt_stats, build_error = None, None, None
+    try:
+        chart = await read_image(image) if image else None
+        messages, prompt_stats = await _build_chat_messages(input, chart, user_id, conversation_id)
     except Exception as e:
-        return {"result": f"⚠️ Error: {str(e)}"}
-    
-
+        build_error = str(e)
+
+    cached = None
+    if prompt_stats and prompt_stats["standalone"]:
+        cached = answer_cache.lookup(prompt_stats["symbol"], input)
+
+    ticket = None
+    if messages is not None and cached is None:
+        ticket = await admission.acquire("chat.stream", user_id, client_ip(request))
+
+    async def event_stream():
+        if messages is None:
+            yield _sse({"error": build_error}, event="error")
+            return
+        if cached is not None:
+            yield _sse({"token": cached}, event="token")
+            yield _sse({"result": cached, "cached": True}, event="done")
+            await adb.log_chat(user_id, {"input": input},
+                               {"result": cached, "source": "chat.analysis", "streamed": True, "cached": True})
+            await get_memory().append_exchange(user_id, conversation_id, input, cached)
+            return
+        parts = []
+        finished = False
+        started = time.perf_counter()
+        try:
+            async for delta in llm_gateway.astream("chat.stream", messages, max_tokens=1500):
+                parts.append(delta)
+                yield _sse({"token": delta}, event="token")
+            finished = True
+            if prompt_stats["standalone"]:
+                answer = "".join(parts).strip()
+                answer_cache.store(prompt_stats["symbol"], input, answer, latency=time.perf_counter() - started,
+                                   tokens=prompt_stats["prompt_tokens"] + count_tokens(answer))
+            yield _sse({"result": "".join(parts).strip()}, event="done")
+        except Exception as e:
+            yield _sse({"error": str(e)}, event="error")
+        finally:
+            # the slot is held until the last token has been sent
+            admission.release(ticket)
+            # log whatever was generated, even if the client hung up mid-stream
+            if parts:
+                await adb.log_chat(
+                    user_id, {"input": input},
+                    {"result": "".join(parts).strip(), "source": "chat.analysis", "streamed": True, "complete": finished},
+                )
+            if finished:
+                await get_memory().append_exchange(user_id, conversation_id, input, "".join(parts).strip())
+
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+        background=BackgroundTask(admission.release, ticket),  # in case the generator never starts
+    )
     
 @app.get("/chat/history")
-def get_chat_history(user=Depends(get_current_user)):
+async def get_chat_history(
+    response: Response,
+    user=Depends(get_current_user),
+    conversation_id: str = Query(None),
+    before: str = Query(None, description="id of the oldest turn already shown"),
+    limit: int = Query(20, ge=1, le=100),
+):
+    """
+    Turns oldest-to-newest, one entry per role. Page backwards by passing the
+    first item's id (or the X-Next-Before header) as `before`.
+    """
     user_id = user["user_id"]
+    if before and not ObjectId.is_valid(before):
+        return []
 
-    messages = list(
-        chats_coll
-        .find({"user_id": user_id})
-        .sort("created_at", -1)
-        .limit(20)
-    )
-    messages.reverse()
-
-    return [
-        {
-            "role": "user",
-            "text": m.get("input", {}).get("input", ""),
-            "timestamp": m.get("created_at").isoformat() if m.get("created_at") else None
-        }
-        if m.get("input")
-        else {
-            "role": "ai",
-            "text": m.get("output", {}).get("result", ""),
-            "timestamp": m.get("created_at").isoformat() if m.get("created_at") else None
-        }
-        for m in messages
-    ]
+    items, next_before = await get_memory().history(user_id, conversation_id, before, limit)
+    if next_before:
+        response.headers["X-Next-Before"] = next_before
+    return items
 
 
 """
@@ -247,89 +394,147 @@ async def chat_with_chart(
 async def generate_alerts(symbols: list[str] = Body(...)):
     all_alerts = {}
     for symbol in symbols:
-        alerts = generate_alerts_for_symbol(symbol.upper())
+        alerts = await asyncio.to_thread(generate_alerts_for_symbol, symbol.upper())
         if alerts:
             all_alerts[symbol] = alerts
     return {"generated_alerts": all_alerts}
 
 
 @app.get("/economic-calendar")
-def get_weekly_calendar(offset: int = 0):
+async def get_weekly_calendar(offset: int = 0):
     """
     offset = 0 => This Week
     offset = 1 => Next Week
     offset = -1 => Last Week
     """
-    from db import client as mongo_client
-    calendar_coll = mongo_client["hypewave"]["calendar_cache"]
-
     now = datetime.now(timezone.utc)
     monday = now - timedelta(days=now.weekday())
     target_week = (monday + timedelta(weeks=offset)).date().isoformat()
 
-    doc = calendar_coll.find_one({"week_of": target_week})
+    doc = await adb.feed_calendar_coll.find_one({"week_of": target_week}, sort=[("scraped_at", -1)])
     return {"calendar": doc["calendar"] if doc else []}
 
 
 @app.get("/news/latest")
-async def fetch_news(limit: int = 24):
+async def fetch_news(
+    response: Response,
+    limit: int = Query(24, ge=1, le=100),
+    before: str = Query(None, description="opaque cursor from the X-Next-Before header of the previous page"),
+):
+    """Telegram + Truth Social, newest first. First page is served from memory (news_feed.py)."""
     try:
-        return get_latest_news(limit=limit)
+        items, next_before = await news_feed.page(before, limit)
+    except HTTPException:
+        raise
     except Exception as e:
         return {"error": str(e)}
+    if next_before:
+        response.headers["X-Next-Before"] = next_before
+    return items
+
+
+# top-level fields a feed item can carry; ?fields= may also name sub-fields (output.trade, input.symbol)
+SIGNAL_FIELDS = ("user_id", "input", "output", "created_at", "feedback", "status", "outcome", "closed_reason")
+_FIELD_RE = re.compile(r"^(input|output)\.[A-Za-z0-9_]+$")
+
+
+def _signal_projection(fields: str | None) -> dict | None:
+    """?fields=a,b,output.trade -> Mongo projection (None = every field, the legacy shape)."""
+    if not fields:
+        return None
+    projection = {"created_at": 1}  # always needed for the cursor
+    for f in (f.strip() for f in fields.split(",")):
+        if not f or f == "signal_id":
+            continue
+        if f not in SIGNAL_FIELDS and not _FIELD_RE.match(f):
+            raise HTTPException(status_code=400, detail=f"Unknown field: {f}")
+        projection[f] = 1
+    # a parent and its sub-field can't both be projected; the parent wins
+    return {f: 1 for f in projection if f.split(".")[0] == f or f.split(".")[0] not in projection}
 
 
 @app.get("/signals/latest")
 async def get_latest_signals(
-    skip: int = Query(0, ge=0),
+    response: Response,
+    skip: int = Query(0, ge=0, description="legacy offset paging; ignored when `before` is set"),
     limit: int = Query(24, le=50),  # ⬅️ Default is now 24
-    min_confidence: int = Query(60, ge=0, le=100)
+    min_confidence: int = Query(60, ge=0, le=100),
+    before: str = Query(None, description="opaque cursor: `next_before` of the previous page"),
+    fields: str = Query(None, description="comma-separated sparse fieldset, e.g. output.trade,output.confidence,status"),
 ):
-    from db import client as mongo_client
-    signals_coll = mongo_client["hypewave"]["signals"]
-
-    # Fetch recent signals sorted by most recent
-    cursor = signals_coll.find(
-        {
-            "output.source": "AI Multi-Timeframe Engine",
-            "output.confidence": {"$gte": min_confidence}
-        }
-    ).sort("created_at", -1).skip(skip).limit(limit)
-
-    results = list(cursor)
-
-    # ✅ Include feedback counts + status/outcome/closed_reason
-    response = [
-        {
-            "signal_id": str(doc.get("_id")),
-            "user_id": doc.get("user_id"),
-            "input": doc.get("input"),
-            "output": doc.get("output"),
-            "created_at": doc.get("created_at"),
-            "feedback": doc.get("feedback", {"up": 0, "down": 0}),
-            "status": (doc.get("status") or "open"),
-            "outcome": doc.get("outcome"),
-            "closed_reason": doc.get("closed_reason"),
-        }
-        for doc in results
-    ]
-
-    return {"latest_signals": response}
+    """
+    Newest feed signals first. Page with `before=<next_before>` (keyset on
+    created_at,_id: same cost at any depth); `skip` still works for old clients.
+    The first page comes from signal_watcher's live view when it's up.
+    """
+    projection = _signal_projection(fields)
+
+    results = signal_watcher.latest(min_confidence, limit) if not before and not skip else None
+    if results is not None:
+        results = [project(doc, projection) for doc in results]
+    else:
+        query = {"output.source": FEED_SOURCE, "output.confidence": {"$gte": min_confidence}}
+        if before:
+            query.update(keyset_filter(before))
+        # served by the feed_latest_keyset index: no in-memory sort, confidence checked on index keys
+        cursor = adb.feed_signals_coll.find(query, projection).sort([("created_at", -1), ("_id", -1)])
+        if skip and not before:
+            cursor = cursor.skip(skip)
+        results = await cursor.limit(limit).to_list(length=limit)
+
+    wanted = None if projection is None else {f.split(".")[0] for f in projection}
+    out = []
+    for doc in results:
+        item = format_signal_doc(doc)
+        if wanted is not None:
+            item = {k: v for k, v in item.items() if k == "signal_id" or k in wanted}
+        out.append(item)
+
+    next_before = None
+    if len(results) == limit and results[-1].get("created_at"):
+        next_before = encode_cursor(results[-1]["created_at"], results[-1]["_id"])
+        response.headers["X-Next-Before"] = next_before
+
+    return {"latest_signals": out, "next_before": next_before}
+
+
+@app.get("/events/stream")
+async def event_stream(
+    request: Request,
+    types: str = Query(None, description="comma-separated subset of news,signal,alert (default: all)"),
+    last_event_id: str = Query(None, description="fallback for clients that can't send the Last-Event-ID header"),
+):
+    """
+    Server-Sent Events: pushes new news posts, signals and alerts as they land,
+    instead of polling /news/latest and /alerts/live. Reconnect with
+    Last-Event-ID to get what was missed; a `reset` event means refetch over REST.
+    """
+    wanted = None
+    if types:
+        wanted = {t.strip() for t in types.split(",") if t.strip()}
+        if not wanted <= set(EVENT_TYPES):
+            raise HTTPException(status_code=400, detail=f"types must be among {', '.join(EVENT_TYPES)}")
+    if not broker.has_capacity():
+        raise HTTPException(status_code=503, detail="Too many live connections", headers={"Retry-After": "5"})
+
+    resume_from = request.headers.get("last-event-id") or last_event_id
+    return StreamingResponse(
+        broker.stream(resume_from, wanted),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
 
 
 @app.get("/alerts/live")
 async def get_latest_alerts(limit: int = 5):
-    from db import client as mongo_client
-    alerts_coll = mongo_client["hypewave"]["alerts"]
-
     try:
-        cursor = alerts_coll.find().sort("created_at", -1).limit(limit)
+        cursor = adb.feed_alerts_coll.find().sort("created_at", -1).limit(limit)
         results = [
             {
                 "output": doc.get("output"),
                 "created_at": doc.get("created_at")
             }
-            for doc in cursor
+            async for doc in cursor
         ]
         return {"live_alerts": results}
     except Exception as e:
@@ -341,14 +546,10 @@ async def record_signal_feedback(
     feedback: str = Body(...)
 ):
     try:
-        from db import client as mongo_client
-        signals_coll = mongo_client["hypewave"]["signals"]
-
         if feedback not in ["up", "down"]:
             return {"error": "Invalid feedback"}
 
-        from db import log_feedback
-        log_feedback(signal_id, feedback)
+        await adb.log_feedback(signal_id, feedback)
         return {"status": "feedback recorded"}
 
     except Exception as e:
@@ -361,51 +562,25 @@ async def cast_vote(signal_id: str, vote: int = Body(..., embed=True), user=Depe
     Idempotent voting:
       - vote: 1 (up) or -1 (down)
       - one record per (signal_id, user_id)
-      - counters kept in signals.feedback.{up,down}
+      - counters kept in signals.feedback.{up,down} (written behind, see signal_votes.py)
     """
     if vote not in (1, -1):
         return {"error": "vote must be 1 or -1"}
 
     sid = ObjectId(signal_id)
-    from db import client as mongo_client
-    signals_coll = mongo_client["hypewave"]["signals"]
-    sig = signals_coll.find_one({"_id": sid})
-    if not sig:
+    fb = await current_feedback(adb.collection, sid)   # from the live view when it has the signal
+    if fb is None:
         return {"error": "Signal not found"}
 
-    user_id = user["user_id"]
-    existing = votes_coll.find_one({"signal_id": sid, "user_id": user_id})
-
-    if not existing:
-        # create new vote
-        votes_coll.insert_one({
-            "signal_id": sid,
-            "user_id": user_id,
-            "vote": vote,
-            "created_at": datetime.now(timezone.utc),
-            "updated_at": datetime.now(timezone.utc),
-        })
-        if vote == 1:
-            signals_coll.update_one({"_id": sid}, {"$inc": {"feedback.up": 1}})
-        else:
-            signals_coll.update_one({"_id": sid}, {"$inc": {"feedback.down": 1}})
-    else:
-        prev = existing["vote"]
-        if prev != vote:
-            # flip vote
-            if prev == 1 and vote == -1:
-                signals_coll.update_one({"_id": sid}, {"$inc": {"feedback.up": -1, "feedback.down": 1}})
-            elif prev == -1 and vote == 1:
-                signals_coll.update_one({"_id": sid}, {"$inc": {"feedback.down": -1, "feedback.up": 1}})
-            votes_coll.update_one({"_id": existing["_id"]}, {"$set": {"vote": vote, "updated_at": datetime.now(timezone.utc)}})
-        # else: same vote → no-op
-
-    latest = signals_coll.find_one({"_id": sid}, {"feedback": 1})
-    fb = latest.get("feedback", {"up": 0, "down": 0})
-    return {"ok": True, "feedback": fb}
+    # one atomic upsert; the previous vote gives the exact counter change, even for racing flips
+    prev = await record_vote(adb.votes_coll, sid, user["user_id"], vote)
+    delta = vote_delta(prev, vote)
+    vote_counters.add(sid, delta)   # flushed to signals.feedback within VOTE_FLUSH_SECONDS
+    return {"ok": True, "feedback": {k: fb[k] + delta.get(k, 0) for k in fb}}
 
 @app.post("/analyze-economic")
-async def analyze_economic(payload: dict = Body(...)):
+async def analyze_economic(request: Request, response: Response, payload: dict = Body(...),
+                           user=Depends(get_optional_user)):
     """
     Analyze a single economic calendar item and return a concise, tradable summary.
     Accepts either:
@@ -413,63 +588,119 @@ async def analyze_economic(payload: dict = Body(...)):
       - or fields: { title, date, time, period, forecast, previous, actual }
     Returns: { "analysis": str }
     """
-    # pull fields
-    title    = (payload.get("title") or "").strip()
-    date     = (payload.get("date") or "").strip()
-    time_    = (payload.get("time") or "").strip()
-    period   = (payload.get("period") or "").strip()
-    forecast = (payload.get("forecast") or "").strip()
-    previous = (payload.get("previous") or "").strip()
-    actual   = (payload.get("actual") or "").strip()
     user_prompt = payload.get("prompt")
 
-    # build a compact, instruction‑driven prompt when none provided
+    # precomputed by the calendar job (economic_analysis.py): O(1), no GPT call
+    fp = None
     if not user_prompt:
-        lines = [
-            "You are Hypewave AI. Analyze an economic data release for traders.",
-            "",
-            f"Release: {title or 'N/A'}",
-            f"Date: {date or 'N/A'}",
-            f"Time: {time_ or 'N/A'}",
-            f"Period: {period}" if period else None,
-            f"Forecast: {forecast}" if forecast else None,
-            f"Previous: {previous}" if previous else None,
-            f"Actual: {actual}" if actual else None,
-            "",
-            "Write a SHORT, crisp take (no long paragraphs). Use 1-3 bullets max:",
-            "• Why markets care (which assets most sensitive: rates, USD, equities, oil, gold).",
-            "• Over vs under forecast: likely immediate reactions.",
-            "• What details matter (core vs headline, revisions, subcomponents).",
-            "• (If helpful) 1‑line historical/seasonal context.",
-            "",
-            "Constraints:",
-            "- Keep it under ~120 words.",
-            "- No fluff, no generic disclaimers.",
-            "- Prefer concrete mappings (e.g., 'hotter CPI → ↑yields/↑USD/↓gold').",
-        ]
-        user_prompt = "\n".join([l for l in lines if l is not None])
-
-    # call your existing OpenAI client (same style as /chat)
-    try:
-        resp = client.chat.completions.create(
-            model="gpt-4o",
-            messages=[
-                {"role": "system", "content": "You are Hypewave AI: concise, market‑savvy, and specific."},
-                {"role": "user", "content": user_prompt},
-            ],
-            max_tokens=320,   # tight: we want short output
-            temperature=0.4,  # crisp + deterministic
-        )
-        text = (resp.choices[0].message.content or "").strip()
+        fp = event_fingerprint(payload)
+        precomputed = await analyses.get(fp)
+        if precomputed:
+            return {"analysis": precomputed, "precomputed": True}
+        # build a compact, instruction‑driven prompt when none provided
+        user_prompt = build_event_prompt(payload)
+
+    # through the LLM gateway (same as /chat), behind the same admission control
+    user_id = user_id_of(user)
+
+    async def analyze() -> dict:
+        ticket = await admission.acquire("economic", user_id, client_ip(request))
+        try:
+            text = await llm_gateway.acomplete(
+                "economic",
+                [
+                    {"role": "system", "content": "You are Hypewave AI: concise, market‑savvy, and specific."},
+                    {"role": "user", "content": user_prompt},
+                ],
+                max_tokens=320,   # tight: we want short output
+                temperature=0.4,  # crisp + deterministic
+            )
+        finally:
+            admission.release(ticket)
         # final safety clamp: if model returned something long, trim politely
-        if len(text.split()) > 140:
-            words = text.split()[:140]
-            text = " ".join(words) + " …"
+        text = clamp(text)
+        if fp and text:
+            await analyses.put(payload, fp, text)  # next caller gets it precomputed
         return {"analysis": text}
+
+    try:
+        result, replayed = await idempotency.run(_idempotency_scope("economic", request, user_id),
+                                                 request.headers.get(IDEMPOTENCY_HEADER),
+                                                 fingerprint(user_prompt), analyze)
+    except HTTPException:
+        raise
     except Exception as e:
         # bubble up a friendly error
         return {"analysis": None, "error": str(e)}
+    if replayed:
+        response.headers["Idempotent-Replayed"] = "true"
+    return result
     
+# (week_of, day) -> Task generating that day's missing analyses, shared by concurrent requests
+_day_batches = {}
+
+async def _generate_day(missing: dict, ticket) -> dict:
+    """Missing analyses of one day, ECON_BATCH_SIZE events per LLM call (a bigger batch truncates the JSON)."""
+    try:
+        items = list(missing.items())
+        chunks = [dict(items[i:i + ECON_BATCH_SIZE]) for i in range(0, len(items), ECON_BATCH_SIZE)]
+        results = await asyncio.gather(*(analyze_batch_async(list(c.values())) for c in chunks),
+                                       return_exceptions=True)
+        generated = {}
+        for chunk, res in zip(chunks, results):
+            if isinstance(res, BaseException):
+                print(f"[econ] day batch failed ({len(chunk)} events): {res}")
+                continue
+            for fp, text in res.items():
+                await analyses.put(chunk[fp], fp, text, source="batch")
+                generated[fp] = text
+        return generated
+    finally:
+        admission.release(ticket)
+
+@app.get("/analyze-economic/day")
+async def analyze_economic_day(request: Request, date: str = Query(..., description="day label as shown in the calendar"),
+                               offset: int = 0, user=Depends(get_optional_user)):
+    """
+    Every event of one calendar day with its analysis, in one request.
+    Precomputed ones come from memory; any stragglers are generated in batches of
+    ECON_BATCH_SIZE, once per day however many requests ask for it at the same time.
+    """
+    now = datetime.now(timezone.utc)
+    monday = now - timedelta(days=now.weekday())
+    target_week = (monday + timedelta(weeks=offset)).date().isoformat()
+    doc = await adb.feed_calendar_coll.find_one({"week_of": target_week}, sort=[("scraped_at", -1)])
+
+    day_events = [ev for ev in iter_calendar_events(doc["calendar"] if doc else [])
+                  if ev["date"].strip().lower() == date.strip().lower()]
+    fps = [event_fingerprint(ev) for ev in day_events]
+    found = await analyses.get_many(fps)
+
+    missing = {fp: ev for fp, ev in zip(fps, day_events) if fp not in found}
+    if missing:
+        key = (target_week, date.strip().lower())
+        task = _day_batches.get(key)
+        if task is None:
+            ticket = await admission.acquire("economic", user_id_of(user), client_ip(request))
+            task = _day_batches.get(key)   # another request may have started it while we waited
+            if task is not None:
+                admission.release(ticket)
+            else:
+                # a task, so the batch outlives a caller that disconnects; it releases the ticket
+                task = asyncio.create_task(_generate_day(missing, ticket))
+                _day_batches[key] = task
+                task.add_done_callback(lambda _t, k=key: _day_batches.pop(k, None))
+        try:
+            found.update(await asyncio.shield(task))
+        except Exception as e:
+            print(f"[econ] day batch failed: {e}")
+
+    return {
+        "date": date,
+        "week_of": target_week,
+        "events": [{**ev, "analysis": found.get(fp)} for fp, ev in zip(fps, day_events)],
+    }
+
 @app.post("/me/push-token")
 async def save_push_token(body: PushTokenBody, user=Depends(get_current_user)):
     """
@@ -477,11 +708,91 @@ async def save_push_token(body: PushTokenBody, user=Depends(get_current_user)):
     Call this from the app after registerForPushNotificationsAsync().
     """
     try:
-        set_user_push_token(user["user_id"], body.expo_push_token)
+        await adb.set_user_push_token(user["user_id"], body.expo_push_token)
         return {"ok": True}
     except Exception as e:
         return {"ok": False, "error": str(e)}
 
 @app.get("/signals/winrate")
-def get_global_winrate():
-    return get_winrate()
+async def get_global_winrate():
+    return await adb.get_winrate()
+
+@app.get("/metrics/mongo")
+def get_mongo_pool_metrics():
+    """Per-profile pool checkouts, wait-time percentiles and saturation for this worker."""
+    return pool_metrics()
+
+@app.get("/metrics/write-behind")
+def get_write_behind_metrics():
+    """Buffered write counters: enqueued vs coalesced/skipped vs actual DB ops."""
+    return write_buffer.stats()
+
+@app.get("/metrics/llm")
+def get_llm_metrics():
+    """Per-route LLM calls, retries, circuit state, p50/p95 latency, tokens and prompt-cache stats."""
+    return {**llm_gateway.llm_metrics(), "prompt": prompt_metrics()}
+
+@app.get("/metrics/answer-cache")
+def get_answer_cache_metrics():
+    """Near-duplicate chat cache: hit rate, invalidations, latency and tokens saved."""
+    return answer_cache.stats()
+
+@app.get("/metrics/news")
+def get_news_metrics():
+    """/news/latest head-cache hit rate, change-feed health, avatar table size."""
+    return news_feed.stats()
+
+@app.get("/metrics/events")
+def get_event_metrics():
+    """/events/stream connections, backlog depth, resumes, resets and slow-client drops."""
+    return broker.stats()
+
+@app.get("/metrics/signal-watcher")
+def get_signal_watcher_metrics():
+    """signals change stream: events applied, view hit rate, resumes and rebuilds."""
+    return signal_watcher.stats()
+
+@app.get("/metrics/votes")
+def get_vote_metrics():
+    """Vote counter write-behind: deltas taken, flushes, signal writes saved."""
+    return vote_counters.stats()
+
+@app.get("/metrics/auth")
+def get_auth_metrics():
+    """Auth fast path: token-claims and user-profile cache hit ratios, invalidations."""
+    return auth_cache.stats()
+
+@app.get("/metrics/jwks")
+def get_jwks_metrics():
+    """OAuth signing keys: age, refreshes, unknown-kid refetches, tokens verified/rejected."""
+    return jwks_cache.stats()
+
+@app.get("/metrics/passwords")
+def get_password_pool_metrics():
+    """bcrypt pool: busy / queued workers, queue wait, rehashes and shed sign-ins."""
+    return passwords.stats()
+
+@app.get("/metrics/response-cache")
+def get_response_cache_metrics():
+    """Public GET cache: per-route hit ratio, 304s, invalidations and bytes saved."""
+    return response_cache.stats()
+
+@app.get("/metrics/images")
+def get_image_metrics():
+    """Chart/avatar preprocessing: bytes and vision tokens before vs after, dedupe hits."""
+    return images.stats()
+
+@app.get("/metrics/idempotency")
+def get_idempotency_metrics():
+    """Idempotency-Key usage: computed vs replayed / joined in-flight, conflicts."""
+    return idempotency.stats()
+
+@app.get("/metrics/admission")
+def get_admission_metrics():
+    """Admitted / queued / shed counts and current queue depth for this worker."""
+    return admission.stats()
+
+@app.get("/metrics/market-context")
+def get_market_context_metrics():
+    """Stale / missing snapshot lookups, REST refills and the tracked symbols' ages."""
+    return market_context_stats()
@@ -0,0 +1,192 @@
+# auth_cache.py
+# Auth fast path: every authenticated request used to re-verify the JWT and read
+# the whole user document. Both are cached here:
+#
+#   claims    LRU of verified token -> claims. An entry never outlives the
+#             token's own `exp`, so an expired token is re-checked (and rejected).
+#   profiles  user_id -> the public profile routes see (email, username, avatar,
+#             login method, waiver) for USER_CACHE_TTL seconds. /me edits, avatar
+#             uploads, waiver, deletion and OAuth relinks call invalidate(); other
+#             workers converge within the TTL.
+#
+# get_optional_user is the one dependency for routes that serve guests too (None
+# when there's no valid token); get_current_user is the 401-ing variant.
+# last_seen still goes through write_buffer, which rate-limits it per user.
+
+import asyncio
+import os
+import time
+from collections import OrderedDict
+
+from fastapi import Depends, HTTPException
+from fastapi.security import HTTPAuthorizationCredentials, HTTPBearer
+
+from auth_utils import decode_access_token
+
+MAX_TOKENS = int(os.getenv("AUTH_CLAIMS_CACHE_SIZE", "10000"))
+USER_CACHE_TTL = float(os.getenv("AUTH_USER_CACHE_TTL", "30"))
+MAX_USERS = int(os.getenv("AUTH_USER_CACHE_SIZE", "10000"))
+PROFILE_FIELDS = {"email": 1, "username": 1, "avatar_url": 1, "login_method": 1, "waiver": 1}
+GUEST = "guest"
+
+
+def _profile(doc: dict) -> dict:
+    return {
+        "user_id": str(doc["_id"]),
+        "email": doc.get("email"),
+        "username": doc.get("username"),
+        "avatar_url": doc.get("avatar_url"),
+        "login_method": doc.get("login_method"),
+        "waiver": doc.get("waiver", {"signed": False}),
+    }
+
+
+class AuthCache:
+    def __init__(self, max_tokens: int = MAX_TOKENS, user_ttl: float = USER_CACHE_TTL,
+                 max_users: int = MAX_USERS, fetch_user=None):
+        self.max_tokens = max_tokens
+        self.user_ttl = user_ttl
+        self.max_users = max_users
+        self._fetch_user = fetch_user
+        self._claims = OrderedDict()     # token -> (claims, exp)
+        self._profiles = OrderedDict()   # user_id -> (profile | None, expires)
+        self._inflight = {}              # user_id -> Future: one DB read per user per miss
+        self._stats = {"claims_hits": 0, "claims_decodes": 0, "claims_rejected": 0,
+                       "user_hits": 0, "user_loads": 0, "user_coalesced": 0, "invalidations": 0}
+
+    # --- tokens ---
+
+    def claims(self, token: str):
+        """Verified claims for a token, or None if it's invalid / expired."""
+        now = time.time()
+        hit = self._claims.get(token)
+        if hit is not None:
+            claims, exp = hit
+            if exp > now:
+                self._claims.move_to_end(token)
+                self._stats["claims_hits"] += 1
+                return claims
+            del self._claims[token]
+        self._stats["claims_decodes"] += 1
+        claims = decode_access_token(token)
+        if not claims or "sub" not in claims:
+            self._stats["claims_rejected"] += 1
+            return None
+        exp = claims.get("exp")
+        if isinstance(exp, (int, float)):
+            self._claims[token] = (claims, exp)
+            while len(self._claims) > self.max_tokens:
+                self._claims.popitem(last=False)
+        return claims
+
+    # --- users ---
+
+    async def _load(self, user_id: str):
+        if self._fetch_user is not None:
+            doc = await self._fetch_user(user_id)
+        else:
+            from bson import ObjectId
+            from bson.errors import InvalidId
+            import db_async as adb
+            try:
+                doc = await adb.users_coll.find_one({"_id": ObjectId(user_id)}, PROFILE_FIELDS)
+            except InvalidId:
+                doc = None
+        return _profile(doc) if doc else None
+
+    async def user(self, user_id: str):
+        """Cached profile for user_id (None if the user doesn't exist)."""
+        hit = self._profiles.get(user_id)
+        if hit is not None and hit[1] > time.monotonic():
+            self._profiles.move_to_end(user_id)
+            self._stats["user_hits"] += 1
+            return hit[0]
+
+        fut = self._inflight.get(user_id)
+        if fut is not None:
+            self._stats["user_coalesced"] += 1
+            try:
+                return await asyncio.shield(fut)
+            except asyncio.CancelledError:
+                if not fut.cancelled() or asyncio.current_task().cancelling():
+                    raise   # this request was cancelled, not the load
+                # the leader's request went away mid-load: do our own
+                return await self.user(user_id)
+
+        fut = asyncio.get_running_loop().create_future()
+        self._inflight[user_id] = fut
+        self._stats["user_loads"] += 1
+        try:
+            profile = await self._load(user_id)
+            if self._inflight.get(user_id) is fut:   # not invalidated while loading
+                self._profiles[user_id] = (profile, time.monotonic() + self.user_ttl)
+                self._profiles.move_to_end(user_id)
+                while len(self._profiles) > self.max_users:
+                    self._profiles.popitem(last=False)
+            fut.set_result(profile)
+            return profile
+        except Exception as e:
+            fut.set_exception(e)
+            fut.exception()   # retrieved: followers re-raise it, no "never retrieved" warning
+            raise
+        except BaseException:
+            # cancelled (client disconnected): followers reload instead of inheriting it
+            fut.cancel()
+            raise
+        finally:
+            if self._inflight.get(user_id) is fut:
+                del self._inflight[user_id]
+
+    def invalidate(self, user_id: str):
+        """Drop a user's cached profile after it changed (or was deleted)."""
+        self._profiles.pop(str(user_id), None)
+        self._inflight.pop(str(user_id), None)   # a load already running won't be stored
+        self._stats["invalidations"] += 1
+
+    async def resolve(self, token: str):
+        """(profile, None) for a good token, (None, reason) otherwise."""
+        claims = self.claims(token)
+        if claims is None:
+            return None, "Invalid or expired token."
+        profile = await self.user(claims["sub"])
+        if profile is None:
+            return None, "User not found."
+        from db_async import update_user_last_seen
+        await update_user_last_seen(profile["user_id"])
+        return dict(profile), None
+
+    def stats(self) -> dict:
+        s = dict(self._stats)
+        s["tokens_cached"] = len(self._claims)
+        s["users_cached"] = len(self._profiles)
+        claims_total = s["claims_hits"] + s["claims_decodes"]
+        users_total = s["user_hits"] + s["user_loads"] + s["user_coalesced"]
+        s["claims_hit_ratio"] = round(s["claims_hits"] / claims_total, 3) if claims_total else None
+        s["user_hit_ratio"] = round((s["user_hits"] + s["user_coalesced"]) / users_total, 3) if users_total else None
+        return s
+
+
+# Process-wide cache used by the auth dependencies below
+auth_cache = AuthCache()
+
+_required = HTTPBearer()
+_optional = HTTPBearer(auto_error=False)
+
+
+async def get_current_user(credentials: HTTPAuthorizationCredentials = Depends(_required)):
+    user, reason = await auth_cache.resolve(credentials.credentials)
+    if user is None:
+        raise HTTPException(status_code=401, detail=reason)
+    return user
+
+
+async def get_optional_user(credentials: HTTPAuthorizationCredentials = Depends(_optional)):
+    """The caller's profile, or None for guests (no / bad token)."""
+    if credentials is None:
+        return None
+    user, _ = await auth_cache.resolve(credentials.credentials)
+    return user
+
+
+def user_id_of(user) -> str:
+    return user["user_id"] if user else GUEST
@@ -14,13 +14,29 @@ SECRET_KEY = os.getenv("SECRET_KEY")
 ALGORITHM = "HS256"
 ACCESS_TOKEN_EXPIRE_MINUTES = 60 * 24 * 7  # 1 week
 
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+# bcrypt cost; hashes made with any other cost are re-hashed on the next successful login
+BCRYPT_ROUNDS = int(os.getenv("BCRYPT_ROUNDS", "12"))
 
+pwd_context = CryptContext(
+    schemes=["bcrypt"], deprecated="auto",
+    bcrypt__default_rounds=BCRYPT_ROUNDS, bcrypt__min_rounds=BCRYPT_ROUNDS, bcrypt__max_rounds=BCRYPT_ROUNDS,
+)
+
+# CPU-bound: call these through password_pool, not on the event loop / shared threadpool
 def hash_password(password: str):
     return pwd_context.hash(password)
 
 def verify_password(plain_password: str, hashed_password: str):
-    return pwd_context.verify(plain_password, hashed_password)
+    return verify_and_update_password(plain_password, hashed_password)[0]
+
+def verify_and_update_password(plain_password: str, hashed_password: str):
+    """(matches, new hash or None): a new hash when the stored one uses an outdated cost."""
+    if not hashed_password:
+        return False, None  # passwordless (OAuth) account
+    try:
+        return pwd_context.verify_and_update(plain_password, hashed_password)
+    except ValueError:  # not a hash we know
+        return False, None
 
 def create_access_token(data: dict, expires_delta: timedelta = None):
     to_encode = data.copy()
@@ -0,0 +1,97 @@
+# bench_async_db.py
+# Concurrent-request throughput: sync pymongo inside `async def` (old) vs db_async (new).
+#
+# Needs a local mongod (never point this at Atlas):
+#   BENCH_MONGO_URI=mongodb://localhost:27017 python bench_async_db.py
+#
+# Both apps serve the same /signals/latest query from a seeded bench database,
+# driven in-process through httpx's ASGI transport so only the data layer differs.
+
+import asyncio
+import os
+import time
+from datetime import datetime, timedelta, timezone
+
+import httpx
+from fastapi import FastAPI, Query
+from pymongo import AsyncMongoClient, MongoClient
+
+BENCH_URI = os.getenv("BENCH_MONGO_URI", "mongodb://localhost:27017")
+BENCH_DB = "hypewave_bench"
+SEED_SIGNALS = int(os.getenv("BENCH_SEED", "5000"))
+CONCURRENCY = [1, 10, 50, 200]
+REQUESTS_PER_RUN = int(os.getenv("BENCH_REQUESTS", "1000"))
+
+QUERY = {"output.source": "AI Multi-Timeframe Engine", "output.confidence": {"$gte": 60}}
+
+
+def seed():
+    coll = MongoClient(BENCH_URI)[BENCH_DB]["signals"]
+    coll.drop()
+    now = datetime.now(timezone.utc)
+    coll.insert_many([
+        {
+            "user_id": "partner-ai",
+            "input": {"symbol": "BTC"},
+            "output": {"source": "AI Multi-Timeframe Engine", "confidence": 50 + (i % 50), "trade": "LONG"},
+            "created_at": now - timedelta(minutes=i),
+            "status": "open",
+        }
+        for i in range(SEED_SIGNALS)
+    ])
+
+
+def build_sync_app():
+    coll = MongoClient(BENCH_URI)[BENCH_DB]["signals"]
+    app = FastAPI()
+
+    @app.get("/signals/latest")
+    async def latest(limit: int = Query(24)):
+        docs = list(coll.find(QUERY).sort("created_at", -1).limit(limit))
+        return {"n": len(docs)}
+
+    return app
+
+
+def build_async_app():
+    coll = AsyncMongoClient(BENCH_URI)[BENCH_DB]["signals"]
+    app = FastAPI()
+
+    @app.get("/signals/latest")
+    async def latest(limit: int = Query(24)):
+        docs = await coll.find(QUERY).sort("created_at", -1).limit(limit).to_list(length=limit)
+        return {"n": len(docs)}
+
+    return app
+
+
+async def drive(app, concurrency: int) -> float:
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as http:
+        await http.get("/signals/latest")  # warm the pool
+        remaining = REQUESTS_PER_RUN
+
+        async def worker():
+            nonlocal remaining
+            while remaining > 0:
+                remaining -= 1
+                r = await http.get("/signals/latest")
+                r.raise_for_status()
+
+        start = time.perf_counter()
+        await asyncio.gather(*(worker() for _ in range(concurrency)))
+        return REQUESTS_PER_RUN / (time.perf_counter() - start)
+
+
+async def main():
+    print(f"[bench] seeding {SEED_SIGNALS} signals into {BENCH_URI}/{BENCH_DB}")
+    seed()
+    print(f"{'concurrency':>12} {'sync req/s':>12} {'async req/s':>12} {'speedup':>8}")
+    for c in CONCURRENCY:
+        before = await drive(build_sync_app(), c)
+        after = await drive(build_async_app(), c)
+        print(f"{c:>12} {before:>12.0f} {after:>12.0f} {after / before:>7.2f}x")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
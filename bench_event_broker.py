@@ -0,0 +1,111 @@
+# bench_event_broker.py
+# Fan-out load test for event_broker (the /events/stream SSE backend).
+#
+#   python bench_event_broker.py                    (10k connections)
+#   BENCH_CONNECTIONS=50000 BENCH_EVENTS=200 python bench_event_broker.py
+#
+# Runs BENCH_CONNECTIONS consumers of broker.stream() on one event loop (the
+# same generator StreamingResponse drives per connection, minus the socket
+# write), publishes BENCH_EVENTS events at BENCH_RATE/s and reports publish ->
+# delivered latency percentiles over every (event, connection) pair, memory per
+# connection, a Last-Event-ID resume, and what happens to clients that stop reading.
+
+import asyncio
+import os
+import time
+import tracemalloc
+
+import event_broker
+from event_broker import EventBroker
+
+N_CONNECTIONS = int(os.getenv("BENCH_CONNECTIONS", "10000"))
+N_EVENTS = int(os.getenv("BENCH_EVENTS", "100"))
+RATE = float(os.getenv("BENCH_RATE", "20"))          # events per second
+SLOW_CLIENTS = int(os.getenv("BENCH_SLOW", "100"))   # connections that never read
+
+
+def pct(values, p):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * p / 100))] * 1000 if values else float("nan")
+
+
+def ids_in(chunk: bytes) -> list:
+    # a chunk holds one or more b"id: <boot>-<seq>\nevent: ...\n\n" frames
+    return [int(line.split(b"-")[1]) for line in chunk.split(b"\n") if line.startswith(b"id: ")]
+
+
+async def consumer(broker, published_at, latencies, done):
+    got = 0
+    async for chunk in broker.stream():
+        now = time.perf_counter()
+        for seq in ids_in(chunk):
+            latencies.append(now - published_at[seq])
+            got += 1
+        if got == N_EVENTS:
+            break
+    done.append(got)
+
+
+async def main():
+    event_broker.HEARTBEAT_SECONDS = 3600
+    # queue cap below N_EVENTS so the not-reading clients actually hit it
+    broker = EventBroker(backlog_size=max(1000, N_EVENTS), queue_size=min(event_broker.CLIENT_QUEUE_SIZE, N_EVENTS // 2),
+                         max_connections=N_CONNECTIONS + SLOW_CLIENTS)
+    broker.bind_loop()
+    published_at, latencies, done = {}, [], []
+
+    tracemalloc.start()
+    base = tracemalloc.get_traced_memory()[0]
+    tasks = [asyncio.create_task(consumer(broker, published_at, latencies, done))
+             for i in range(N_CONNECTIONS)]
+    slow = [broker.stream() for _ in range(SLOW_CLIENTS)]
+    for gen in slow:
+        await gen.__anext__()   # connected (retry frame), then never read again
+    await asyncio.sleep(0.1)    # let every consumer subscribe
+    per_conn = (tracemalloc.get_traced_memory()[0] - base) / (N_CONNECTIONS + SLOW_CLIENTS)
+    tracemalloc.stop()   # its per-allocation overhead would dominate the latency numbers
+    print(f"{N_CONNECTIONS:,} connections (+{SLOW_CLIENTS} not reading), ~{per_conn / 1024:.1f} KiB each idle")
+
+    payload = {"text": "x" * 280, "source": "bench", "display_name": "Bench", "media": []}
+    fanout_ms = []
+    t0 = time.perf_counter()
+    for i in range(N_EVENTS):
+        seq = broker._last_seq + 1
+        published_at[seq] = time.perf_counter()
+        broker.publish("news", {**payload, "n": i})
+        fanout_ms.append((time.perf_counter() - published_at[seq]) * 1000)
+        await asyncio.sleep(1 / RATE)
+    await asyncio.wait_for(asyncio.gather(*tasks), timeout=60)
+    elapsed = time.perf_counter() - t0
+
+    delivered = len(latencies)
+    print(f"delivered {delivered:,}/{N_EVENTS * N_CONNECTIONS:,} frames in {elapsed:.1f}s "
+          f"({delivered / elapsed:,.0f} frames/s)")
+    print(f"publish() fan-out: p50 {pct([m / 1000 for m in fanout_ms], 50):.2f} ms  "
+          f"max {max(fanout_ms):.2f} ms")
+    print(f"delivery latency:  p50 {pct(latencies, 50):.1f} ms  p95 {pct(latencies, 95):.1f} ms  "
+          f"p99 {pct(latencies, 99):.1f} ms  max {max(latencies) * 1000:.1f} ms")
+
+    # slow readers: queue capped at CLIENT_QUEUE_SIZE, dropped once over it
+    queued = [len(sub.queue) for sub in broker._subs]
+    print(f"not-reading clients: max queued {max(queued, default=0)} frames "
+          f"(cap {broker.queue_size}), overflowed {sum(sub.overflowed for sub in broker._subs)}")
+    for gen in slow:
+        await gen.aclose()
+
+    # reconnect from the middle: replayed from the ring, no DB
+    resume_from = f"{event_broker._BOOT}-{N_EVENTS // 2}"
+    t1 = time.perf_counter()
+    gen = broker.stream(resume_from)
+    replayed = []
+    await gen.__anext__()   # retry:
+    while len(replayed) < N_EVENTS - N_EVENTS // 2:
+        replayed += ids_in(await gen.__anext__())
+    await gen.aclose()
+    print(f"resume from {resume_from}: {len(replayed)} missed events replayed in "
+          f"{(time.perf_counter() - t1) * 1000:.2f} ms")
+    print(broker.stats())
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,101 @@
+# bench_login_storm.py
+# Sync-endpoint latency during a login storm: bcrypt in the shared threadpool (old)
+# vs bcrypt in password_pool's own bounded workers (new).
+#
+#   python bench_login_storm.py
+#   BENCH_LOGINS=400 BCRYPT_ROUNDS=12 python bench_login_storm.py
+#
+# Each app has a login route (bcrypt verify only, no DB) and a plain `def` route
+# like /metrics/* or /signals/winrate, which FastAPI runs in the same threadpool
+# the old login used. BENCH_LOGINS logins arrive at once while the sync route is
+# probed every PROBE_INTERVAL; the probe latency is what every other user sees.
+
+import asyncio
+import os
+import time
+
+os.environ.setdefault("BCRYPT_ROUNDS", "10")   # same cost for stored hashes and checks: no rehash noise
+
+import httpx
+from fastapi import Body, FastAPI
+from starlette.concurrency import run_in_threadpool
+
+from auth_utils import hash_password, verify_password
+from password_pool import PasswordPool
+
+N_LOGINS = int(os.getenv("BENCH_LOGINS", "200"))
+PROBE_INTERVAL = float(os.getenv("BENCH_PROBE_INTERVAL", "0.02"))
+STORED = hash_password("correct horse")
+
+
+def pct(values, p):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * p / 100))] * 1000 if values else float("nan")
+
+
+def make_app(mode: str, pool: PasswordPool):
+    app = FastAPI()
+
+    @app.post("/login")
+    async def login(password: str = Body(..., embed=True)):
+        if mode == "old":
+            ok = await run_in_threadpool(verify_password, password, STORED)
+        else:
+            ok, _ = await pool.verify(password, STORED)
+        return {"ok": ok}
+
+    @app.get("/sync")
+    def sync_endpoint():
+        return {"ok": True}
+
+    return app
+
+
+async def probe_until(client, stop: asyncio.Event, latencies: list):
+    while not stop.is_set():
+        t0 = time.perf_counter()
+        r = await client.get("/sync")
+        assert r.status_code == 200
+        latencies.append(time.perf_counter() - t0)
+        await asyncio.sleep(PROBE_INTERVAL)
+
+
+async def run(mode: str):
+    # bench queue sized to the storm so every login is served; production sheds beyond HASH_MAX_QUEUE
+    pool = PasswordPool(max_queue=N_LOGINS, queue_timeout=600)
+    app = make_app(mode, pool)
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://bench",
+                                 timeout=600) as client:
+        idle = []
+        stop = asyncio.Event()
+        prober = asyncio.create_task(probe_until(client, stop, idle))
+        await asyncio.sleep(0.5)
+        stop.set()
+        await prober
+
+        storm = []
+        stop = asyncio.Event()
+        prober = asyncio.create_task(probe_until(client, stop, storm))
+        t0 = time.perf_counter()
+        logins = await asyncio.gather(*(client.post("/login", json={"password": "correct horse"})
+                                        for _ in range(N_LOGINS)))
+        elapsed = time.perf_counter() - t0
+        stop.set()
+        await prober
+
+    ok = sum(r.status_code == 200 and r.json()["ok"] for r in logins)
+    print(f"{mode:4}  {ok}/{N_LOGINS} logins in {elapsed:.1f}s ({ok / elapsed:.1f}/s)   "
+          f"sync endpoint idle p50 {pct(idle, 50):.1f} ms | during storm p50 {pct(storm, 50):.1f} ms  "
+          f"p99 {pct(storm, 99):.1f} ms  max {max(storm) * 1000:.1f} ms  ({len(storm)} probes)")
+    if mode == "new":
+        print(f"      pool: {pool.stats()}")
+
+
+async def main():
+    print(f"{N_LOGINS} concurrent logins, bcrypt rounds {os.environ['BCRYPT_ROUNDS']}, {os.cpu_count()} CPU(s)")
+    await run("old")
+    await run("new")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,84 @@
+# bench_prompt_build.py
+# Prompt assembly cost for /chat: the old layout (volatile data first, rebuilt on
+# every request) vs prompt_engine.build_chat_messages (static prefix + shared
+# per-symbol block + user turn). Offline: OHLC and market snapshots are synthetic.
+#
+#   python bench_prompt_build.py
+#   BENCH_REQUESTS=200000 BENCH_SYMBOLS=50 python bench_prompt_build.py
+
+import os
+import time
+
+import market_context
+import market_data_ws
+import prompt_engine
+
+N_REQUESTS = int(os.getenv("BENCH_REQUESTS", "50000"))
+N_SYMBOLS = int(os.getenv("BENCH_SYMBOLS", "6"))
+QUESTIONS = ["what's the trend?", "long or short here?", "key levels for today", "is this a fakeout?"]
+
+
+def seed(symbols):
+    market_context._service_started = True  # serve from snapshots, never hit Binance
+    for i, s in enumerate(symbols):
+        market_data_ws.ohlc_data[f"{s}USDT"]["1h"].append(
+            {"open": 100 + i, "high": 101 + i, "low": 99 + i, "close": 100.5 + i, "volume": 1234.5, "timestamp": 0})
+        market_context.snapshots[s] = {"price": 100.5 + i, "change": 1.2, "high": 101 + i, "low": 99 + i,
+                                       "volume": 1e9, "funding": 0.0001, "long_ratio": 0.55, "short_ratio": 0.45}
+
+
+def legacy_messages(symbol: str, user_text: str) -> list:
+    # pre-change layout: live data interpolated into the middle of the system prompt
+    block = prompt_engine.build_symbol_block(symbol)
+    system_prompt = CHAT_LEGACY.format(block=block)
+    return [{"role": "system", "content": system_prompt}, {"role": "user", "content": user_text}]
+
+
+CHAT_LEGACY = prompt_engine.CHAT_STATIC_PREFIX.split("\n\nThe next system message")[0] + "\n\n{block}\n"
+
+
+def common_prefix_chars(a: list, b: list) -> int:
+    sa = "".join(m["content"] for m in a)
+    sb = "".join(m["content"] for m in b)
+    n = 0
+    for x, y in zip(sa, sb):
+        if x != y:
+            break
+        n += 1
+    return n
+
+
+def main():
+    symbols = [f"SYM{i}" for i in range(N_SYMBOLS)]
+    seed(symbols)
+
+    t0 = time.perf_counter()
+    for i in range(N_REQUESTS):
+        legacy_messages(symbols[i % N_SYMBOLS], QUESTIONS[i % len(QUESTIONS)])
+    t_legacy = time.perf_counter() - t0
+
+    t0 = time.perf_counter()
+    for i in range(N_REQUESTS):
+        prompt_engine.build_chat_messages(symbols[i % N_SYMBOLS], QUESTIONS[i % len(QUESTIONS)])
+    t_new = time.perf_counter() - t0
+
+    # shared prefix between two different users asking about different symbols
+    a_old = legacy_messages(symbols[0], QUESTIONS[0])
+    b_old = legacy_messages(symbols[-1], QUESTIONS[1])
+    a_new, _ = prompt_engine.build_chat_messages(symbols[0], QUESTIONS[0])
+    b_new, _ = prompt_engine.build_chat_messages(symbols[-1], QUESTIONS[1])
+    c_new, _ = prompt_engine.build_chat_messages(symbols[0], QUESTIONS[2])
+
+    m = prompt_engine.prompt_metrics()
+    print(f"requests             {N_REQUESTS} over {N_SYMBOLS} symbols")
+    print(f"legacy build         {t_legacy:8.3f}s  ({t_legacy / N_REQUESTS * 1e6:6.1f} µs/request)")
+    print(f"stable-prefix build  {t_new:8.3f}s  ({t_new / N_REQUESTS * 1e6:6.1f} µs/request)")
+    print(f"symbol block         {m['block_rebuilds']} rebuilds, {m['block_hits']} shared hits")
+    print(f"shared prefix chars  legacy, different symbols: {common_prefix_chars(a_old, b_old)}")
+    print(f"                     new, different symbols:    {common_prefix_chars(a_new, b_new)}")
+    print(f"                     new, same symbol:          {common_prefix_chars(a_new, c_new)}")
+    print(f"stable fraction      {m['stable_fraction']}  (static prefix {m['static_prefix_tokens']} tokens)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,85 @@
+# bench_signal_pipeline.py
+# Offline benchmark of the full signal -> close -> winrate path on MemoryStorage.
+# No Mongo, no Binance, no OpenAI: candles are synthetic and the GPT evaluator is
+# replaced by a deterministic stand-in, so only our own code is measured.
+#
+#   python bench_signal_pipeline.py               (10k symbols)
+#   BENCH_SYMBOLS=100000 python bench_signal_pipeline.py
+
+import os
+import time
+
+os.environ["HYPEWAVE_STORAGE"] = "memory"
+os.environ["LLM_BACKEND"] = "stub"  # evaluator is monkeypatched anyway; never reach OpenAI
+
+import market_data_ws
+import signal_engine
+from cleanup_signals import close_signals_once
+from storage import MemoryStorage, set_storage
+from winrate_checker import get_winrate, update_winrate
+
+N_SYMBOLS = int(os.getenv("BENCH_SYMBOLS", "10000"))
+ENTRY = 100.0
+
+
+def fake_evaluate(symbol: str, candles_by_tf: dict) -> dict:
+    side = "LONG" if hash(symbol) % 2 else "SHORT"
+    return {
+        "trade": side,
+        "confidence": 70,
+        "timeframe": "1h",
+        "entry": ENTRY,
+        "sl": 95.0 if side == "LONG" else 105.0,
+        "tp": 106.0 if side == "LONG" else 94.0,
+        "next_check": 60,
+        "thesis": "bench",
+    }
+
+
+def candle(ts: int, high: float, low: float) -> dict:
+    return {"open": ENTRY, "high": high, "low": low, "close": ENTRY, "volume": 1.0, "timestamp": ts}
+
+
+def main():
+    set_storage(MemoryStorage())
+    signal_engine.evaluate_trade_opportunity = fake_evaluate
+
+    # history candles (before signals) are shared objects to keep memory flat
+    past_ms = int((time.time() - 3600) * 1000)
+    history = [candle(past_ms + i * 60_000, ENTRY + 0.5, ENTRY - 0.5) for i in range(12)]
+    symbols = [f"S{i}" for i in range(N_SYMBOLS)]
+    for s in symbols:
+        for tf in signal_engine.TIMEFRAMES:
+            market_data_ws.ohlc_data[f"{s}USDT"][tf].extend(history)
+
+    t0 = time.perf_counter()
+    for s in symbols:
+        signal_engine.generate_alerts_for_symbol(s)
+    t_signals = time.perf_counter() - t0
+
+    # price rips up: every LONG hits TP, every SHORT hits SL
+    future_ms = int((time.time() + 60) * 1000)
+    rip = candle(future_ms, 110.0, 99.0)
+    for s in symbols:
+        market_data_ws.ohlc_data[f"{s}USDT"]["5m"].append(rip)
+
+    t0 = time.perf_counter()
+    outcomes = close_signals_once()
+    t_close = time.perf_counter() - t0
+
+    t0 = time.perf_counter()
+    for outcome in outcomes:
+        update_winrate(outcome == "win")
+    t_winrate = time.perf_counter() - t0
+
+    stats = get_winrate()
+    print(f"symbols              {N_SYMBOLS}")
+    print(f"signals generated    {t_signals:8.3f}s  ({N_SYMBOLS / t_signals:,.0f}/s)")
+    print(f"close pass           {t_close:8.3f}s  ({len(outcomes)} closed, {len(outcomes) / t_close:,.0f}/s)")
+    print(f"winrate updates      {t_winrate:8.3f}s  ({len(outcomes) / max(t_winrate, 1e-9):,.0f}/s)")
+    print(f"winrate              {stats}")
+    assert len(outcomes) == N_SYMBOLS and stats["total_trades"] == N_SYMBOLS
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,106 @@
+# bench_signals_feed.py
+# /signals/latest paging cost vs depth: skip/limit (old) vs keyset `before` cursor (new).
+#
+# Needs a local mongod (never point this at Atlas):
+#   BENCH_MONGO_URI=mongodb://localhost:27017 python bench_signals_feed.py
+#   BENCH_SEED=100000 python bench_signals_feed.py      (default 1M signals)
+#
+# Seeds a bench database with feed + non-feed signals, creates the indexes
+# declared in db_indexes.py, then walks pages at increasing depth both ways and
+# reports latency and keys/docs examined per page (from explain).
+
+import os
+import time
+from datetime import datetime, timedelta, timezone
+
+from pymongo import MongoClient
+
+from cursors import encode_cursor, keyset_filter
+from db_indexes import INDEXES, _index_options
+
+BENCH_URI = os.getenv("BENCH_MONGO_URI", "mongodb://localhost:27017")
+BENCH_DB = "hypewave_bench"
+SEED_SIGNALS = int(os.getenv("BENCH_SEED", "1000000"))
+PAGE = 24
+DEPTHS = [0, 100, 1_000, 10_000, 30_000]   # page numbers
+REPEAT = 5
+SORT = [("created_at", -1), ("_id", -1)]
+QUERY = {"output.source": "AI Multi-Timeframe Engine", "output.confidence": {"$gte": 60}}
+LIST_FIELDS = {"created_at": 1, "status": 1, "output.trade": 1, "output.confidence": 1, "input.symbol": 1}
+
+
+def seed(coll):
+    coll.drop()
+    now = datetime.now(timezone.utc)
+    batch = []
+    for i in range(SEED_SIGNALS):
+        batch.append({
+            "user_id": "partner-ai" if i % 10 else "user-chat",
+            "input": {"symbol": ("BTC", "ETH", "SOL")[i % 3], "candles": [[1.0] * 6] * 20},
+            "output": {"source": "AI Multi-Timeframe Engine" if i % 10 else "chat",
+                       "confidence": 40 + (i % 60), "trade": "LONG" if i % 2 else "SHORT",
+                       "thesis": "x" * 400},
+            "created_at": now - timedelta(seconds=i // 2),   # pairs share a timestamp: ties on _id
+            "status": "open",
+        })
+        if len(batch) == 10_000:
+            coll.insert_many(batch, ordered=False)
+            batch.clear()
+    if batch:
+        coll.insert_many(batch, ordered=False)
+    for spec in INDEXES["signals"]:
+        coll.create_index(spec["keys"], **_index_options(spec))
+
+
+def _timed(fn):
+    best = None
+    for _ in range(REPEAT):
+        t0 = time.perf_counter()
+        out = fn()
+        dt = (time.perf_counter() - t0) * 1000
+        best = dt if best is None else min(best, dt)
+    return best, out
+
+
+def _examined(coll, flt, skip=0, projection=None):
+    cmd = {"find": coll.name, "filter": flt, "sort": dict(SORT), "limit": PAGE}
+    if skip:
+        cmd["skip"] = skip
+    if projection:
+        cmd["projection"] = projection
+    stats = coll.database.command("explain", cmd, verbosity="executionStats")["executionStats"]
+    return stats["totalKeysExamined"], stats["totalDocsExamined"]
+
+
+def main():
+    client = MongoClient(BENCH_URI)
+    coll = client[BENCH_DB]["signals"]
+    if coll.estimated_document_count() != SEED_SIGNALS:
+        t0 = time.perf_counter()
+        seed(coll)
+        print(f"seeded {SEED_SIGNALS:,} signals in {time.perf_counter() - t0:.1f}s")
+
+    # cursor for each depth = the last item of the page before it
+    cursors = {}
+    for depth in DEPTHS:
+        if depth:
+            last = coll.find(QUERY, {"created_at": 1}).sort(SORT).skip(depth * PAGE - 1).limit(1).next()
+            cursors[depth] = encode_cursor(last["created_at"], last["_id"])
+
+    print(f"\n{'page':>7} | {'skip ms':>8} {'keys':>9} {'docs':>9} | {'keyset ms':>9} {'keys':>5} {'docs':>5} | same page")
+    for depth in DEPTHS:
+        skip_ms, old = _timed(lambda: list(coll.find(QUERY).sort(SORT).skip(depth * PAGE).limit(PAGE)))
+        keyset_q = {**QUERY, **keyset_filter(cursors[depth])} if depth else QUERY
+        new_ms, new = _timed(lambda: list(coll.find(keyset_q, LIST_FIELDS).sort(SORT).limit(PAGE)))
+        ok, od = _examined(coll, QUERY, skip=depth * PAGE)
+        nk, nd = _examined(coll, keyset_q, projection=LIST_FIELDS)
+        same = [d["_id"] for d in old] == [d["_id"] for d in new]
+        print(f"{depth:>7} | {skip_ms:>8.1f} {ok:>9,} {od:>9,} | {new_ms:>9.1f} {nk:>5} {nd:>5} | {same}")
+
+    full = len(str(list(coll.find(QUERY).sort(SORT).limit(PAGE))))
+    sparse = len(str(list(coll.find(QUERY, LIST_FIELDS).sort(SORT).limit(PAGE))))
+    print(f"\npayload per page: full {full:,} chars vs fields= {sparse:,} chars")
+
+
+if __name__ == "__main__":
+    main()
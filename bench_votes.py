@@ -0,0 +1,111 @@
+# bench_votes.py
+# Contention benchmark for POST /signals/{id}/vote: read-then-write voting (old) vs
+# one atomic upsert + coalesced counters (signal_votes.py, new).
+#
+# Needs a local mongod (never point this at Atlas):
+#   BENCH_MONGO_URI=mongodb://localhost:27017 python bench_votes.py
+#
+# BENCH_USERS users hammer one hot signal, several tasks per user so the same
+# user's flips race each other. Afterwards the signal's feedback counters are
+# checked against the vote records they are supposed to summarize: the old
+# path drifts (lost / double-counted flips), the new one must not.
+
+import asyncio
+import os
+import random
+import time
+from datetime import datetime, timezone
+
+from pymongo import AsyncMongoClient, MongoClient
+
+from signal_votes import VoteCounters, record_vote, vote_delta
+
+BENCH_URI = os.getenv("BENCH_MONGO_URI", "mongodb://localhost:27017")
+BENCH_DB = "hypewave_bench"
+USERS = int(os.getenv("BENCH_USERS", "200"))
+TASKS_PER_USER = int(os.getenv("BENCH_TASKS_PER_USER", "3"))
+VOTES_PER_TASK = int(os.getenv("BENCH_VOTES_PER_TASK", "20"))
+
+
+def reset():
+    db = MongoClient(BENCH_URI)[BENCH_DB]
+    db["signals"].drop()
+    db["signal_votes"].drop()
+    db["signal_votes"].create_index([("signal_id", 1), ("user_id", 1)], unique=True)
+    return db["signals"].insert_one({"output": {"symbol": "BTC"}, "feedback": {"up": 0, "down": 0}}).inserted_id
+
+
+async def old_vote(signals, votes, sid, user_id, vote):
+    # the pre-signal_votes handler, verbatim in substance
+    if not await signals.find_one({"_id": sid}):
+        return
+    existing = await votes.find_one({"signal_id": sid, "user_id": user_id})
+    if not existing:
+        try:
+            await votes.insert_one({"signal_id": sid, "user_id": user_id, "vote": vote,
+                                    "created_at": datetime.now(timezone.utc)})
+        except Exception:
+            return  # lost the unique-index race: the old handler 500'd here
+        await signals.update_one({"_id": sid}, {"$inc": {"feedback.up" if vote == 1 else "feedback.down": 1}})
+    elif existing["vote"] != vote:
+        if existing["vote"] == 1:
+            await signals.update_one({"_id": sid}, {"$inc": {"feedback.up": -1, "feedback.down": 1}})
+        else:
+            await signals.update_one({"_id": sid}, {"$inc": {"feedback.down": -1, "feedback.up": 1}})
+        await votes.update_one({"_id": existing["_id"]}, {"$set": {"vote": vote}})
+    await signals.find_one({"_id": sid}, {"feedback": 1})
+
+
+async def run(name, vote_fn, after=None):
+    sid = reset()
+    client = AsyncMongoClient(BENCH_URI, maxPoolSize=100)
+    db = client[BENCH_DB]
+    rng = random.Random(7)
+    plan = [(f"user-{u}", [rng.choice((1, -1)) for _ in range(VOTES_PER_TASK)])
+            for u in range(USERS) for _ in range(TASKS_PER_USER)]
+
+    async def task(user_id, votes):
+        for v in votes:
+            await vote_fn(db, sid, user_id, v)
+
+    t0 = time.perf_counter()
+    await asyncio.gather(*(task(u, vs) for u, vs in plan))
+    if after:
+        await after(db)
+    elapsed = time.perf_counter() - t0
+
+    fb = (await db["signals"].find_one({"_id": sid}))["feedback"]
+    truth = {"up": 0, "down": 0}
+    async for v in db["signal_votes"].find({"signal_id": sid}):
+        truth["up" if v["vote"] == 1 else "down"] += 1
+    total = len(plan) * VOTES_PER_TASK
+    ok = fb == truth
+    print(f"{name:6} {total:,} votes in {elapsed:.2f}s ({total / elapsed:,.0f} votes/s)  "
+          f"counters {fb} vs records {truth}  {'OK' if ok else 'DRIFT'}")
+    await client.close()
+    return ok
+
+
+async def main():
+    print(f"{USERS} users x {TASKS_PER_USER} concurrent tasks x {VOTES_PER_TASK} votes on one signal")
+    await run("old", lambda db, sid, u, v: old_vote(db["signals"], db["signal_votes"], sid, u, v))
+
+    counters = VoteCounters(flush_seconds=0.05)
+
+    async def new_vote(db, sid, user_id, vote):
+        counters._coll = db["signals"]
+        prev = await record_vote(db["signal_votes"], sid, user_id, vote)
+        counters.add(sid, vote_delta(prev, vote))
+
+    async def flushing(db):
+        await counters.flush()
+
+    flusher = asyncio.create_task(counters.flush_forever())
+    ok = await run("new", new_vote, after=flushing)
+    flusher.cancel()
+    print(counters.stats())
+    assert ok, "counters drifted from vote records"
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,281 @@
+# chat_memory.py
+# Bounded multi-turn memory for /chat and /chat/stream.
+#
+# conversations  one doc per (user_id, conversation_id):
+#                  summary  rolling summary of everything older than `turns`
+#                  turns    the most recent turns [{role, text, tokens, created_at}]
+#                  version  bumped on every append (optimistic lock for compaction)
+# chat_turns     every turn, append-only, for /chat/history (keyset-paginated on _id)
+#                (history from before chat_turns existed is copied in from `chats`
+#                once, by migrate_legacy_chats() at startup)
+#
+# The prompt only ever gets summary + as many recent turns as fit MEMORY_TOKEN_BUDGET,
+# so follow-ups work without the prompt growing. Once the stored turns go over
+# budget, the oldest ones are folded into the summary by a background LLM call.
+# Guests share the "guest" user id, so they get no memory.
+
+import asyncio
+import os
+from datetime import datetime, timezone
+
+from bson import ObjectId
+from pymongo import ReturnDocument, UpdateOne
+
+import llm_gateway
+from prompt_engine import count_tokens
+from write_behind import write_buffer
+
+MEMORY_TOKEN_BUDGET = int(os.getenv("CHAT_MEMORY_TOKEN_BUDGET", "1500"))
+SUMMARY_MAX_TOKENS = int(os.getenv("CHAT_MEMORY_SUMMARY_TOKENS", "300"))
+MAX_RECENT_TURNS = int(os.getenv("CHAT_MEMORY_MAX_TURNS", "8"))
+MAX_STORED_TURNS = 40   # hard cap on the doc even if compaction keeps failing
+DEFAULT_CONVERSATION = "default"
+LEGACY_MIGRATION = "chats_to_chat_turns"
+
+SUMMARY_INSTRUCTIONS = (
+    "You maintain the running memory of a trading-assistant conversation. "
+    "Merge the previous summary with the new turns into one updated summary. "
+    "Keep symbols, levels, positions, timeframes and stated preferences; drop pleasantries. "
+    f"Plain text, at most {SUMMARY_MAX_TOKENS} tokens."
+)
+
+
+def has_memory(user_id: str) -> bool:
+    return bool(user_id) and user_id != "guest"
+
+
+def _fit_budget(summary: str, turns: list, budget: int = MEMORY_TOKEN_BUDGET,
+                max_turns: int = MAX_RECENT_TURNS) -> list:
+    """Newest turns that fit the budget after the summary (never splits a turn)."""
+    used = count_tokens(summary) if summary else 0
+    kept = []
+    for t in reversed(turns[-max_turns:]):
+        tokens = t.get("tokens") or count_tokens(t["text"])
+        if used + tokens > budget:
+            break
+        kept.append(t)
+        used += tokens
+    kept.reverse()
+    return kept
+
+
+def _legacy_turn_id(chat_id: ObjectId, role: int) -> ObjectId:
+    """
+    Deterministic chat_turns _id for one side (0 user, 1 ai) of a legacy `chats` doc:
+    same timestamp and process bytes, counter doubled so the user turn sorts just
+    before its answer and before the next exchange. Re-running the copy upserts
+    the same ids.
+    """
+    b = chat_id.binary
+    counter = int.from_bytes(b[9:12], "big")
+    return ObjectId(b[:8] + ((counter << 1) | role).to_bytes(4, "big"))
+
+
+def _fallback_summary(summary: str, overflow: list) -> str:
+    # used when the summarizer call fails: keep the tail, bounded
+    lines = [summary] if summary else []
+    lines += [f"{t['role']}: {t['text']}" for t in overflow]
+    text = "\n".join(lines)
+    return text[-SUMMARY_MAX_TOKENS * 4:]
+
+
+class ChatMemory:
+    def __init__(self, conversations=None, turns=None):
+        if conversations is None or turns is None:
+            import db_async as adb
+            conversations = conversations if conversations is not None else adb.db["conversations"]
+            turns = turns if turns is not None else adb.db["chat_turns"]
+        self.conversations = conversations
+        self.turns = turns
+        self._compacting = set()
+        self._tasks = set()  # strong refs to background compactions
+
+    async def load(self, user_id: str, conversation_id: str = DEFAULT_CONVERSATION) -> dict:
+        """{"summary": str, "turns": [...]} already trimmed to the token budget."""
+        if not has_memory(user_id):
+            return {"summary": "", "turns": []}
+        doc = await self.conversations.find_one(
+            {"user_id": user_id, "conversation_id": conversation_id},
+            projection={"summary": 1, "turns": 1},
+        )
+        if not doc:
+            return {"summary": "", "turns": []}
+        summary = doc.get("summary") or ""
+        return {"summary": summary, "turns": _fit_budget(summary, doc.get("turns", []))}
+
+    @staticmethod
+    def as_messages(memory: dict) -> list:
+        """Chat-completion messages for the memory (placed after the shared prompt prefix)."""
+        out = []
+        if memory.get("summary"):
+            out.append({"role": "system", "content": f"Conversation so far (summary):\n{memory['summary']}"})
+        for t in memory.get("turns", []):
+            out.append({"role": "user" if t["role"] == "user" else "assistant", "content": t["text"]})
+        return out
+
+    async def append_exchange(self, user_id: str, conversation_id: str, user_text: str, answer: str):
+        """Record one user/assistant exchange; schedules compaction if the window is over budget."""
+        if not has_memory(user_id):
+            return
+        now = datetime.now(timezone.utc)
+        new_turns = [
+            {"role": "user", "text": user_text, "tokens": count_tokens(user_text), "created_at": now},
+            {"role": "ai", "text": answer, "tokens": count_tokens(answer), "created_at": now},
+        ]
+        doc = await self.conversations.find_one_and_update(
+            {"user_id": user_id, "conversation_id": conversation_id},
+            {
+                "$push": {"turns": {"$each": new_turns, "$slice": -MAX_STORED_TURNS}},
+                "$inc": {"version": 1, "turn_count": 2},
+                "$set": {"updated_at": now},
+                "$setOnInsert": {"summary": "", "created_at": now},
+            },
+            upsert=True,
+            return_document=ReturnDocument.AFTER,
+        )
+
+        # full history is append-only and not on the answer path -> write-behind
+        for t in new_turns:
+            write_buffer.insert("chat_turns", {"_id": ObjectId(), "user_id": user_id,
+                                               "conversation_id": conversation_id,
+                                               "role": t["role"], "text": t["text"], "created_at": now})
+
+        if self._over_budget(doc):
+            task = asyncio.create_task(self.compact(doc))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+
+    @staticmethod
+    def _over_budget(doc: dict) -> bool:
+        turns = doc.get("turns", [])
+        if len(turns) > MAX_RECENT_TURNS:
+            return True
+        used = count_tokens(doc.get("summary") or "") + sum(t.get("tokens", 0) for t in turns)
+        return used > MEMORY_TOKEN_BUDGET
+
+    async def compact(self, doc: dict):
+        """Fold the turns that no longer fit into the rolling summary."""
+        key = doc["_id"]
+        if key in self._compacting:
+            return
+        self._compacting.add(key)
+        try:
+            summary = doc.get("summary") or ""
+            turns = doc.get("turns", [])
+            # keep only half the window so we don't re-summarize on every message
+            keep = _fit_budget(summary, turns, budget=MEMORY_TOKEN_BUDGET // 2, max_turns=MAX_RECENT_TURNS // 2)
+            if len(keep) % 2:
+                keep = keep[1:]  # fold whole user/ai pairs so the window starts on a user turn
+            overflow = turns[:len(turns) - len(keep)]
+            if not overflow:
+                return
+
+            transcript = "\n".join(f"{t['role']}: {t['text']}" for t in overflow)
+            try:
+                new_summary = await llm_gateway.acomplete(
+                    "chat.summary",
+                    [
+                        {"role": "system", "content": SUMMARY_INSTRUCTIONS},
+                        {"role": "user", "content": f"Previous summary:\n{summary or '(none)'}\n\nNew turns:\n{transcript}"},
+                    ],
+                    max_tokens=SUMMARY_MAX_TOKENS,
+                    temperature=0.2,
+                )
+                new_summary = new_summary.strip()
+            except Exception as e:
+                print(f"[chat-memory] summarizer failed, using fallback: {e}")
+                new_summary = _fallback_summary(summary, overflow)
+
+            # only applies if nothing was appended meanwhile; otherwise the next append retries
+            res = await self.conversations.update_one(
+                {"_id": key, "version": doc.get("version")},
+                {
+                    "$set": {"summary": new_summary, "summary_tokens": count_tokens(new_summary)},
+                    "$push": {"turns": {"$each": [], "$slice": -len(keep)}},  # -0 == 0 -> empty
+                    "$inc": {"version": 1, "summarized_turns": len(overflow)},
+                },
+            )
+            if res.modified_count:
+                print(f"🧠 [chat-memory] folded {len(overflow)} turns into summary for {doc.get('user_id')}")
+        except Exception as e:
+            print(f"[chat-memory] compaction error: {e}")
+        finally:
+            self._compacting.discard(key)
+
+    async def migrate_legacy_chats(self, chats, batch_size: int = 500) -> int:
+        """
+        One-off: copy /chat history logged to `chats` (one doc per exchange) into
+        chat_turns. Only exchanges older than the user's first chat_turns entry are
+        copied; `chats` is still written, so anything newer is already there.
+        Idempotent (deterministic ids); marked done in `migrations` once it completes.
+        """
+        migrations = self.turns.database["migrations"]
+        if await migrations.find_one({"_id": LEGACY_MIGRATION}):
+            return 0
+        started = datetime.now(timezone.utc)
+        first_turn = {}
+        cursor = await self.turns.aggregate([{"$group": {"_id": "$user_id", "first": {"$min": "$created_at"}}}])
+        async for row in cursor:
+            first_turn[row["_id"]] = row["first"]
+
+        copied, ops = 0, []
+        async for m in chats.find({"user_id": {"$nin": [None, "guest"]}, "created_at": {"$lt": started}}).sort("_id", 1):
+            first = first_turn.get(m["user_id"])
+            if first is not None and m.get("created_at") and m["created_at"] >= first:
+                continue
+            question = (m.get("input") or {}).get("input")
+            answer = (m.get("output") or {}).get("result")
+            for role, name, text in ((0, "user", question), (1, "ai", answer)):
+                if not isinstance(text, str) or not text:
+                    continue
+                ops.append(UpdateOne(
+                    {"_id": _legacy_turn_id(m["_id"], role)},
+                    {"$setOnInsert": {"user_id": m["user_id"], "conversation_id": DEFAULT_CONVERSATION,
+                                      "role": name, "text": text, "created_at": m.get("created_at")}},
+                    upsert=True,
+                ))
+            if len(ops) >= batch_size:
+                await self.turns.bulk_write(ops, ordered=False)
+                copied, ops = copied + len(ops), []
+        if ops:
+            await self.turns.bulk_write(ops, ordered=False)
+            copied += len(ops)
+        await migrations.update_one({"_id": LEGACY_MIGRATION},
+                                    {"$set": {"done_at": datetime.now(timezone.utc), "turns": copied}}, upsert=True)
+        print(f"🧠 [chat-memory] copied {copied} legacy chat turns into chat_turns")
+        return copied
+
+    async def history(self, user_id: str, conversation_id: str = None, before: str = None, limit: int = 20) -> tuple[list, str]:
+        """
+        Turns newest-first via keyset pagination on _id (no skip). Returns
+        (items in chronological order, cursor for the next older page or None).
+        """
+        flt = {"user_id": user_id}
+        if conversation_id:
+            flt["conversation_id"] = conversation_id
+        if before:
+            flt["_id"] = {"$lt": ObjectId(before)}
+        docs = await self.turns.find(flt).sort("_id", -1).limit(limit + 1).to_list(length=limit + 1)
+        next_before = str(docs[limit - 1]["_id"]) if len(docs) > limit else None
+        docs = docs[:limit]
+        docs.reverse()
+        return [
+            {
+                "id": str(d["_id"]),
+                "role": d["role"],
+                "text": d["text"],
+                "conversation_id": d.get("conversation_id"),
+                "timestamp": d["created_at"].isoformat() if d.get("created_at") else None,
+            }
+            for d in docs
+        ], next_before
+
+
+_memory = None
+
+
+def get_memory() -> ChatMemory:
+    global _memory
+    if _memory is None:
+        _memory = ChatMemory()
+    return _memory
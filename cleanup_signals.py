@@ -1,10 +1,7 @@
 # close_signals.py
 from datetime import datetime, timezone
-from bson import ObjectId
-from db import client as mongo_client
 from market_data_ws import get_latest_ohlc
-
-signals = mongo_client["hypewave"]["signals"]
+from storage import get_storage
 
 def _ts_ms(dt: datetime) -> int:
     if dt.tzinfo is None:
@@ -36,16 +33,14 @@ def close_signals_once():
     """
     Scan OPEN signals and close them if TP/SL was hit (uses 5m candles window).
     Note: limited by how many candles market_data_ws caches (~last few hours).
+    Returns the outcomes ("win" / "loss") of the signals closed by this pass.
     """
-    open_cursor = signals.find({
-        "$or": [{"status": "open"}, {"status": "OPEN"}],
-        "output.tp": {"$exists": True},
-        "output.sl": {"$exists": True},
-        "input.symbol": {"$exists": True},
-        "output.trade": {"$in": ["LONG", "SHORT"]}
-    })
+    storage = get_storage()
+    closed = []
 
-    for doc in open_cursor:
+    # storage.OPEN_SIGNAL_FILTER: legacy "OPEN" is normalized at API startup,
+    # so a plain equality hits the open_signals partial index
+    for doc in storage.open_signals():
         sym = doc.get("input", {}).get("symbol")
         side = doc.get("output", {}).get("trade")
         tp = doc.get("output", {}).get("tp")
@@ -83,14 +78,15 @@ def close_signals_once():
                 break
 
         if outcome:
-            signals.update_one(
-                {"_id": ObjectId(doc["_id"]), "$or": [{"status": "open"}, {"status": "OPEN"}]},
-                {"$set": {
-                    "status": "closed",
-                    "outcome": outcome,            # "win" | "loss"
-                    "closed_at": datetime.now(timezone.utc),
-                    "closed_reason": hit_reason,   # "tp" | "sl"
-                    "hit_price": hit_price,
-                    "hit_time": hit_time
-                }}
-            )
+            did_close = storage.close_signal(doc["_id"], {
+                "status": "closed",
+                "outcome": outcome,            # "win" | "loss"
+                "closed_at": datetime.now(timezone.utc),
+                "closed_reason": hit_reason,   # "tp" | "sl"
+                "hit_price": hit_price,
+                "hit_time": hit_time
+            })
+            if did_close:
+                closed.append(outcome)
+
+    return closed
@@ -0,0 +1,41 @@
+# cursors.py
+# Opaque keyset cursors for feeds sorted newest-first on (timestamp, _id).
+#
+# A cursor is the (timestamp, _id) of the last item a client has seen, packed as
+# url-safe base64 so clients treat it as a token, not something to build by hand.
+# keyset_filter() turns it into "strictly older than that item", which an index
+# on (..., timestamp -1, _id -1) answers with a bounded scan at any page depth.
+
+import base64
+from datetime import datetime, timezone
+
+from bson import ObjectId
+from fastapi import HTTPException
+
+
+def encode_cursor(ts: datetime, _id) -> str:
+    if ts.tzinfo is None:
+        ts = ts.replace(tzinfo=timezone.utc)   # pymongo hands back naive UTC
+    ms = int(ts.timestamp() * 1000)
+    return base64.urlsafe_b64encode(f"{ms}.{_id}".encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str) -> tuple[datetime, object]:
+    """-> (timestamp, _id). 400 on anything that isn't a cursor we issued."""
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)).decode()
+        ms, _id = raw.split(".", 1)
+        ts = datetime.fromtimestamp(int(ms) / 1000, tz=timezone.utc)
+    except Exception:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    return ts, ObjectId(_id) if ObjectId.is_valid(_id) else _id
+
+
+def keyset_filter(cursor: str, ts_field: str = "created_at") -> dict:
+    """Filter clause for items after `cursor` in (ts_field desc, _id desc) order."""
+    ts, _id = decode_cursor(cursor)
+    # the top-level $lte bounds the index scan; the $or only breaks ties on equal timestamps
+    return {
+        ts_field: {"$lte": ts},
+        "$or": [{ts_field: {"$lt": ts}}, {ts_field: ts, "_id": {"$lt": _id}}],
+    }
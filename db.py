@@ -1,27 +1,34 @@
-from pymongo.mongo_client import MongoClient
-from pymongo.server_api import ServerApi
 from datetime import datetime, timezone
-from bson import ObjectId
 from dotenv import load_dotenv
-import os
+
+from mongo_pool import get_client
+from storage import (
+    get_storage,
+    STORAGE_BACKEND,
+    WAIVER_VERSION,
+    LAST_SEEN_WRITE_INTERVAL,
+    NEWS_PUSH_TOKEN_FILTER,
+    _signal_upsert,
+    _alert_upsert,
+    _new_user_doc,
+)
 
 # Load .env
 load_dotenv()
 
-# Load URI from .env (or hardcode if debugging)
-uri = os.getenv("MONGO_DB_URI")
-client = MongoClient(uri, server_api=ServerApi('1'))
-
-# --- top of db.py (after load_dotenv) ---
-WAIVER_VERSION = os.getenv("WAIVER_VERSION", "2025-08-23")
+# Pooled client for this process's profile (MONGO_PROFILE, default "api") — see mongo_pool.py.
+# Built with connect=False: it only dials Mongo on first use, so HYPEWAVE_STORAGE=memory
+# (which never touches these collections) opens no sockets or monitor threads.
+client = get_client()
 
 
 # Optional ping to confirm connection
-try:
-    client.admin.command('ping')
-    print("MongoDB connected successfully.")
-except Exception as e:
-    print("MongoDB connection failed:", e)
+if STORAGE_BACKEND == "mongo":
+    try:
+        client.admin.command('ping')
+        print("MongoDB connected successfully.")
+    except Exception as e:
+        print("MongoDB connection failed:", e)
 
 # Collections
 db = client["hypewave"]
@@ -32,62 +39,19 @@ trades_review = db["trades_review"]
 users_coll = db["users"]
 votes_coll = db["signal_votes"]
 
-# Logging functions
+# Logging functions — all routed through the storage backend (storage.py)
 def log_signal(user_id: str, input_data: dict, output_data: dict, extra_meta: dict = None):
-    entry = {
-        "user_id": user_id,
-        "input": input_data,
-        "output": output_data,
-        "created_at": datetime.now(timezone.utc)
-    }
-
-    if extra_meta:
-        entry.update(extra_meta)
-
-    unique_filter = {
-        "user_id": user_id,
-        "input.symbol": input_data.get("symbol"),
-        "output.result": output_data.get("result"),
-        "output.timeframe": output_data.get("timeframe"),
-        "output.source": output_data.get("source")
-    }
-
-    # db.py -> log_signal
-    collection.update_one(
-        unique_filter,
-        {
-            "$set": {k: v for k, v in entry.items() if k != "created_at"},
-            "$setOnInsert": {"created_at": entry["created_at"]},
-        },
-        upsert=True,
-    )
-
-
+    get_storage().log_signal(user_id, input_data, output_data, extra_meta)
 
 
 def log_alert(user_id: str, input_data: dict, output_data: dict):
-    entry = {
-        "user_id": user_id,
-        "input": input_data,
-        "output": output_data,
-        "created_at": datetime.now(timezone.utc)
-    }
-
-    unique_filter = {
-        "user_id": user_id,
-        "input.symbol": input_data.get("symbol"),
-        "output.result": output_data.get("result"),
-        "output.timeframe": output_data.get("timeframe"),
-        "output.source": output_data.get("source")
-    }
-
-    alerts_coll.update_one(unique_filter, {"$setOnInsert": entry}, upsert=True)
+    get_storage().log_alert(user_id, input_data, output_data)
 
 
 def log_chat(user_id: str, input_data: dict, output_data: dict):
     """
     Logs plain chat interactions into their own collection.
-    No deduplication filter—every chat is unique.
+    No deduplication filter—every chat is unique. Buffered (write_behind) on Mongo.
     """
     entry = {
         "user_id": user_id,
@@ -95,15 +59,18 @@ def log_chat(user_id: str, input_data: dict, output_data: dict):
         "output": output_data,
         "created_at": datetime.now(timezone.utc)
     }
-    chats_coll.insert_one(entry)
+    get_storage().log_chat(entry)
 
 
 def get_latest_news(limit=24):
-    telegram_coll = client["hypewave"]["telegram_news"]
-    truth_coll = client["hypewave"]["truthsocial_news"]
+    storage = get_storage()
+    t_docs = storage.recent_news("telegram_news", limit)
+    tr_docs = storage.recent_news("truthsocial_news", limit)
+    return merge_news_docs(t_docs, tr_docs, limit)
 
-    t_docs = list(telegram_coll.find().sort("date", -1).limit(limit))
-    tr_docs = list(truth_coll.find().sort("date", -1).limit(limit))
+
+def merge_news_docs(t_docs: list, tr_docs: list, limit: int = 24):
+    """Merge raw telegram/truth docs into the /news/latest payload (shared with db_async)."""
     combined = t_docs + tr_docs
     combined.sort(key=lambda x: x.get("date") or datetime.min, reverse=True)
 
@@ -115,87 +82,69 @@ def get_latest_news(limit=24):
         if s and av and s not in latest_avatar:
             latest_avatar[s] = av
 
-    out = []
-    for doc in combined[:limit]:
-        s = doc.get("source")
-        avatar = doc.get("avatar_url") or (latest_avatar.get(s) if s else None)
-        out.append({
-            "text": doc.get("text"),
-            "link": doc.get("link"),
-            "timestamp": doc.get("date").isoformat() if doc.get("date") else None,
-            "source": s,
-            "display_name": doc.get("display_name"),
-            "media_url": doc.get("media_url"),
-            "media": doc.get("media", []),
-            "avatar_url": avatar,      # ⬅️ always try to fill this
-            "album_id": doc.get("album_id"),
-        })
-    return out
+    return [format_news_doc(doc, latest_avatar.get(doc.get("source"))) for doc in combined[:limit]]
+
+
+def format_signal_doc(doc: dict) -> dict:
+    """One raw signal doc -> /signals/latest item (also pushed by event_broker.py)."""
+    # ✅ Include feedback counts + status/outcome/closed_reason
+    return {
+        "signal_id": str(doc.get("_id")),
+        "user_id": doc.get("user_id"),
+        "input": doc.get("input"),
+        "output": doc.get("output"),
+        "created_at": doc.get("created_at"),
+        "feedback": doc.get("feedback", {"up": 0, "down": 0}),
+        "status": (doc.get("status") or "open"),
+        "outcome": doc.get("outcome"),
+        "closed_reason": doc.get("closed_reason"),
+    }
+
+
+def format_news_doc(doc: dict, fallback_avatar: str = None) -> dict:
+    """One raw news doc -> /news/latest item (also used by news_feed.py)."""
+    return {
+        "text": doc.get("text"),
+        "link": doc.get("link"),
+        "timestamp": doc.get("date").isoformat() if doc.get("date") else None,
+        "source": doc.get("source"),
+        "display_name": doc.get("display_name"),
+        "media_url": doc.get("media_url"),
+        "media": doc.get("media", []),
+        "avatar_url": doc.get("avatar_url") or fallback_avatar,      # ⬅️ always try to fill this
+        "album_id": doc.get("album_id"),
+    }
 
 
 def log_feedback(signal_id: str, feedback: str):
-    from bson import ObjectId
     try:
-        collection.update_one(
-            {"_id": ObjectId(signal_id)},
-            {"$push": {"feedback": feedback}}
-        )
+        get_storage().inc_feedback(signal_id, feedback)
     except Exception as e:
         print(f"[❌ Feedback Logging Error] {e}")
 
 def get_user_by_email(email: str):
-    return users_coll.find_one({"email": email})
+    return get_storage().get_user_by_email(email)
 
 def create_user_in_db(email: str, password_hash: str, extra: dict = {}):
-    user = {
-        "email": email,
-        "password_hash": password_hash,
-        "created_at": datetime.now(timezone.utc),
-        "preferences": {},
-        "sessions": [],
-        "login_method": extra.get("login_method", "email"),
-        "username": extra.get("username", email.split("@")[0]),
-        "avatar_url": extra.get("avatar_url", ""),
-        "waiver": {"signed": False, "version": WAIVER_VERSION, "at": None},
-    }
-    result = users_coll.insert_one(user)
-    return str(result.inserted_id)
+    return get_storage().create_user(_new_user_doc(email, password_hash, extra))
 
 def get_user_by_id(user_id: str):
-    from bson import ObjectId
-    return users_coll.find_one({"_id": ObjectId(user_id)})
+    return get_storage().get_user_by_id(user_id)
 
 def update_user_last_seen(user_id: str):
-    users_coll.update_one(
-        {"_id": ObjectId(user_id)},
-        {"$set": {"last_seen": datetime.now(timezone.utc)}}
-    )
+    get_storage().update_user_last_seen(user_id)
 
 # --- Push notification helpers ---
 
 def set_user_push_token(user_id: str, expo_push_token: str):
     """Save/replace a user's Expo push token."""
-    users_coll.update_one(
-        {"_id": ObjectId(user_id)},
-        {"$set": {"expo_push_token": expo_push_token}},
-        upsert=False
-    )
+    get_storage().set_user_fields(user_id, {"expo_push_token": expo_push_token})
 
 def get_all_news_push_tokens():
     """
     Return a list of Expo push tokens for users who want news pushes.
     If 'notification_prefs.news' is missing, default to True (opt-in by default).
     """
-    cursor = users_coll.find(
-        {
-            "expo_push_token": {"$exists": True, "$ne": None, "$type": "string"},
-            "$or": [
-                {"notification_prefs.news": True},
-                {"notification_prefs.news": {"$exists": False}}
-            ]
-        },
-        {"expo_push_token": 1}
-    )
-    tokens = [doc["expo_push_token"] for doc in cursor if doc.get("expo_push_token")]
+    tokens = get_storage().news_push_tokens()
     # De-dup tokens just in case the same token is stored multiple times
     return list(dict.fromkeys(tokens))
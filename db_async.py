@@ -0,0 +1,125 @@
+# db_async.py
+# Async twin of db.py for the FastAPI app. Same helpers, but every call is
+# awaited on the event loop instead of blocking it (PyMongo's native async API).
+
+from datetime import datetime, timezone
+from bson import ObjectId
+from dotenv import load_dotenv
+
+from mongo_pool import get_async_client
+from write_behind import write_buffer
+from db import (
+    LAST_SEEN_WRITE_INTERVAL,
+    NEWS_PUSH_TOKEN_FILTER,
+    _signal_upsert,
+    _alert_upsert,
+    _new_user_doc,
+)
+
+load_dotenv()
+
+client = get_async_client("api")
+# Public feeds tolerate slightly stale reads -> secondaryPreferred pool
+feed_db = get_async_client("feed")["hypewave"]
+
+# Collections
+db = client["hypewave"]
+collection = db["signals"]
+alerts_coll = db["alerts"]
+chats_coll = db["chats"]
+users_coll = db["users"]
+votes_coll = db["signal_votes"]
+calendar_coll = db["calendar_cache"]
+stats_coll = db["stats"]
+telegram_coll = feed_db["telegram_news"]
+truth_coll = feed_db["truthsocial_news"]
+feed_signals_coll = feed_db["signals"]
+feed_alerts_coll = feed_db["alerts"]
+feed_calendar_coll = feed_db["calendar_cache"]
+
+
+async def ping():
+    """Confirm the async client can reach the cluster (called from the API lifespan)."""
+    try:
+        await client.admin.command('ping')
+        print("MongoDB (async) connected successfully.")
+    except Exception as e:
+        print("MongoDB (async) connection failed:", e)
+
+
+# Logging functions
+async def log_signal(user_id: str, input_data: dict, output_data: dict, extra_meta: dict = None):
+    unique_filter, update = _signal_upsert(user_id, input_data, output_data, extra_meta)
+    await collection.update_one(unique_filter, update, upsert=True)
+
+
+async def log_alert(user_id: str, input_data: dict, output_data: dict):
+    unique_filter, update = _alert_upsert(user_id, input_data, output_data)
+    await alerts_coll.update_one(unique_filter, update, upsert=True)
+
+
+async def log_chat(user_id: str, input_data: dict, output_data: dict):
+    # fire-and-forget: the write-behind thread batches chat inserts off the request path
+    entry = {
+        "user_id": user_id,
+        "input": input_data,
+        "output": output_data,
+        "created_at": datetime.now(timezone.utc)
+    }
+    write_buffer.insert("chats", entry)
+
+
+async def log_feedback(signal_id: str, feedback: str):
+    # feedback is the {up, down} counter object: count it, through the vote counter write-behind
+    from signal_votes import vote_counters
+    try:
+        vote_counters.add(ObjectId(signal_id), {feedback: 1}, anon=True)
+    except Exception as e:
+        print(f"[❌ Feedback Logging Error] {e}")
+
+
+async def get_winrate():
+    doc = await stats_coll.find_one({"_id": "winrate"})
+    if not doc:
+        return {"total_trades": 0, "wins": 0, "winrate": 0.0}
+    return {
+        "total_trades": doc.get("total_trades", 0),
+        "wins": doc.get("wins", 0),
+        "winrate": doc.get("winrate", 0.0)
+    }
+
+
+# --- Users ---
+
+async def get_user_by_email(email: str):
+    return await users_coll.find_one({"email": email})
+
+async def create_user_in_db(email: str, password_hash: str, extra: dict = {}):
+    result = await users_coll.insert_one(_new_user_doc(email, password_hash, extra))
+    return str(result.inserted_id)
+
+async def get_user_by_id(user_id: str):
+    return await users_coll.find_one({"_id": ObjectId(user_id)})
+
+async def update_user_last_seen(user_id: str):
+    write_buffer.update(
+        "users", user_id,
+        {"_id": ObjectId(user_id)},
+        {"$set": {"last_seen": datetime.now(timezone.utc)}},
+        min_interval=LAST_SEEN_WRITE_INTERVAL,
+    )
+
+# --- Push notification helpers ---
+
+async def set_user_push_token(user_id: str, expo_push_token: str):
+    """Save/replace a user's Expo push token."""
+    await users_coll.update_one(
+        {"_id": ObjectId(user_id)},
+        {"$set": {"expo_push_token": expo_push_token}},
+        upsert=False
+    )
+
+async def get_all_news_push_tokens():
+    cursor = users_coll.find(NEWS_PUSH_TOKEN_FILTER, {"expo_push_token": 1})
+    tokens = [doc["expo_push_token"] async for doc in cursor if doc.get("expo_push_token")]
+    return list(dict.fromkeys(tokens))
@@ -0,0 +1,312 @@
+# db_indexes.py
+# Single source of truth for every MongoDB index Hypewave relies on.
+#
+#   python db_indexes.py            -> reconcile (create missing / rebuild changed)
+#   python db_indexes.py --dry-run  -> show what reconcile would do
+#   python db_indexes.py --audit    -> explain every hot query shape, flag COLLSCANs
+#   python db_indexes.py --profile  -> also scan system.profile for slow COLLSCANs
+#
+# The API lifespan calls ensure_indexes() on boot, so a deploy is enough to
+# roll out a new index. Reconcile never drops undeclared indexes unless --prune.
+
+import sys
+from datetime import datetime, timedelta, timezone
+
+from bson import ObjectId
+from pymongo import ASCENDING, DESCENDING
+from pymongo.errors import OperationFailure
+
+DB_NAME = "hypewave"
+
+# Declared indexes per collection. Each spec: keys + optional name/unique/sparse/partial/ttl.
+INDEXES = {
+    "signals": [
+        # /signals/latest: equality on source, keyset sort on (created_at, _id), range on confidence (ESR).
+        # Partial on the feed source: chat/partner signals never enter it.
+        # (Replaces feed_source_created_conf; drop that one with --prune.)
+        {"name": "feed_latest_keyset",
+         "keys": [("output.source", ASCENDING), ("created_at", DESCENDING), ("_id", DESCENDING),
+                  ("output.confidence", ASCENDING)],
+         "partial": {"output.source": "AI Multi-Timeframe Engine"}},
+        # closer loop only ever looks at open signals -> keep the index tiny
+        {"name": "open_signals",
+         "keys": [("input.symbol", ASCENDING), ("created_at", ASCENDING)],
+         "partial": {"status": "open"}},
+        # signal_engine duplicate check: latest signal per (symbol, side)
+        {"name": "symbol_trade_created",
+         "keys": [("input.symbol", ASCENDING), ("output.trade", ASCENDING), ("created_at", DESCENDING)]},
+        # log_signal upsert filter
+        {"name": "signal_upsert_key",
+         "keys": [("input.symbol", ASCENDING), ("output.result", ASCENDING), ("user_id", ASCENDING)]},
+    ],
+    "alerts": [
+        {"name": "created_desc", "keys": [("created_at", DESCENDING)]},
+        {"name": "alert_upsert_key",
+         "keys": [("input.symbol", ASCENDING), ("output.result", ASCENDING), ("user_id", ASCENDING)]},
+    ],
+    "chats": [
+        {"name": "user_created", "keys": [("user_id", ASCENDING), ("created_at", DESCENDING)]},
+    ],
+    "telegram_news": [
+        # news_feed.py: keyset pages on (date, _id) per source
+        {"name": "date_id_desc", "keys": [("date", DESCENDING), ("_id", DESCENDING)]},
+        {"name": "source_msg", "keys": [("source", ASCENDING), ("id", ASCENDING)]},
+        {"name": "source_album", "keys": [("source", ASCENDING), ("album_id", ASCENDING)]},
+    ],
+    "truthsocial_news": [
+        # news_feed.py: keyset pages on (date, _id) per source
+        {"name": "date_id_desc", "keys": [("date", DESCENDING), ("_id", DESCENDING)]},
+    ],
+    "truth_social": [
+        {"name": "post_id", "keys": [("id", ASCENDING)]},
+    ],
+    "signal_control": [
+        {"name": "symbol_unique", "keys": [("symbol", ASCENDING)], "unique": True},
+    ],
+    "calendar_cache": [
+        {"name": "week_scraped", "keys": [("week_of", ASCENDING), ("scraped_at", DESCENDING)]},
+    ],
+    "economic_analyses": [
+        # AnalysisStore.warm(): recent analyses into memory (lookups themselves are by _id)
+        {"name": "created_desc", "keys": [("created_at", DESCENDING)]},
+    ],
+    "users": [
+        {"name": "email_unique", "keys": [("email", ASCENDING)], "unique": True,
+         "partial": {"email": {"$type": "string"}}},
+        {"name": "apple_sub_1", "keys": [("apple_sub", ASCENDING)], "unique": True, "sparse": True},
+        {"name": "news_push_tokens", "keys": [("expo_push_token", ASCENDING)],
+         "partial": {"expo_push_token": {"$type": "string"}}},
+    ],
+    "signal_votes": [
+        {"name": "signal_id_1_user_id_1",
+         "keys": [("signal_id", ASCENDING), ("user_id", ASCENDING)], "unique": True},
+        # signal_votes.reconcile_recent(): signals voted on since the lookback
+        {"name": "updated_at_1", "keys": [("updated_at", ASCENDING)]},
+    ],
+    # chat_memory.py: one doc per (user, conversation); history is keyset-paginated on _id
+    "conversations": [
+        {"name": "user_conversation", "keys": [("user_id", ASCENDING), ("conversation_id", ASCENDING)], "unique": True},
+        {"name": "user_updated", "keys": [("user_id", ASCENDING), ("updated_at", DESCENDING)]},
+    ],
+    "chat_turns": [
+        {"name": "user_conv_id", "keys": [("user_id", ASCENDING), ("conversation_id", ASCENDING), ("_id", DESCENDING)]},
+        {"name": "user_id_desc", "keys": [("user_id", ASCENDING), ("_id", DESCENDING)]},
+    ],
+    # idempotency.py (IDEMPOTENCY_STORE=mongo): replayable responses + pending claims
+    "idempotency_keys": [
+        {"name": "expires_at_ttl", "keys": [("expires_at", ASCENDING)], "ttl": 0},
+    ],
+    # shared token buckets (admission.py, ADMISSION_STORE=mongo); idle buckets expire
+    "rate_limits": [
+        {"name": "expires_at_ttl", "keys": [("expires_at", ASCENDING)], "ttl": 0},
+    ],
+}
+
+# Hot query shapes in the codebase, kept next to the indexes that serve them.
+# (name, collection, filter, sort) — the audit explains each one.
+_ID_PLACEHOLDER = "000000000000000000000000"
+_TS_PLACEHOLDER = datetime(2025, 1, 6, tzinfo=timezone.utc)
+QUERY_SHAPES = [
+    ("api./signals/latest", "signals",
+     {"output.source": "AI Multi-Timeframe Engine", "output.confidence": {"$gte": 60}},
+     [("created_at", -1), ("_id", -1)]),
+    ("api./signals/latest.before", "signals",
+     {"output.source": "AI Multi-Timeframe Engine", "output.confidence": {"$gte": 60},
+      "created_at": {"$lte": _TS_PLACEHOLDER},   # cursors.keyset_filter()
+      "$or": [{"created_at": {"$lt": _TS_PLACEHOLDER}},
+              {"created_at": _TS_PLACEHOLDER, "_id": {"$lt": ObjectId(_ID_PLACEHOLDER)}}]},
+     [("created_at", -1), ("_id", -1)]),
+    ("cleanup_signals.close_signals_once", "signals",
+     {"status": "open", "output.tp": {"$exists": True}, "output.sl": {"$exists": True},
+      "input.symbol": {"$exists": True}, "output.trade": {"$in": ["LONG", "SHORT"]}}, None),
+    ("signal_engine.duplicate_check", "signals",
+     {"input.symbol": "BTC", "output.trade": "LONG"}, [("created_at", -1)]),
+    ("db.log_signal.upsert", "signals",
+     {"user_id": "partner-ai", "input.symbol": "BTC", "output.result": "x",
+      "output.timeframe": "1h", "output.source": "AI Multi-Timeframe Engine"}, None),
+    ("api./alerts/live", "alerts", {}, [("created_at", -1)]),
+    ("chat_memory.load", "conversations", {"user_id": _ID_PLACEHOLDER, "conversation_id": "default"}, None),
+    ("api./chat/history", "chat_turns", {"user_id": _ID_PLACEHOLDER, "conversation_id": "default"}, [("_id", -1)]),
+    ("api./chat/history.all", "chat_turns", {"user_id": _ID_PLACEHOLDER}, [("_id", -1)]),
+    ("news_feed.page.telegram", "telegram_news",
+     {"date": {"$lte": _TS_PLACEHOLDER}, "$or": [{"date": {"$lt": _TS_PLACEHOLDER}},
+                                                 {"date": _TS_PLACEHOLDER, "_id": {"$lt": ObjectId(_ID_PLACEHOLDER)}}]},
+     [("date", -1), ("_id", -1)]),
+    ("news_feed.page.truth", "truthsocial_news", {}, [("date", -1), ("_id", -1)]),
+    ("telegram_tracker.upsert", "telegram_news", {"source": "watcherguru", "id": 1}, None),
+    ("truth_social_scraper.dedupe", "truth_social", {"id": "1"}, None),
+    ("signal_engine.should_skip_symbol", "signal_control", {"symbol": "BTC"}, None),
+    ("api./economic-calendar", "calendar_cache", {"week_of": "2025-01-06"}, [("scraped_at", -1)]),
+    ("db.get_user_by_email", "users", {"email": "someone@example.com"}, None),
+    ("auth_routes.apple_login", "users", {"apple_sub": "x"}, None),
+    ("api.cast_vote", "signal_votes", {"signal_id": _ID_PLACEHOLDER, "user_id": "x"}, None),
+    ("signal_votes.reconcile_recent", "signal_votes", {"updated_at": {"$gte": _TS_PLACEHOLDER}}, None),
+]
+
+
+def _index_options(spec: dict) -> dict:
+    opts = {"name": spec["name"]}
+    if spec.get("unique"):
+        opts["unique"] = True
+    if spec.get("sparse"):
+        opts["sparse"] = True
+    if spec.get("partial"):
+        opts["partialFilterExpression"] = spec["partial"]
+    if spec.get("ttl") is not None:
+        opts["expireAfterSeconds"] = spec["ttl"]
+    return opts
+
+
+def _key_pattern(keys) -> list[tuple]:
+    # the server may hand back 1.0 / -1.0 for directions
+    return [(f, int(d) if isinstance(d, (int, float)) else d) for f, d in keys]
+
+
+def _matches(existing: dict, spec: dict) -> bool:
+    """Same key pattern and same options -> nothing to do (regardless of name)."""
+    if _key_pattern(existing.get("key", [])) != _key_pattern(spec["keys"]):
+        return False
+    return (
+        bool(existing.get("unique")) == bool(spec.get("unique"))
+        and bool(existing.get("sparse")) == bool(spec.get("sparse"))
+        and (existing.get("partialFilterExpression") or None) == (spec.get("partial") or None)
+        and existing.get("expireAfterSeconds") == spec.get("ttl")
+    )
+
+
+def ensure_indexes(db=None, dry_run: bool = False, prune: bool = False) -> list[str]:
+    """
+    Idempotently reconcile INDEXES against the live database.
+    Returns a list of human-readable actions (created / rebuilt / pruned / errors).
+    """
+    if db is None:
+        from db import client
+        db = client[DB_NAME]
+
+    actions = []
+    for coll_name, specs in INDEXES.items():
+        coll = db[coll_name]
+        try:
+            existing = coll.index_information()
+        except OperationFailure:
+            existing = {}  # collection not created yet
+
+        satisfied = set()
+        for spec in specs:
+            match = next((n for n, info in existing.items() if _matches(info, spec)), None)
+            if match:
+                satisfied.add(match)
+                continue
+
+            try:
+                # same name but different shape/options -> rebuild
+                if spec["name"] in existing:
+                    actions.append(f"rebuild {coll_name}.{spec['name']}")
+                    if not dry_run:
+                        coll.drop_index(spec["name"])
+                else:
+                    actions.append(f"create {coll_name}.{spec['name']}")
+                if not dry_run:
+                    coll.create_index(spec["keys"], **_index_options(spec))
+                satisfied.add(spec["name"])
+            except Exception as e:
+                actions.append(f"error {coll_name}.{spec['name']}: {e}")
+
+        if prune:
+            for name in existing:
+                if name != "_id_" and name not in satisfied:
+                    actions.append(f"prune {coll_name}.{name}")
+                    if not dry_run:
+                        coll.drop_index(name)
+
+    return actions
+
+
+# --- Audit ---
+
+def _plan_stages(plan: dict):
+    """Yield every stage name in a (possibly nested / SBE-wrapped) winning plan."""
+    if not isinstance(plan, dict):
+        return
+    if "queryPlan" in plan:
+        plan = plan["queryPlan"]
+    if plan.get("stage"):
+        yield plan["stage"]
+    if "inputStage" in plan:
+        yield from _plan_stages(plan["inputStage"])
+    for child in plan.get("inputStages", []):
+        yield from _plan_stages(child)
+
+
+def audit_query_shapes(db=None) -> list[dict]:
+    """Explain each QUERY_SHAPES entry; rows with collscan=True need an index."""
+    if db is None:
+        from db import client
+        db = client[DB_NAME]
+
+    rows = []
+    for name, coll_name, flt, sort in QUERY_SHAPES:
+        cmd = {"find": coll_name, "filter": flt, "limit": 50}
+        if sort:
+            cmd["sort"] = dict(sort)
+        try:
+            explained = db.command("explain", cmd, verbosity="executionStats")
+        except Exception as e:
+            rows.append({"shape": name, "collection": coll_name, "error": str(e)})
+            continue
+        planner = explained.get("queryPlanner", {})
+        stages = list(_plan_stages(planner.get("winningPlan", {})))
+        stats = explained.get("executionStats", {})
+        rows.append({
+            "shape": name,
+            "collection": coll_name,
+            "stages": stages,
+            "collscan": "COLLSCAN" in stages,
+            "in_memory_sort": "SORT" in stages,
+            "docs_examined": stats.get("totalDocsExamined"),
+            "returned": stats.get("nReturned"),
+        })
+    return rows
+
+
+def audit_profile(db=None, since_minutes: int = 60) -> list[dict]:
+    """
+    Slow-query audit from the profiler (needs db.setProfilingLevel(1, slowms=...)).
+    Returns recent ops whose plan fell back to a COLLSCAN, grouped by namespace + shape.
+    """
+    if db is None:
+        from db import client
+        db = client[DB_NAME]
+
+    since = datetime.now(timezone.utc) - timedelta(minutes=since_minutes)
+    seen = {}
+    for op in db["system.profile"].find({"ts": {"$gte": since}, "planSummary": "COLLSCAN"}):
+        shape = sorted((op.get("command", {}).get("filter") or op.get("command", {}).get("q") or {}).keys())
+        key = (op.get("ns"), tuple(shape))
+        row = seen.setdefault(key, {"ns": op.get("ns"), "fields": shape, "count": 0, "max_ms": 0})
+        row["count"] += 1
+        row["max_ms"] = max(row["max_ms"], op.get("millis", 0))
+    return sorted(seen.values(), key=lambda r: -r["max_ms"])
+
+
+if __name__ == "__main__":
+    args = set(sys.argv[1:])
+
+    if "--audit" in args or "--profile" in args:
+        failed = False
+        for row in audit_query_shapes():
+            if row.get("error"):
+                print(f"⚠️  {row['shape']:<40} explain failed: {row['error']}")
+                continue
+            flag = "❌ COLLSCAN" if row["collscan"] else ("⚠️  SORT" if row["in_memory_sort"] else "✅")
+            failed |= row["collscan"]
+            print(f"{flag:<12} {row['shape']:<40} {' > '.join(row['stages'])} "
+                  f"(examined {row['docs_examined']}, returned {row['returned']})")
+        if "--profile" in args:
+            for row in audit_profile():
+                print(f"❌ profiler COLLSCAN {row['ns']} fields={row['fields']} x{row['count']} max {row['max_ms']}ms")
+                failed = True
+        sys.exit(1 if failed else 0)
+
+    for action in ensure_indexes(dry_run="--dry-run" in args, prune="--prune" in args) or ["indexes up to date"]:
+        print(f"[indexes] {action}")
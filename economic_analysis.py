@@ -0,0 +1,254 @@
+# economic_analysis.py
+# Precomputed analyses for economic calendar events.
+#
+# After each calendar scrape, precompute_week() analyzes every event of the
+# stored calendar that doesn't have an analysis yet, BATCH_SIZE events per LLM
+# call, and stores them in `economic_analyses` keyed on an event fingerprint
+# (title, period, forecast, previous, actual). A new `actual` => new fingerprint
+# => fresh post-release analysis on the next run.
+#
+# The API serves /analyze-economic from an in-memory map (warmed at startup,
+# refreshed periodically), then the collection by _id, and only then generates
+# live (and stores the result for the next caller).
+#
+#   python economic_analysis.py            -> precompute for the latest stored calendar
+
+import hashlib
+import json
+import os
+import time
+from datetime import datetime, timedelta, timezone
+
+import llm_gateway
+
+BATCH_SIZE = int(os.getenv("ECON_BATCH_SIZE", "8"))
+MEMO_REFRESH_SECONDS = float(os.getenv("ECON_MEMO_REFRESH", "300"))
+COLLECTION = "economic_analyses"
+
+SYSTEM_PROMPT = "You are Hypewave AI: concise, market‑savvy, and specific."
+
+EVENT_FIELDS = ("title", "date", "time", "period", "forecast", "previous", "actual")
+
+
+def _clean(v) -> str:
+    return (v or "").strip()
+
+
+def event_fingerprint(ev: dict) -> str:
+    """Same release + same numbers => same analysis. Date/time labels are display-only."""
+    key = "|".join(_clean(ev.get(f)).lower() for f in ("title", "period", "forecast", "previous", "actual"))
+    return hashlib.sha1(key.encode()).hexdigest()
+
+
+def build_event_prompt(ev: dict) -> str:
+    """Single-event prompt (the original /analyze-economic prompt)."""
+    title, date, time_ = _clean(ev.get("title")), _clean(ev.get("date")), _clean(ev.get("time"))
+    period, forecast = _clean(ev.get("period")), _clean(ev.get("forecast"))
+    previous, actual = _clean(ev.get("previous")), _clean(ev.get("actual"))
+    lines = [
+        "You are Hypewave AI. Analyze an economic data release for traders.",
+        "",
+        f"Release: {title or 'N/A'}",
+        f"Date: {date or 'N/A'}",
+        f"Time: {time_ or 'N/A'}",
+        f"Period: {period}" if period else None,
+        f"Forecast: {forecast}" if forecast else None,
+        f"Previous: {previous}" if previous else None,
+        f"Actual: {actual}" if actual else None,
+        "",
+        "Write a SHORT, crisp take (no long paragraphs). Use 1-3 bullets max:",
+        "• Why markets care (which assets most sensitive: rates, USD, equities, oil, gold).",
+        "• Over vs under forecast: likely immediate reactions.",
+        "• What details matter (core vs headline, revisions, subcomponents).",
+        "• (If helpful) 1‑line historical/seasonal context.",
+        "",
+        "Constraints:",
+        "- Keep it under ~120 words.",
+        "- No fluff, no generic disclaimers.",
+        "- Prefer concrete mappings (e.g., 'hotter CPI → ↑yields/↑USD/↓gold').",
+    ]
+    return "\n".join([l for l in lines if l is not None])
+
+
+def clamp(text: str, words: int = 140) -> str:
+    text = (text or "").strip()
+    if len(text.split()) > words:
+        text = " ".join(text.split()[:words]) + " …"
+    return text
+
+
+def _batch_messages(events: list) -> list:
+    blocks = []
+    for i, ev in enumerate(events, 1):
+        parts = [f"[{i}] {_clean(ev.get('title')) or 'N/A'}"]
+        for f in ("date", "time", "period", "forecast", "previous", "actual"):
+            if _clean(ev.get(f)):
+                parts.append(f"{f.capitalize()}: {_clean(ev.get(f))}")
+        blocks.append(" | ".join(parts))
+    user = "\n".join([
+        "Analyze each economic data release below for traders.",
+        "For EACH one write a SHORT, crisp take: 1-3 bullets, under ~120 words —",
+        "why markets care (most sensitive assets), over vs under forecast reactions,",
+        "which details matter. No fluff, concrete mappings (e.g. 'hotter CPI → ↑yields/↑USD/↓gold').",
+        "",
+        *blocks,
+        "",
+        'Reply with ONLY a JSON object mapping each number to its analysis, e.g. {"1": "...", "2": "..."}.',
+    ])
+    return [{"role": "system", "content": SYSTEM_PROMPT}, {"role": "user", "content": user}]
+
+
+def _parse_batch(raw: str, events: list) -> dict:
+    """fingerprint -> analysis for every event the model actually answered."""
+    try:
+        data = json.loads(raw[raw.index("{"):raw.rindex("}") + 1])
+    except (ValueError, json.JSONDecodeError):
+        print("[econ] could not parse batch response")
+        return {}
+    out = {}
+    for i, ev in enumerate(events, 1):
+        text = data.get(str(i))
+        if isinstance(text, str) and text.strip():
+            out[event_fingerprint(ev)] = clamp(text)
+    return out
+
+
+def _max_tokens(n: int) -> int:
+    return min(4000, 220 * n + 100)
+
+
+def analyze_batch(events: list) -> dict:
+    raw = llm_gateway.complete("economic.batch", _batch_messages(events), max_tokens=_max_tokens(len(events)),
+                               temperature=0.4, response_format={"type": "json_object"})
+    return _parse_batch(raw, events)
+
+
+async def analyze_batch_async(events: list) -> dict:
+    raw = await llm_gateway.acomplete("economic.batch", _batch_messages(events), max_tokens=_max_tokens(len(events)),
+                                      temperature=0.4, response_format={"type": "json_object"})
+    return _parse_batch(raw, events)
+
+
+def iter_calendar_events(calendar: list):
+    """Flatten a calendar_cache `calendar` into events carrying their day label as `date`."""
+    for section in calendar or []:
+        for day in section.get("events", []):
+            for ev in day.get("events", []):
+                if ev.get("title"):
+                    yield {**ev, "date": ev.get("date") or day.get("date_label", "")}
+
+
+def _doc(ev: dict, fp: str, analysis: str, week_of: str = None, source: str = "batch") -> dict:
+    return {
+        "_id": fp,
+        "analysis": analysis,
+        "event": {f: _clean(ev.get(f)) for f in EVENT_FIELDS},
+        "week_of": week_of,
+        "source": source,
+        "created_at": datetime.now(timezone.utc),
+    }
+
+
+def precompute_week(db, calendar_doc: dict = None, batch_size: int = BATCH_SIZE) -> int:
+    """Analyze every not-yet-analyzed event of a calendar_cache doc. Returns how many were stored."""
+    from pymongo import ReplaceOne
+
+    if calendar_doc is None:
+        calendar_doc = db["calendar_cache"].find_one(sort=[("scraped_at", -1)])
+    if not calendar_doc:
+        print("[econ] no calendar to precompute")
+        return 0
+
+    coll = db[COLLECTION]
+    pending = {}
+    for ev in iter_calendar_events(calendar_doc.get("calendar")):
+        pending.setdefault(event_fingerprint(ev), ev)
+    if pending:
+        have = {d["_id"] for d in coll.find({"_id": {"$in": list(pending)}}, {"_id": 1})}
+        for fp in have:
+            pending.pop(fp, None)
+
+    events = list(pending.values())
+    stored = 0
+    started = time.perf_counter()
+    for i in range(0, len(events), batch_size):
+        chunk = events[i:i + batch_size]
+        try:
+            results = analyze_batch(chunk)
+        except Exception as e:
+            print(f"[econ] batch {i // batch_size + 1} failed: {e}")
+            continue
+        ops = [ReplaceOne({"_id": fp}, _doc(pending[fp], fp, text, calendar_doc.get("week_of")), upsert=True)
+               for fp, text in results.items()]
+        if ops:
+            coll.bulk_write(ops, ordered=False)
+            stored += len(ops)
+    print(f"🧮 [econ] precomputed {stored}/{len(events)} new analyses "
+          f"in {-(-len(events) // batch_size) if events else 0} LLM calls ({time.perf_counter() - started:.1f}s)")
+    return stored
+
+
+# --- API side: O(1) lookups ---
+
+class AnalysisStore:
+    """fingerprint -> analysis, in memory, backed by the `economic_analyses` collection (async)."""
+
+    def __init__(self, coll=None):
+        self._coll = coll
+        self._memo = {}
+        self._loaded_at = 0.0
+
+    @property
+    def coll(self):
+        if self._coll is None:
+            import db_async as adb
+            self._coll = adb.db[COLLECTION]
+        return self._coll
+
+    async def warm(self, days: int = 14):
+        """Load recent analyses into memory (startup + every MEMO_REFRESH_SECONDS)."""
+        since = datetime.now(timezone.utc) - timedelta(days=days)
+        n = 0
+        async for d in self.coll.find({"created_at": {"$gte": since}}, {"analysis": 1}):
+            self._memo[d["_id"]] = d["analysis"]
+            n += 1
+        self._loaded_at = time.monotonic()
+        return n
+
+    async def refresh_forever(self):
+        import asyncio
+        while True:
+            try:
+                n = await self.warm()
+                print(f"🧮 [econ] {n} precomputed analyses in memory")
+            except Exception as e:
+                print(f"[econ] warm failed: {e}")
+            await asyncio.sleep(MEMO_REFRESH_SECONDS)
+
+    async def get(self, fp: str):
+        text = self._memo.get(fp)
+        if text is None:
+            doc = await self.coll.find_one({"_id": fp}, {"analysis": 1})
+            if doc:
+                text = self._memo[fp] = doc["analysis"]
+        return text
+
+    async def get_many(self, fps: list) -> dict:
+        found = {fp: self._memo[fp] for fp in fps if fp in self._memo}
+        missing = [fp for fp in fps if fp not in found]
+        if missing:
+            async for d in self.coll.find({"_id": {"$in": missing}}, {"analysis": 1}):
+                found[d["_id"]] = self._memo[d["_id"]] = d["analysis"]
+        return found
+
+    async def put(self, ev: dict, fp: str, analysis: str, source: str = "live"):
+        self._memo[fp] = analysis
+        await self.coll.replace_one({"_id": fp}, _doc(ev, fp, analysis, source=source), upsert=True)
+
+
+analyses = AnalysisStore()
+
+
+if __name__ == "__main__":
+    from mongo_pool import get_client
+    precompute_week(get_client("script")["hypewave"])
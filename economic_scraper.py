@@ -3,12 +3,11 @@
 import requests
 from bs4 import BeautifulSoup
 from datetime import datetime, timedelta, timezone
-from pymongo import MongoClient
-import os
 import dotenv
 
+from mongo_pool import get_client
+
 dotenv.load_dotenv()
-MONGO_URI = os.getenv("MONGO_DB_URI")
 
 def scrape_marketwatch_calendar():
     url = "https://www.marketwatch.com/economy-politics/calendar"
@@ -87,7 +86,7 @@ if __name__ == "__main__":
     week_of = monday.date().isoformat()
 
     # Push to MongoDB
-    client = MongoClient(MONGO_URI)
+    client = get_client("script")
     calendar_coll = client["hypewave"]["calendar_cache"]
     calendar_coll.insert_one({
         "week_of": week_of,
@@ -96,3 +95,7 @@ if __name__ == "__main__":
     })
 
     print(f"✅ Scraped and stored calendar for week of {week_of}")
+
+    # Precompute analyses for the new calendar (batched LLM calls, skips already-analyzed events)
+    from economic_analysis import precompute_week
+    precompute_week(client["hypewave"], {"week_of": week_of, "calendar": calendar})
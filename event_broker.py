@@ -0,0 +1,222 @@
+# event_broker.py
+# In-process fan-out of live feed events to Server-Sent Events clients (/events/stream).
+#
+# Producers  news_feed's change stream (new / edited telegram + truth posts),
+#            signal_watcher's (new feed signals, status/outcome/vote changes) and
+#            one over `alerts` inserts. Each event is serialized to its SSE frame
+#            once, whatever the number of clients.
+# Backlog    the last BACKLOG_SIZE frames sit in a ring buffer. A reconnecting
+#            client sends Last-Event-ID and gets what it missed from memory; if
+#            that id is older than the ring (or from before a restart) it gets a
+#            `reset` event and refetches over REST once.
+# Clients    each connection holds at most CLIENT_QUEUE_SIZE pending frames
+#            (references to the shared frames). A client that falls further
+#            behind is disconnected and resumes from the ring on reconnect,
+#            so a slow reader never grows memory or holds back the others.
+
+import asyncio
+import itertools
+import json
+import os
+import threading
+import time
+from collections import deque
+from datetime import datetime
+
+BACKLOG_SIZE = int(os.getenv("SSE_BACKLOG_SIZE", "1000"))
+CLIENT_QUEUE_SIZE = int(os.getenv("SSE_CLIENT_QUEUE", "256"))
+MAX_CONNECTIONS = int(os.getenv("SSE_MAX_CONNECTIONS", "20000"))
+HEARTBEAT_SECONDS = float(os.getenv("SSE_HEARTBEAT", "15"))
+RETRY_MS = 3000
+EVENT_TYPES = ("news", "signal", "alert")   # `types=` filter values; news/signal also carry *.update
+
+# ids are "<boot>-<seq>": a restart changes <boot>, so stale ids can't alias new events
+_BOOT = format(int(time.time()), "x")
+
+
+def _json_default(v):
+    if isinstance(v, datetime):
+        return v.isoformat()
+    return str(v)  # ObjectId & co.
+
+
+class _Subscriber:
+    __slots__ = ("types", "queue", "wake", "overflowed", "ping")
+
+    def __init__(self, types):
+        self.types = types
+        self.queue = deque()
+        self.wake = asyncio.Event()
+        self.overflowed = False
+        self.ping = False
+
+
+class EventBroker:
+    def __init__(self, backlog_size: int = BACKLOG_SIZE, queue_size: int = CLIENT_QUEUE_SIZE,
+                 max_connections: int = MAX_CONNECTIONS):
+        self.backlog = deque(maxlen=backlog_size)   # (seq, kind, frame)
+        self.queue_size = queue_size
+        self.max_connections = max_connections
+        self._seq = itertools.count(1)
+        self._last_seq = 0
+        self._subs = set()
+        self.listeners = []   # fn(type, data) per published event, in-process (response-cache invalidation)
+        self._loop = None
+        self._loop_thread = None
+        self._heartbeat = None
+        self._stats = {"published": 0, "delivered": 0, "resumed": 0, "resets": 0,
+                       "overflow_disconnects": 0, "rejected": 0, "connections_total": 0}
+
+    # --- producing ---
+
+    def publish(self, type_: str, data: dict):
+        """Queue an event for every subscriber. Safe to call from any thread."""
+        if self._loop is not None and threading.get_ident() != self._loop_thread:
+            self._loop.call_soon_threadsafe(self._publish, type_, data)
+        else:
+            self._publish(type_, data)
+
+    def _publish(self, type_: str, data: dict):
+        seq = self._last_seq = next(self._seq)
+        payload = json.dumps(data, default=_json_default, separators=(",", ":"))
+        frame = f"id: {_BOOT}-{seq}\nevent: {type_}\ndata: {payload}\n\n".encode()
+        kind = type_.split(".")[0]   # "news.update" goes to news subscribers
+        self.backlog.append((seq, kind, frame))
+        self._stats["published"] += 1
+        for fn in self.listeners:
+            try:
+                fn(type_, data)
+            except Exception as e:
+                print(f"[events] listener error: {e}")
+        for sub in self._subs:
+            if sub.types is not None and kind not in sub.types:
+                continue
+            if len(sub.queue) >= self.queue_size:
+                sub.overflowed = True
+            else:
+                sub.queue.append(frame)
+            sub.wake.set()
+
+    def bind_loop(self):
+        """Remember the serving loop so publish() from worker threads hops onto it."""
+        self._loop = asyncio.get_running_loop()
+        self._loop_thread = threading.get_ident()
+        if self._heartbeat is None:
+            self._heartbeat = self._loop.create_task(self._heartbeat_forever())
+
+    async def _heartbeat_forever(self):
+        # one timer for every connection instead of a wait_for() per connection
+        while True:
+            await asyncio.sleep(HEARTBEAT_SECONDS)
+            for sub in self._subs:
+                if not sub.queue:
+                    sub.ping = True
+                    sub.wake.set()
+
+    # --- consuming ---
+
+    def _replay(self, last_event_id: str, types):
+        """Frames after last_event_id from the ring, or None if it can't be resumed from memory."""
+        boot, _, seq = (last_event_id or "").partition("-")
+        if boot != _BOOT or not seq.isdigit():
+            return None
+        seq = int(seq)
+        oldest = self.backlog[0][0] if self.backlog else self._last_seq + 1
+        if seq < oldest - 1 or seq > self._last_seq:
+            return None  # fell off the ring
+        return [f for s, kind, f in self.backlog if s > seq and (types is None or kind in types)]
+
+    async def stream(self, last_event_id: str = None, types=None):
+        """Async iterator of SSE frames for one connection (ends on overflow)."""
+        sub = _Subscriber(types)
+        # subscribe and snapshot the replay with no await in between: every later
+        # event lands in the queue, every earlier one in `missed`, none in both
+        self._subs.add(sub)
+        self._stats["connections_total"] += 1
+        missed = self._replay(last_event_id, types) if last_event_id else []
+        reset_id = self.last_id()
+        try:
+            yield f"retry: {RETRY_MS}\n\n".encode()
+            if missed is None:
+                self._stats["resets"] += 1
+                yield f"id: {reset_id}\nevent: reset\ndata: {{}}\n\n".encode()
+            elif last_event_id:
+                self._stats["resumed"] += 1
+                if missed:
+                    yield b"".join(missed)
+            while True:
+                if not sub.queue and not sub.overflowed:
+                    sub.wake.clear()
+                    await sub.wake.wait()
+                if sub.queue:
+                    # everything pending in one write: one send per wakeup, not per event
+                    n = len(sub.queue)
+                    chunk = b"".join(sub.queue)
+                    sub.queue.clear()
+                    self._stats["delivered"] += n
+                    yield chunk
+                elif sub.ping:
+                    yield b": ping\n\n"
+                sub.ping = False
+                if sub.overflowed:
+                    # too slow: drop it; Last-Event-ID brings it back to where it was
+                    self._stats["overflow_disconnects"] += 1
+                    return
+        finally:
+            self._subs.discard(sub)
+
+    def has_capacity(self) -> bool:
+        if len(self._subs) >= self.max_connections:
+            self._stats["rejected"] += 1
+            return False
+        return True
+
+    def last_id(self) -> str:
+        return f"{_BOOT}-{self._last_seq}"
+
+    # --- producers wired by the API ---
+
+    def on_news(self, op: str, item: dict):
+        self.publish("news" if op == "insert" else "news.update", item)
+
+    def on_signal(self, op: str, doc: dict):
+        from db import format_signal_doc
+        from signal_watcher import FEED_SOURCE
+        if (doc.get("output") or {}).get("source") != FEED_SOURCE:
+            return  # not a feed signal (or a change outside the watcher's view)
+        if op in ("insert", "replace"):
+            self.publish("signal" if op == "insert" else "signal.update", format_signal_doc(doc))
+        elif op == "update":
+            self.publish("signal.update", format_signal_doc(doc))
+
+    async def follow_alerts_forever(self, db=None):
+        """alerts inserts -> events (change stream; other processes write alerts)."""
+        if db is None:
+            import db_async as adb
+            db = adb.feed_db
+        delay = 1
+        while True:
+            try:
+                async with await db["alerts"].watch([{"$match": {"operationType": "insert"}}]) as stream:
+                    delay = 1
+                    async for change in stream:
+                        doc = change["fullDocument"]
+                        self.publish("alert", {"output": doc.get("output"), "created_at": doc.get("created_at")})
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                print(f"[events] alerts stream error, retrying in {delay}s: {e}")
+                await asyncio.sleep(delay)
+                delay = min(delay * 2, 60)
+
+    def stats(self) -> dict:
+        s = dict(self._stats)
+        s["connections"] = len(self._subs)
+        s["backlog"] = len(self.backlog)
+        s["last_id"] = self.last_id()
+        s["max_queued"] = max((len(sub.queue) for sub in list(self._subs)), default=0)
+        return s
+
+
+# Process-wide broker used by api.py
+broker = EventBroker()
@@ -0,0 +1,202 @@
+# idempotency.py
+# Optional `Idempotency-Key` support for LLM-backed POSTs (/chat, /analyze-economic).
+#
+# Same key (scoped per caller + route) within IDEMPOTENCY_TTL seconds:
+#   - still running  -> the duplicate attaches to the in-flight computation (single-flight)
+#   - finished       -> the stored response is replayed, no new GPT call
+#   - different body -> 422, like any other idempotency-key API
+# Only successful results are stored; a failure lets the retry run again.
+#
+# The computation runs as its own task, so a client that hangs up mid-request
+# doesn't throw away the GPT call its retry is about to ask for.
+#
+# IDEMPOTENCY_STORE=mongo also shares completed responses (and a pending claim)
+# across workers through the `idempotency_keys` collection (TTL-expired).
+
+import asyncio
+import hashlib
+import os
+import time
+from collections import OrderedDict
+from datetime import datetime, timedelta, timezone
+
+from fastapi import HTTPException
+
+IDEMPOTENCY_STORE = os.getenv("IDEMPOTENCY_STORE", "memory")
+TTL_SECONDS = float(os.getenv("IDEMPOTENCY_TTL", "600"))
+PENDING_SECONDS = float(os.getenv("IDEMPOTENCY_PENDING_TTL", "180"))   # claim outlives any LLM deadline
+MAX_ENTRIES = int(os.getenv("IDEMPOTENCY_MAX_ENTRIES", "10000"))
+POLL_INTERVAL = 0.25
+HEADER = "Idempotency-Key"
+
+
+def fingerprint(*parts) -> str:
+    h = hashlib.sha256()
+    for p in parts:
+        h.update(repr(p).encode())
+        h.update(b"\x00")
+    return h.hexdigest()
+
+
+def _mismatch():
+    return HTTPException(status_code=422, detail=f"{HEADER} was already used with a different request body")
+
+
+class MongoIdempotencyStore:
+    """Completed responses + pending claims shared across workers."""
+
+    def __init__(self, coll=None):
+        self._coll = coll
+
+    @property
+    def coll(self):
+        if self._coll is None:
+            import db_async as adb
+            self._coll = adb.db["idempotency_keys"]
+        return self._coll
+
+    async def get(self, key: str):
+        return await self.coll.find_one({"_id": key, "expires_at": {"$gt": datetime.now(timezone.utc)}})
+
+    async def claim(self, key: str, fp: str) -> bool:
+        from pymongo.errors import DuplicateKeyError
+        now = datetime.now(timezone.utc)
+        # an expired leftover (worker died, TTL monitor not run yet) can be taken over
+        await self.coll.delete_one({"_id": key, "expires_at": {"$lte": now}})
+        try:
+            await self.coll.insert_one({"_id": key, "fingerprint": fp, "status": "pending",
+                                        "expires_at": now + timedelta(seconds=PENDING_SECONDS)})
+            return True
+        except DuplicateKeyError:
+            return False
+
+    async def complete(self, key: str, payload: dict):
+        await self.coll.update_one(
+            {"_id": key},
+            {"$set": {"status": "done", "payload": payload,
+                      "expires_at": datetime.now(timezone.utc) + timedelta(seconds=TTL_SECONDS)}},
+        )
+
+    async def release(self, key: str):
+        await self.coll.delete_one({"_id": key, "status": "pending"})
+
+
+class IdempotencyManager:
+    def __init__(self, shared=None):
+        self.shared = shared if shared is not None else (MongoIdempotencyStore() if IDEMPOTENCY_STORE == "mongo" else None)
+        self._completed = OrderedDict()   # key -> (expires_monotonic, fingerprint, payload)
+        self._inflight = {}               # key -> (fingerprint, task)
+        self._stats = {"with_key": 0, "computed": 0, "replayed": 0, "joined_inflight": 0,
+                       "remote_replayed": 0, "conflicts": 0, "failed": 0}
+
+    def _get_completed(self, key: str):
+        rec = self._completed.get(key)
+        if rec is None:
+            return None
+        if rec[0] < time.monotonic():
+            del self._completed[key]
+            return None
+        return rec
+
+    def _store(self, key: str, fp: str, payload: dict):
+        self._completed[key] = (time.monotonic() + TTL_SECONDS, fp, payload)
+        self._completed.move_to_end(key)
+        while len(self._completed) > MAX_ENTRIES:
+            self._completed.popitem(last=False)
+
+    async def run(self, scope: str, key: str | None, fp: str, compute) -> tuple[dict, bool]:
+        """
+        Run `compute()` (async, returns a JSON-able dict) at most once per key.
+        Returns (payload, replayed). Without a key it just runs compute().
+        """
+        if not key:
+            return await compute(), False
+        self._stats["with_key"] += 1
+        k = f"{scope}:{key[:200]}"
+
+        rec = self._get_completed(k)
+        if rec is not None:
+            if rec[1] != fp:
+                self._stats["conflicts"] += 1
+                raise _mismatch()
+            self._stats["replayed"] += 1
+            return rec[2], True
+
+        inflight = self._inflight.get(k)
+        if inflight is not None:
+            if inflight[0] != fp:
+                self._stats["conflicts"] += 1
+                raise _mismatch()
+            self._stats["joined_inflight"] += 1
+            return await asyncio.shield(inflight[1]), True
+
+        if self.shared is not None:
+            replay = await self._shared_claim_or_wait(k, fp)
+            if replay is not None:
+                return replay, True
+
+        task = asyncio.create_task(self._compute(k, fp, compute))
+        task.add_done_callback(lambda t: t.cancelled() or t.exception())  # nobody may be left to await it
+        self._inflight[k] = (fp, task)
+        # the retry may attach to this task, so the caller hanging up must not cancel it
+        return await asyncio.shield(task), False
+
+    async def _compute(self, k: str, fp: str, compute) -> dict:
+        try:
+            payload = await compute()
+        except BaseException:
+            self._stats["failed"] += 1
+            if self.shared is not None:
+                try:
+                    await self.shared.release(k)
+                except Exception as e:
+                    print(f"[idempotency] release failed for {k}: {e}")
+            raise
+        else:
+            self._stats["computed"] += 1
+            self._store(k, fp, payload)
+            if self.shared is not None:
+                try:
+                    await self.shared.complete(k, payload)
+                except Exception as e:
+                    print(f"[idempotency] shared store write failed for {k}: {e}")
+            return payload
+        finally:
+            self._inflight.pop(k, None)
+
+    async def _shared_claim_or_wait(self, k: str, fp: str):
+        """Returns a replayed payload, or None once this worker owns the computation."""
+        deadline = time.monotonic() + PENDING_SECONDS
+        while time.monotonic() < deadline:
+            try:
+                doc = await self.shared.get(k)
+                if doc is None:
+                    if await self.shared.claim(k, fp):
+                        return None
+                    continue
+            except Exception as e:
+                # shared store down: degrade to per-worker idempotency
+                print(f"[idempotency] shared store error, continuing locally: {e}")
+                return None
+            if doc.get("fingerprint") != fp:
+                self._stats["conflicts"] += 1
+                raise _mismatch()
+            if doc.get("status") == "done":
+                self._stats["remote_replayed"] += 1
+                self._store(k, fp, doc["payload"])
+                return doc["payload"]
+            await asyncio.sleep(POLL_INTERVAL)  # another worker is computing it
+        return None
+
+    def stats(self) -> dict:
+        s = dict(self._stats)
+        s["store"] = IDEMPOTENCY_STORE
+        s["completed_entries"] = len(self._completed)
+        s["inflight"] = len(self._inflight)
+        saved = s["replayed"] + s["joined_inflight"] + s["remote_replayed"]
+        s["duplicate_calls_saved"] = saved
+        return s
+
+
+# Process-wide manager used by api.py
+idempotency = IdempotencyManager()
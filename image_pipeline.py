@@ -0,0 +1,302 @@
+# image_pipeline.py
+# Preprocessing for user images: chart screenshots sent to the vision model
+# (/chat, /chat/stream) and profile pictures (/me/avatar).
+#
+# All decoding / resizing / encoding runs in a worker pool (threads by default,
+# IMAGE_POOL=process for a process pool), never on the event loop.
+#
+# Charts:  size cap -> format sniffing -> downscale to what the vision model
+#          actually looks at -> recompress -> adaptive `detail`
+#          (small images go as "low": same pixels, 85 tokens instead of 170/tile).
+#          Results are memoized by content hash, so the same screenshot posted
+#          again (or by many users) is processed once. The memo is bounded by
+#          entries and by the size of the payloads it holds (DEDUPE_MAX_BYTES).
+# Avatars: EXIF-orient, center-crop square, AVATAR_SIZE px JPEG, metadata stripped.
+
+import asyncio
+import base64
+import hashlib
+import io
+import math
+import os
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+from fastapi import HTTPException
+from PIL import Image, ImageOps
+
+MAX_UPLOAD_BYTES = int(os.getenv("IMAGE_MAX_UPLOAD_BYTES", str(10 * 1024 * 1024)))
+MAX_PIXELS = int(os.getenv("IMAGE_MAX_PIXELS", str(40_000_000)))   # decompression-bomb guard
+CHART_DETAIL = os.getenv("CHAT_IMAGE_DETAIL", "auto")              # auto | low | high
+CHART_JPEG_QUALITY = int(os.getenv("CHAT_IMAGE_QUALITY", "85"))
+AVATAR_SIZE = int(os.getenv("AVATAR_SIZE", "512"))
+POOL_KIND = os.getenv("IMAGE_POOL", "thread")
+POOL_WORKERS = int(os.getenv("IMAGE_POOL_WORKERS", str(min(4, os.cpu_count() or 1))))
+DEDUPE_ENTRIES = 256
+DEDUPE_MAX_BYTES = int(os.getenv("IMAGE_DEDUPE_MAX_BYTES", str(64 * 1024 * 1024)))
+
+# OpenAI vision sizing: "high" fits the image in 2048x2048, then scales the short
+# side to 768 and bills 170 tokens per 512px tile + 85; "low" is a flat 85 tokens
+# at 512x512. Pixels beyond that are uploaded for nothing.
+HIGH_MAX_LONG = 2048
+HIGH_MAX_SHORT = 768
+LOW_MAX_SIDE = 512
+ALLOWED_FORMATS = {"PNG": "image/png", "JPEG": "image/jpeg", "WEBP": "image/webp", "GIF": "image/gif"}
+
+Image.MAX_IMAGE_PIXELS = MAX_PIXELS
+
+
+def vision_tokens(width: int, height: int, detail: str) -> int:
+    if detail == "low":
+        return 85
+    scale = min(1.0, HIGH_MAX_LONG / max(width, height))
+    w, h = width * scale, height * scale
+    scale = min(1.0, HIGH_MAX_SHORT / min(w, h))
+    w, h = w * scale, h * scale
+    return 170 * math.ceil(w / 512) * math.ceil(h / 512) + 85
+
+
+def _open(data: bytes) -> Image.Image:
+    try:
+        img = Image.open(io.BytesIO(data))
+        fmt = img.format
+        img.load()
+    except Image.DecompressionBombError:
+        raise ValueError("image too large")
+    except Exception:
+        raise ValueError("unrecognized image format")
+    if fmt not in ALLOWED_FORMATS:
+        raise ValueError(f"unsupported image format: {fmt}")
+    return img
+
+
+def _flatten(img: Image.Image) -> Image.Image:
+    # JPEG has no alpha: composite transparent screenshots onto white
+    if img.mode in ("RGBA", "LA", "P"):
+        img = img.convert("RGBA")
+        bg = Image.new("RGB", img.size, (255, 255, 255))
+        bg.paste(img, mask=img.split()[-1])
+        return bg
+    return img.convert("RGB") if img.mode != "RGB" else img
+
+
+def _prepare_chart(data: bytes, detail_pref: str) -> dict:
+    """Pure function (runs in the pool): raw upload bytes -> image_url payload + stats."""
+    img = _open(data)
+    src_fmt = img.format
+    w0, h0 = img.size
+
+    if detail_pref in ("low", "high"):
+        detail = detail_pref
+    else:
+        detail = "low" if max(w0, h0) <= LOW_MAX_SIDE else "high"
+
+    if detail == "low":
+        scale = min(1.0, LOW_MAX_SIDE / max(w0, h0))
+    else:
+        scale = min(1.0, HIGH_MAX_LONG / max(w0, h0), HIGH_MAX_SHORT / min(w0, h0))
+    w1, h1 = max(1, round(w0 * scale)), max(1, round(h0 * scale))
+
+    if (w1, h1) == (w0, h0) and src_fmt in ("JPEG", "PNG", "WEBP") and len(data) <= 1_000_000:
+        # already the right size and a cheap format: send as-is
+        out, mime = data, ALLOWED_FORMATS[src_fmt]
+    else:
+        if src_fmt == "GIF":
+            img.seek(0)
+        img = _flatten(img)
+        if (w1, h1) != (w0, h0):
+            img = img.resize((w1, h1), Image.LANCZOS)
+        buf = io.BytesIO()
+        # 4:4:4 chroma keeps thin colored candle wicks and axis labels crisp
+        img.save(buf, "JPEG", quality=CHART_JPEG_QUALITY, optimize=True, subsampling=0)
+        out, mime = buf.getvalue(), "image/jpeg"
+        if src_fmt == "PNG":
+            # flat-color chart screenshots are often smaller as PNG: keep whichever wins
+            buf = io.BytesIO()
+            img.save(buf, "PNG", compress_level=6)
+            if buf.tell() < len(out):
+                out, mime = buf.getvalue(), "image/png"
+
+    return {
+        "part": {
+            "type": "image_url",
+            "image_url": {"url": f"data:{mime};base64,{base64.b64encode(out).decode('ascii')}", "detail": detail},
+        },
+        "format": src_fmt,
+        "mime": mime,
+        "size_in": (w0, h0),
+        "size_out": (w1, h1),
+        "bytes_in": len(data),
+        "bytes_out": len(out),
+        "tokens_before": vision_tokens(w0, h0, "high"),
+        "tokens_after": vision_tokens(w1, h1, detail),
+    }
+
+
+def _prepare_avatar(data: bytes) -> bytes:
+    img = _open(data)
+    if img.format == "GIF":
+        img.seek(0)
+    img = ImageOps.exif_transpose(img)
+    img = _flatten(img)
+    img = ImageOps.fit(img, (AVATAR_SIZE, AVATAR_SIZE), Image.LANCZOS)
+    buf = io.BytesIO()
+    img.save(buf, "JPEG", quality=85, optimize=True)   # no exif= -> metadata stripped
+    return buf.getvalue()
+
+
+# --- pool + async front-end ---
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def _get_pool():
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                cls = ProcessPoolExecutor if POOL_KIND == "process" else ThreadPoolExecutor
+                _pool = cls(max_workers=POOL_WORKERS)
+    return _pool
+
+
+async def _run(fn, *args):
+    return await asyncio.get_running_loop().run_in_executor(_get_pool(), fn, *args)
+
+
+async def read_capped(upload, max_bytes: int = MAX_UPLOAD_BYTES) -> bytes:
+    """Read an UploadFile, refusing anything over max_bytes without buffering it all."""
+    chunks, total = [], 0
+    while True:
+        chunk = await upload.read(256 * 1024)
+        if not chunk:
+            break
+        total += len(chunk)
+        if total > max_bytes:
+            raise HTTPException(status_code=413, detail=f"Image exceeds {max_bytes // (1024 * 1024)} MB limit")
+        chunks.append(chunk)
+    if not total:
+        raise HTTPException(status_code=400, detail="Empty image upload")
+    return b"".join(chunks)
+
+
+async def read_image(upload, max_bytes: int = MAX_UPLOAD_BYTES) -> tuple[bytes, str]:
+    """Capped read of an UploadFile -> (bytes, sha256 hex of them)."""
+    data = await read_capped(upload, max_bytes)
+    return data, hashlib.sha256(data).hexdigest()
+
+
+class ImagePipeline:
+    def __init__(self, dedupe_entries: int = DEDUPE_ENTRIES, dedupe_max_bytes: int = DEDUPE_MAX_BYTES):
+        self._lock = threading.Lock()
+        self._charts = OrderedDict()   # (sha256, detail_pref) -> prepared dict
+        self._inflight = {}            # same key -> Future, so concurrent duplicates share one job
+        self._dedupe_entries = dedupe_entries
+        self._dedupe_max_bytes = dedupe_max_bytes
+        self._dedupe_bytes = 0         # size of the base64 data URLs held in _charts
+        self._stats = {"charts": 0, "avatars": 0, "dedupe_hits": 0, "dedupe_evictions": 0, "rejected": 0,
+                       "bytes_in": 0, "bytes_out": 0, "tokens_before": 0, "tokens_after": 0,
+                       "process_ms_total": 0.0}
+
+    async def chart_part(self, upload, detail_pref: str = CHART_DETAIL) -> dict:
+        """UploadFile -> {"type": "image_url", ...} message part, ready for the vision model."""
+        return await self.chart_part_from(await read_image(upload), detail_pref)
+
+    async def chart_part_from(self, image: tuple[bytes, str], detail_pref: str = CHART_DETAIL) -> dict:
+        """Same, for an upload already read with read_image()."""
+        data, digest = image
+        key = (digest, detail_pref)
+
+        with self._lock:
+            hit = self._charts.get(key)
+            if hit is not None:
+                self._charts.move_to_end(key)
+                self._stats["dedupe_hits"] += 1
+                self._account(hit, 0.0)
+                return hit["part"]
+            fut = self._inflight.get(key)
+            owner = fut is None
+            if owner:
+                fut = asyncio.get_running_loop().create_future()
+                self._inflight[key] = fut
+
+        if not owner:
+            prepared = await asyncio.shield(fut)
+            with self._lock:
+                self._stats["dedupe_hits"] += 1
+                self._account(prepared, 0.0)
+            return prepared["part"]
+
+        started = time.perf_counter()
+        try:
+            prepared = await _run(_prepare_chart, data, detail_pref)
+        except ValueError as e:
+            with self._lock:
+                self._stats["rejected"] += 1
+                self._inflight.pop(key, None)
+            err = HTTPException(status_code=415, detail=str(e))
+            fut.set_exception(err)
+            fut.exception()  # mark retrieved
+            raise err
+        except BaseException as e:
+            with self._lock:
+                self._inflight.pop(key, None)
+            fut.set_exception(e if isinstance(e, Exception) else RuntimeError("image processing cancelled"))
+            fut.exception()
+            raise
+
+        with self._lock:
+            self._inflight.pop(key, None)
+            size = len(prepared["part"]["image_url"]["url"])
+            if size <= self._dedupe_max_bytes:
+                self._charts[key] = prepared
+                self._dedupe_bytes += size
+                while len(self._charts) > self._dedupe_entries or self._dedupe_bytes > self._dedupe_max_bytes:
+                    _, old = self._charts.popitem(last=False)
+                    self._dedupe_bytes -= len(old["part"]["image_url"]["url"])
+                    self._stats["dedupe_evictions"] += 1
+            self._account(prepared, (time.perf_counter() - started) * 1000)
+        fut.set_result(prepared)
+        return prepared["part"]
+
+    def _account(self, prepared: dict, ms: float):
+        # caller holds the lock
+        self._stats["charts"] += 1
+        self._stats["bytes_in"] += prepared["bytes_in"]
+        self._stats["bytes_out"] += prepared["bytes_out"]
+        self._stats["tokens_before"] += prepared["tokens_before"]
+        self._stats["tokens_after"] += prepared["tokens_after"]
+        self._stats["process_ms_total"] += ms
+
+    async def avatar(self, upload) -> tuple[bytes, str]:
+        """UploadFile -> (normalized JPEG bytes, sha256 of those bytes)."""
+        data = await read_capped(upload)
+        try:
+            out = await _run(_prepare_avatar, data)
+        except ValueError as e:
+            with self._lock:
+                self._stats["rejected"] += 1
+            raise HTTPException(status_code=415, detail=str(e))
+        with self._lock:
+            self._stats["avatars"] += 1
+        return out, hashlib.sha256(out).hexdigest()
+
+    def stats(self) -> dict:
+        with self._lock:
+            s = dict(self._stats)
+        processed = s["charts"] - s["dedupe_hits"]
+        s["avg_process_ms"] = round(s.pop("process_ms_total") / processed, 1) if processed else None
+        s["bytes_saved_pct"] = round(100 * (1 - s["bytes_out"] / s["bytes_in"]), 1) if s["bytes_in"] else None
+        s["tokens_saved_pct"] = round(100 * (1 - s["tokens_after"] / s["tokens_before"]), 1) if s["tokens_before"] else None
+        s["pool"] = f"{POOL_KIND}x{POOL_WORKERS}"
+        with self._lock:
+            s["dedupe_entries"] = len(self._charts)
+            s["dedupe_mb"] = round(self._dedupe_bytes / (1024 * 1024), 1)
+        return s
+
+
+# Process-wide pipeline used by api.py / auth_routes.py
+images = ImagePipeline()
@@ -0,0 +1,191 @@
+# jwks_cache.py
+# Local verification of Google / Apple ID tokens against cached signing keys (JWKS).
+#
+#   keys      each provider's JWKS is fetched once and kept, parsed, by `kid`.
+#             refresh_forever() re-fetches ahead of expiry (Cache-Control max-age
+#             when the provider sends one, else REFRESH_SECONDS), so logins never
+#             wait on the network in steady state.
+#   rotation  a token signed with a `kid` we don't know triggers one refresh,
+#             shared by every concurrent login (single-flight), at most once per
+#             MIN_REFETCH_SECONDS so junk kids can't turn into a fetch storm.
+#   outages   a failed fetch keeps the last good keys; they're used until a
+#             fetch succeeds.
+#
+# Verification is RS256 only, with issuer, audience and expiry checked here.
+# A login therefore costs one signature check and no external round trip.
+
+import asyncio
+import os
+import re
+import time
+
+from jose import jwk, jwt
+from jose.exceptions import JOSEError
+
+REFRESH_SECONDS = float(os.getenv("JWKS_REFRESH_SECONDS", "3600"))
+MIN_REFETCH_SECONDS = float(os.getenv("JWKS_MIN_REFETCH_SECONDS", "30"))
+RETRY_SECONDS = 60
+LEEWAY_SECONDS = 60   # clock skew allowed on exp / iat
+ALGORITHMS = ["RS256"]
+
+PROVIDERS = {
+    "google": {
+        "jwks_uri": "https://www.googleapis.com/oauth2/v3/certs",
+        "issuers": ("https://accounts.google.com", "accounts.google.com"),
+    },
+    "apple": {
+        "jwks_uri": "https://appleid.apple.com/auth/keys",
+        "issuers": ("https://appleid.apple.com",),
+    },
+}
+
+_MAX_AGE = re.compile(r"max-age=(\d+)")
+
+
+class InvalidIdToken(Exception):
+    pass
+
+
+async def fetch_jwks(uri: str):
+    """GET a JWKS document -> (jwks dict, max-age seconds or None)."""
+    import httpx
+    async with httpx.AsyncClient(timeout=10) as http:
+        r = await http.get(uri)
+        r.raise_for_status()
+        m = _MAX_AGE.search(r.headers.get("cache-control", ""))
+        return r.json(), (int(m.group(1)) if m else None)
+
+
+class KeySet:
+    """One provider's keys, by kid."""
+
+    def __init__(self, name: str, jwks_uri: str, issuers, fetch=None,
+                 refresh_seconds: float = REFRESH_SECONDS, min_refetch: float = MIN_REFETCH_SECONDS):
+        self.name = name
+        self.jwks_uri = jwks_uri
+        self.issuers = tuple(issuers)
+        self._fetch = fetch or fetch_jwks
+        self.refresh_seconds = refresh_seconds
+        self.min_refetch = min_refetch
+        self.keys = {}            # kid -> jose Key
+        self.fetched_at = 0.0     # monotonic; last successful fetch
+        self.expires_at = 0.0
+        self._last_attempt = float("-inf")
+        self._inflight = None     # Future of the running refresh
+        self._stats = {"fetches": 0, "fetch_errors": 0, "coalesced": 0, "unknown_kid": 0,
+                       "verified": 0, "rejected": 0}
+
+    def _load(self, jwks: dict) -> dict:
+        keys = {}
+        for k in jwks.get("keys", []):
+            if k.get("kty") != "RSA" or not k.get("kid") or k.get("use", "sig") != "sig":
+                continue
+            try:
+                keys[k["kid"]] = jwk.construct(k, algorithm="RS256")
+            except JOSEError as e:
+                print(f"[jwks] {self.name}: skipping key {k.get('kid')}: {e}")
+        return keys
+
+    async def refresh(self) -> bool:
+        """Fetch the JWKS; concurrent callers share one fetch. False if it failed."""
+        if self._inflight is not None:
+            self._stats["coalesced"] += 1
+            return await asyncio.shield(self._inflight)
+        self._inflight = asyncio.get_running_loop().create_future()
+        self._last_attempt = time.monotonic()
+        ok = False
+        try:
+            self._stats["fetches"] += 1
+            jwks, max_age = await self._fetch(self.jwks_uri)
+            keys = self._load(jwks)
+            if not keys:
+                raise ValueError("no usable RSA signing keys")
+            self.keys = keys
+            self.fetched_at = time.monotonic()
+            self.expires_at = self.fetched_at + (max_age if max_age is not None else self.refresh_seconds)
+            ok = True
+        except Exception as e:
+            # keep serving the last good keys
+            self._stats["fetch_errors"] += 1
+            print(f"[jwks] {self.name} refresh failed ({len(self.keys)} cached keys kept): {e}")
+        finally:
+            fut, self._inflight = self._inflight, None
+            fut.set_result(ok)
+        return ok
+
+    async def key(self, kid: str):
+        if not self.keys or time.monotonic() >= self.expires_at:
+            if time.monotonic() - self._last_attempt >= self.min_refetch or not self.keys:
+                await self.refresh()
+        key = self.keys.get(kid)
+        if key is None:
+            self._stats["unknown_kid"] += 1
+            # rotated keys show up under a new kid: one (shared, rate-limited) refetch
+            if time.monotonic() - self._last_attempt >= self.min_refetch:
+                await self.refresh()
+                key = self.keys.get(kid)
+        return key
+
+    async def verify(self, token: str, audiences) -> dict:
+        """Claims of a valid token for one of `audiences` (empty: any), else InvalidIdToken."""
+        try:
+            header = jwt.get_unverified_header(token)
+        except JOSEError as e:
+            self._stats["rejected"] += 1
+            raise InvalidIdToken(f"malformed token: {e}")
+        if header.get("alg") not in ALGORITHMS:
+            self._stats["rejected"] += 1
+            raise InvalidIdToken(f"unexpected alg {header.get('alg')!r}")
+        key = await self.key(header.get("kid") or "")
+        if key is None:
+            self._stats["rejected"] += 1
+            raise InvalidIdToken("signing key not found")
+        try:
+            claims = jwt.decode(token, key, algorithms=ALGORITHMS, issuer=self.issuers,
+                                options={"verify_aud": False, "verify_at_hash": False,
+                                         "leeway": LEEWAY_SECONDS})
+        except JOSEError as e:
+            self._stats["rejected"] += 1
+            raise InvalidIdToken(str(e))
+        aud = claims.get("aud")
+        aud = aud if isinstance(aud, list) else [aud]
+        if audiences and not set(aud) & set(audiences):
+            self._stats["rejected"] += 1
+            raise InvalidIdToken("audience mismatch")
+        self._stats["verified"] += 1
+        return claims
+
+    async def refresh_forever(self):
+        while True:
+            ok = await self.refresh()
+            if ok:
+                # re-fetch at 80% of the lifetime so logins never see expired keys
+                await asyncio.sleep(max(RETRY_SECONDS, (self.expires_at - time.monotonic()) * 0.8))
+            else:
+                await asyncio.sleep(RETRY_SECONDS)
+
+    def stats(self) -> dict:
+        s = dict(self._stats)
+        s["kids"] = sorted(self.keys)
+        s["age_s"] = round(time.monotonic() - self.fetched_at, 1) if self.fetched_at else None
+        s["expires_in_s"] = round(self.expires_at - time.monotonic(), 1) if self.fetched_at else None
+        return s
+
+
+class JWKSCache:
+    def __init__(self, providers: dict = None, fetch=None, **kwargs):
+        self.providers = {name: KeySet(name, p["jwks_uri"], p["issuers"], fetch=fetch, **kwargs)
+                          for name, p in (providers or PROVIDERS).items()}
+
+    async def verify(self, provider: str, token: str, audiences=()) -> dict:
+        return await self.providers[provider].verify(token, audiences)
+
+    async def refresh_forever(self):
+        await asyncio.gather(*(ks.refresh_forever() for ks in self.providers.values()))
+
+    def stats(self) -> dict:
+        return {name: ks.stats() for name, ks in self.providers.items()}
+
+
+# Process-wide cache used by auth_routes.py
+jwks_cache = JWKSCache()
@@ -0,0 +1,484 @@
+# llm_gateway.py
+# Single entry point for every LLM call (/chat, /chat/stream, /analyze-economic,
+# signal_engine.evaluate_trade_opportunity).
+#
+# Per route it applies:
+#   - a deadline covering the whole call, retries included
+#   - jittered exponential-backoff retries on transient errors (timeouts, 429, 5xx, connection)
+#   - a circuit breaker: after BREAKER_FAILURES consecutive provider failures
+#     (the retryable kind; bad requests and local saturation don't count) the route
+#     fails fast for BREAKER_COOLDOWN seconds, then lets one probe through
+#   - a concurrency semaphore so one route can't eat the whole OpenAI rate limit
+#   - token + latency accounting (p50/p95), exposed via llm_metrics()
+#
+# LLM_BACKEND=stub swaps OpenAI for a local deterministic backend (offline tests/benches).
+
+import asyncio
+import os
+import random
+import threading
+import time
+from collections import deque
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+LLM_BACKEND = os.getenv("LLM_BACKEND", "openai")
+DEFAULT_MODEL = os.getenv("LLM_MODEL", "gpt-4o")
+MAX_RETRIES = int(os.getenv("LLM_MAX_RETRIES", "2"))
+BACKOFF_BASE = float(os.getenv("LLM_BACKOFF_BASE", "0.5"))
+BACKOFF_CAP = float(os.getenv("LLM_BACKOFF_CAP", "8"))
+BREAKER_FAILURES = int(os.getenv("LLM_BREAKER_FAILURES", "5"))
+BREAKER_COOLDOWN = float(os.getenv("LLM_BREAKER_COOLDOWN", "30"))
+STUB_LATENCY = float(os.getenv("LLM_STUB_LATENCY", "0.05"))
+
+# route -> deadline (s) for the whole call, max in-flight calls
+ROUTES = {
+    "chat":        {"timeout": 60, "concurrency": 32},
+    "chat.stream": {"timeout": 120, "concurrency": 32},
+    "chat.summary": {"timeout": 30, "concurrency": 4},
+    "economic":    {"timeout": 20, "concurrency": 8},
+    "economic.batch": {"timeout": 90, "concurrency": 2},
+    "signals":     {"timeout": 45, "concurrency": 4},
+}
+DEFAULT_ROUTE = {"timeout": 30, "concurrency": 8}
+
+
+def route_config(route: str) -> dict:
+    """ROUTES entry with env overrides: LLM_<ROUTE>_TIMEOUT / LLM_<ROUTE>_CONCURRENCY."""
+    cfg = dict(ROUTES.get(route, DEFAULT_ROUTE))
+    prefix = "LLM_" + route.upper().replace(".", "_")
+    if os.getenv(f"{prefix}_TIMEOUT"):
+        cfg["timeout"] = float(os.getenv(f"{prefix}_TIMEOUT"))
+    if os.getenv(f"{prefix}_CONCURRENCY"):
+        cfg["concurrency"] = int(os.getenv(f"{prefix}_CONCURRENCY"))
+    return cfg
+
+
+class LLMError(Exception):
+    pass
+
+
+class LLMTimeout(LLMError):
+    pass
+
+
+class LLMSaturated(LLMTimeout):
+    """No concurrency slot before the deadline: our own load, not the provider's health."""
+
+
+class LLMUnavailable(LLMError):
+    """Circuit breaker is open for the route."""
+
+
+def _is_retryable(exc: Exception) -> bool:
+    if isinstance(exc, (LLMTimeout, asyncio.TimeoutError, TimeoutError, ConnectionError)):
+        return True
+    try:
+        import openai
+    except ImportError:
+        return False
+    if isinstance(exc, (openai.APITimeoutError, openai.APIConnectionError)):
+        return True
+    if isinstance(exc, openai.APIStatusError):
+        return exc.status_code in (408, 409, 429) or exc.status_code >= 500
+    return False
+
+
+def _backoff(attempt: int) -> float:
+    # "full jitter": uniform(0, min(cap, base * 2^attempt))
+    return random.uniform(0, min(BACKOFF_CAP, BACKOFF_BASE * (2 ** attempt)))
+
+
+def _percentile(sorted_vals: list, pct: float):
+    if not sorted_vals:
+        return None
+    return sorted_vals[min(len(sorted_vals) - 1, int(len(sorted_vals) * pct))]
+
+
+# --- per-route state ---
+
+class _Route:
+    def __init__(self, name: str):
+        self.name = name
+        self.cfg = route_config(name)
+        self.lock = threading.Lock()
+        self.thread_sem = threading.BoundedSemaphore(self.cfg["concurrency"])
+        self.async_sem = None  # created on first async use (inside the running loop)
+
+        # breaker
+        self.consecutive_failures = 0
+        self.open_until = 0.0
+        self.probing = False
+
+        # accounting
+        self.latencies = deque(maxlen=1000)
+        self.counts = {"calls": 0, "ok": 0, "errors": 0, "retries": 0, "timeouts": 0,
+                       "saturated": 0, "short_circuited": 0, "cancelled": 0, "in_flight": 0}
+        self.tokens = {"prompt": 0, "completion": 0, "cached": 0}
+
+    def semaphore(self) -> asyncio.Semaphore:
+        if self.async_sem is None:
+            self.async_sem = asyncio.Semaphore(self.cfg["concurrency"])
+        return self.async_sem
+
+    # breaker
+    def admit(self):
+        with self.lock:
+            self.counts["calls"] += 1
+            now = time.monotonic()
+            if self.open_until > now:
+                self.counts["short_circuited"] += 1
+                raise LLMUnavailable(f"LLM route '{self.name}' circuit open")
+            if self.open_until and not self.probing:
+                self.probing = True  # half-open: this call is the probe
+            elif self.open_until:
+                self.counts["short_circuited"] += 1
+                raise LLMUnavailable(f"LLM route '{self.name}' circuit half-open, probe in flight")
+            self.counts["in_flight"] += 1
+
+    def record_success(self, latency: float, usage):
+        with self.lock:
+            self.counts["in_flight"] -= 1
+            self.counts["ok"] += 1
+            self.consecutive_failures = 0
+            self.open_until = 0.0
+            self.probing = False
+            self.latencies.append(latency)
+            if usage is not None:
+                self.tokens["prompt"] += getattr(usage, "prompt_tokens", 0) or 0
+                self.tokens["completion"] += getattr(usage, "completion_tokens", 0) or 0
+                details = getattr(usage, "prompt_tokens_details", None)
+                self.tokens["cached"] += getattr(details, "cached_tokens", 0) or 0
+
+    def record_failure(self, exc: Exception):
+        with self.lock:
+            self.counts["in_flight"] -= 1
+            self.counts["errors"] += 1
+            if isinstance(exc, LLMSaturated):
+                self.counts["saturated"] += 1
+            elif isinstance(exc, LLMTimeout):
+                self.counts["timeouts"] += 1
+            self.probing = False
+            # a bad request or our own queue filling up says nothing about the provider
+            if isinstance(exc, LLMSaturated) or not _is_retryable(exc):
+                return
+            self.consecutive_failures += 1
+            if self.consecutive_failures >= BREAKER_FAILURES:
+                self.open_until = time.monotonic() + BREAKER_COOLDOWN
+                print(f"⚡ [llm] circuit open for route '{self.name}' ({self.consecutive_failures} failures)")
+
+    def record_cancelled(self):
+        # caller went away mid-call: release the slot (and the half-open probe) without judging the provider
+        with self.lock:
+            self.counts["in_flight"] -= 1
+            self.counts["cancelled"] += 1
+            self.probing = False
+
+    def snapshot(self) -> dict:
+        with self.lock:
+            lat = sorted(self.latencies)
+            now = time.monotonic()
+            state = "closed"
+            if self.open_until > now:
+                state = "open"
+            elif self.open_until:
+                state = "half-open"
+            ok = self.counts["ok"] or 1
+            return {
+                **self.counts,
+                "circuit": state,
+                "concurrency": self.cfg["concurrency"],
+                "timeout_s": self.cfg["timeout"],
+                "latency_p50_ms": round(_percentile(lat, 0.50) * 1000, 1) if lat else None,
+                "latency_p95_ms": round(_percentile(lat, 0.95) * 1000, 1) if lat else None,
+                "prompt_tokens": self.tokens["prompt"],
+                "completion_tokens": self.tokens["completion"],
+                # prompt tokens the provider served from its prefix cache
+                "cached_prompt_tokens": self.tokens["cached"],
+                "avg_tokens_per_call": round((self.tokens["prompt"] + self.tokens["completion"]) / ok, 1),
+            }
+
+
+_routes = {}
+_routes_lock = threading.Lock()
+
+
+def _route(name: str) -> _Route:
+    r = _routes.get(name)
+    if r is None:
+        with _routes_lock:
+            r = _routes.setdefault(name, _Route(name))
+    return r
+
+
+# --- backends ---
+
+class _Usage:
+    def __init__(self, prompt_tokens: int, completion_tokens: int):
+        self.prompt_tokens = prompt_tokens
+        self.completion_tokens = completion_tokens
+
+
+def _approx_tokens(messages: list) -> int:
+    chars = 0
+    for m in messages:
+        c = m.get("content")
+        if isinstance(c, str):
+            chars += len(c)
+        elif isinstance(c, list):
+            chars += sum(len(p.get("text", "")) for p in c if isinstance(p, dict))
+    return max(1, chars // 4)
+
+
+def _default_stub_responder(route: str, messages: list) -> str:
+    last = messages[-1].get("content") if messages else ""
+    if isinstance(last, list):
+        last = " ".join(p.get("text", "") for p in last if isinstance(p, dict))
+    return f"[stub:{route}] {str(last)[:200]}"
+
+
+stub_responder = _default_stub_responder  # replace for tests/benches: fn(route, messages) -> str
+
+
+class StubBackend:
+    """Local backend: fixed latency, echo-ish text, approximate token usage."""
+
+    def complete(self, route, messages, model, timeout, **kwargs):
+        time.sleep(STUB_LATENCY)
+        text = stub_responder(route, messages)
+        return text, _Usage(_approx_tokens(messages), max(1, len(text) // 4))
+
+    async def acomplete(self, route, messages, model, timeout, **kwargs):
+        await asyncio.sleep(STUB_LATENCY)
+        text = stub_responder(route, messages)
+        return text, _Usage(_approx_tokens(messages), max(1, len(text) // 4))
+
+    async def astream(self, route, messages, model, timeout, usage_out: list, **kwargs):
+        await asyncio.sleep(STUB_LATENCY)
+        text = stub_responder(route, messages)
+        for i, word in enumerate(text.split(" ")):
+            yield word if i == 0 else " " + word
+        usage_out.append(_Usage(_approx_tokens(messages), max(1, len(text) // 4)))
+
+
+class OpenAIBackend:
+    """OpenAI clients built lazily; SDK retries off (the gateway owns the retry policy)."""
+
+    def __init__(self):
+        self._sync = None
+        self._async = None
+
+    @property
+    def sync_client(self):
+        if self._sync is None:
+            from openai import OpenAI
+            self._sync = OpenAI(max_retries=0)
+        return self._sync
+
+    @property
+    def async_client(self):
+        if self._async is None:
+            from openai import AsyncOpenAI
+            self._async = AsyncOpenAI(max_retries=0)
+        return self._async
+
+    def complete(self, route, messages, model, timeout, **kwargs):
+        resp = self.sync_client.chat.completions.create(model=model, messages=messages, timeout=timeout, **kwargs)
+        return (resp.choices[0].message.content or ""), resp.usage
+
+    async def acomplete(self, route, messages, model, timeout, **kwargs):
+        resp = await self.async_client.chat.completions.create(model=model, messages=messages, timeout=timeout, **kwargs)
+        return (resp.choices[0].message.content or ""), resp.usage
+
+    async def astream(self, route, messages, model, timeout, usage_out: list, **kwargs):
+        stream = await self.async_client.chat.completions.create(
+            model=model, messages=messages, timeout=timeout, stream=True,
+            stream_options={"include_usage": True}, **kwargs,
+        )
+        async for chunk in stream:
+            if chunk.usage is not None:
+                usage_out.append(chunk.usage)
+            if not chunk.choices:
+                continue
+            delta = chunk.choices[0].delta.content
+            if delta:
+                yield delta
+
+
+_backend = None
+
+
+def get_backend():
+    global _backend
+    if _backend is None:
+        _backend = StubBackend() if LLM_BACKEND == "stub" else OpenAIBackend()
+    return _backend
+
+
+def set_backend(backend):
+    """Swap the backend (tests / benches)."""
+    global _backend
+    _backend = backend
+
+
+# --- public API ---
+
+def complete(route: str, messages: list, model: str = DEFAULT_MODEL, timeout: float = None, **kwargs) -> str:
+    """Blocking completion for worker code (signal_engine). Returns the message text."""
+    r = _route(route)
+    deadline = time.monotonic() + (timeout or r.cfg["timeout"])
+    r.admit()
+    start = time.monotonic()
+    try:
+        if not r.thread_sem.acquire(timeout=max(0.0, deadline - time.monotonic())):
+            raise LLMSaturated(f"LLM route '{route}' saturated")
+        try:
+            attempt = 0
+            while True:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    raise LLMTimeout(f"LLM route '{route}' deadline exceeded")
+                try:
+                    text, usage = get_backend().complete(route, messages, model, remaining, **kwargs)
+                    break
+                except Exception as e:
+                    e = _as_timeout(e)
+                    if attempt >= MAX_RETRIES or not _is_retryable(e):
+                        raise e
+                    pause = _backoff(attempt)
+                    if time.monotonic() + pause >= deadline:
+                        raise e
+                    attempt += 1
+                    with r.lock:
+                        r.counts["retries"] += 1
+                    time.sleep(pause)
+        finally:
+            r.thread_sem.release()
+    except Exception as e:
+        r.record_failure(e)
+        raise
+    except BaseException:
+        r.record_cancelled()
+        raise
+    r.record_success(time.monotonic() - start, usage)
+    return text
+
+
+async def acomplete(route: str, messages: list, model: str = DEFAULT_MODEL, timeout: float = None, **kwargs) -> str:
+    """Async completion (API routes). Returns the message text."""
+    r = _route(route)
+    deadline = time.monotonic() + (timeout or r.cfg["timeout"])
+    r.admit()
+    start = time.monotonic()
+    try:
+        await _acquire(r, deadline)
+        try:
+            attempt = 0
+            while True:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    raise LLMTimeout(f"LLM route '{route}' deadline exceeded")
+                try:
+                    text, usage = await asyncio.wait_for(
+                        get_backend().acomplete(route, messages, model, remaining, **kwargs), remaining
+                    )
+                    break
+                except Exception as e:
+                    e = _as_timeout(e)
+                    if attempt >= MAX_RETRIES or not _is_retryable(e):
+                        raise e
+                    pause = _backoff(attempt)
+                    if time.monotonic() + pause >= deadline:
+                        raise e
+                    attempt += 1
+                    with r.lock:
+                        r.counts["retries"] += 1
+                    await asyncio.sleep(pause)
+        finally:
+            r.semaphore().release()
+    except Exception as e:
+        r.record_failure(e)
+        raise
+    except BaseException:
+        r.record_cancelled()
+        raise
+    r.record_success(time.monotonic() - start, usage)
+    return text
+
+
+async def astream(route: str, messages: list, model: str = DEFAULT_MODEL, timeout: float = None, **kwargs):
+    """
+    Async generator of text deltas. Retries only happen before the first token
+    (once output has reached the client a retry would duplicate it).
+    """
+    r = _route(route)
+    deadline = time.monotonic() + (timeout or r.cfg["timeout"])
+    r.admit()
+    start = time.monotonic()
+    usage_out = []
+    emitted = False
+    try:
+        await _acquire(r, deadline)
+        try:
+            attempt = 0
+            while True:
+                try:
+                    agen = get_backend().astream(route, messages, model, deadline - time.monotonic(), usage_out, **kwargs)
+                    try:
+                        while True:
+                            remaining = deadline - time.monotonic()
+                            if remaining <= 0:
+                                raise LLMTimeout(f"LLM route '{route}' deadline exceeded")
+                            try:
+                                delta = await asyncio.wait_for(agen.__anext__(), remaining)
+                            except StopAsyncIteration:
+                                break
+                            emitted = True
+                            yield delta
+                    finally:
+                        await agen.aclose()
+                    break
+                except Exception as e:
+                    e = _as_timeout(e)
+                    if emitted or attempt >= MAX_RETRIES or not _is_retryable(e):
+                        raise e
+                    pause = _backoff(attempt)
+                    if time.monotonic() + pause >= deadline:
+                        raise e
+                    attempt += 1
+                    with r.lock:
+                        r.counts["retries"] += 1
+                    await asyncio.sleep(pause)
+        finally:
+            r.semaphore().release()
+    except (GeneratorExit, asyncio.CancelledError):
+        # client disconnected: not the provider's fault, don't trip the breaker
+        r.record_success(time.monotonic() - start, usage_out[-1] if usage_out else None)
+        raise
+    except Exception as e:
+        r.record_failure(e)
+        raise
+    r.record_success(time.monotonic() - start, usage_out[-1] if usage_out else None)
+
+
+async def _acquire(r: _Route, deadline: float):
+    try:
+        await asyncio.wait_for(r.semaphore().acquire(), max(0.0, deadline - time.monotonic()))
+    except asyncio.TimeoutError:
+        raise LLMSaturated(f"LLM route '{r.name}' saturated")
+
+
+def _as_timeout(e: Exception) -> Exception:
+    if isinstance(e, (asyncio.TimeoutError, TimeoutError)) and not isinstance(e, LLMTimeout):
+        return LLMTimeout(str(e) or "LLM call timed out")
+    return e
+
+
+def llm_metrics() -> dict:
+    """Per-route counters, circuit state, p50/p95 latency and token totals."""
+    return {
+        "backend": LLM_BACKEND,
+        "routes": {name: r.snapshot() for name, r in list(_routes.items())},
+    }
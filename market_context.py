@@ -1,3 +1,7 @@
+import asyncio
+import json
+import os
+import time
 import requests
 
 def extract_symbol(text: str) -> str:
@@ -9,6 +13,192 @@ def extract_symbol(text: str) -> str:
     match = re.search(r"\$([a-zA-Z]{2,10})", text)
     return match.group(1).upper() if match else "BTC"
 
+# --- Background market context service ---
+# Per-symbol snapshots kept in memory, fed by Binance streams instead of 3 REST
+# calls per /chat request:
+#   spot   !ticker@arr      -> price / 24h change / high / low / quote volume
+#   perps  !markPrice@arr   -> funding rate
+#   REST   long/short ratio -> refreshed every LS_REFRESH_SECONDS for tracked symbols
+# get_market_context() is then a dict lookup + string format.
+#
+# A snapshot whose ticker is older than MAX_SNAPSHOT_AGE (stream down, or a symbol the
+# stream never sent) is served marked stale, and one background REST fetch per
+# symbol (at most every REST_RETRY_SECONDS) refills it; /metrics/market-context
+# counts both.
+
+SPOT_TICKER_WS = "wss://stream.binance.com:9443/ws/!ticker@arr"
+FUTURES_MARK_WS = "wss://fstream.binance.com/ws/!markPrice@arr@1s"
+LONG_SHORT_URL = "https://fapi.binance.com/futures/data/globalLongShortAccountRatio"
+LS_REFRESH_SECONDS = 300
+MAX_SNAPSHOT_AGE = float(os.getenv("MARKET_CONTEXT_MAX_AGE", "120"))
+REST_RETRY_SECONDS = 15
+
+# symbols we always refresh long/short for; chat lookups add to this set
+TRACKED = {"BTC", "ETH", "SOL", "XAU"}
+
+snapshots = {}      # "BTC" -> {"price", "change", "high", "low", "volume", "funding", "long_ratio", "short_ratio", ...}
+price_listeners = []  # fn(symbol, price) called on every spot ticker update (e.g. answer cache invalidation)
+_service_started = False
+_rest_attempts = {}   # symbol -> monotonic time of the last REST refill
+_rest_tasks = set()
+_stats = {"lookups": 0, "stale": 0, "missing": 0, "rest_refills": 0, "rest_errors": 0}
+
+
+def _snapshot(symbol: str) -> dict:
+    snap = snapshots.get(symbol)
+    if snap is None:
+        snap = snapshots[symbol] = {}
+    return snap
+
+
+def handle_ticker_batch(tickers: list):
+    for t in tickers:
+        s = t.get("s", "")
+        if not s.endswith("USDT"):
+            continue
+        snap = _snapshot(s[:-4])
+        snap.update({
+            "price": t.get("c", "N/A"),
+            "change": t.get("P", "N/A"),
+            "high": t.get("h", "N/A"),
+            "low": t.get("l", "N/A"),
+            "volume": t.get("q", "N/A"),
+            "ticker_at": t.get("E"),
+        })
+        if price_listeners and t.get("c"):
+            for fn in price_listeners:
+                try:
+                    fn(s[:-4], float(t["c"]))
+                except Exception as e:
+                    print(f"[market-context] price listener error: {e}")
+
+
+def handle_mark_price_batch(marks: list):
+    for m in marks:
+        s = m.get("s", "")
+        if not s.endswith("USDT") or m.get("r") in (None, ""):
+            continue
+        snap = _snapshot(s[:-4])
+        snap["funding"] = float(m["r"])
+        snap["funding_at"] = m.get("E")
+
+
+async def _stream_forever(url: str, handler, name: str):
+    import websockets
+    delay = 1
+    while True:
+        try:
+            async with websockets.connect(url, max_size=None, ping_interval=20) as ws:
+                print(f"📡 [market-context] {name} stream connected")
+                delay = 1
+                async for msg in ws:
+                    try:
+                        payload = json.loads(msg)
+                        handler(payload if isinstance(payload, list) else [payload])
+                    except Exception as e:
+                        print(f"[market-context] {name} parse error: {e}")
+        except Exception as e:
+            print(f"[market-context] {name} stream dropped ({e}); reconnecting in {delay}s")
+        await asyncio.sleep(delay)
+        delay = min(delay * 2, 60)
+
+
+async def _refresh_long_short_forever():
+    import httpx
+    async with httpx.AsyncClient(timeout=5) as http:
+        while True:
+            for symbol in list(TRACKED):
+                try:
+                    r = await http.get(LONG_SHORT_URL, params={"symbol": f"{symbol}USDT", "period": "5m", "limit": 1})
+                    if r.status_code == 200 and r.json():
+                        ls = r.json()[0]
+                        snap = _snapshot(symbol)
+                        snap["long_ratio"] = float(ls["longAccountRatio"])
+                        snap["short_ratio"] = float(ls["shortAccountRatio"])
+                except Exception as e:
+                    print(f"[market-context] long/short refresh failed for {symbol}: {e}")
+            await asyncio.sleep(LS_REFRESH_SECONDS)
+
+
+def start_market_context_service():
+    """Start the ticker / mark-price listeners and the long/short refresher on the running loop."""
+    global _service_started
+    if _service_started:
+        return
+    loop = asyncio.get_event_loop()
+    loop.create_task(_stream_forever(SPOT_TICKER_WS, handle_ticker_batch, "spot !ticker@arr"))
+    loop.create_task(_stream_forever(FUTURES_MARK_WS, handle_mark_price_batch, "futures !markPrice@arr"))
+    loop.create_task(_refresh_long_short_forever())
+    _service_started = True
+    print("📡 Market context service started")
+
+
+def snapshot_age(snap: dict):
+    """Seconds since the snapshot's last ticker (None: never had one)."""
+    ticker_at = snap.get("ticker_at")
+    if not ticker_at:
+        return None
+    return max(0.0, time.time() - ticker_at / 1000)
+
+
+def refill_from_rest(symbol: str) -> bool:
+    """Blocking: refresh one symbol's snapshot over REST (used when its stream data is stale)."""
+    try:
+        snap = fetch_snapshot_rest(symbol)
+    except Exception as e:
+        _stats["rest_errors"] += 1
+        print(f"[market-context] REST refill failed for {symbol}: {e}")
+        return False
+    if snap.get("price") in (None, "N/A"):
+        _stats["rest_errors"] += 1
+        return False
+    _snapshot(symbol).update(snap)
+    _stats["rest_refills"] += 1
+    return True
+
+
+def _schedule_refill(symbol: str):
+    now = time.monotonic()
+    if now - _rest_attempts.get(symbol, float("-inf")) < REST_RETRY_SECONDS:
+        return
+    _rest_attempts[symbol] = now
+    try:
+        loop = asyncio.get_running_loop()
+    except RuntimeError:
+        refill_from_rest(symbol)   # called from a worker thread: blocking is fine here
+        return
+    task = loop.create_task(asyncio.to_thread(refill_from_rest, symbol))
+    _rest_tasks.add(task)
+    task.add_done_callback(_rest_tasks.discard)
+
+
+def format_market_context(symbol: str, snap: dict, age: float = 0.0) -> str:
+    price = snap.get("price", "N/A")
+    change = snap.get("change", "N/A")
+    high = snap.get("high", "N/A")
+    low = snap.get("low", "N/A")
+    volume = snap.get("volume", "N/A")
+    funding = snap.get("funding", "N/A")
+    long_ratio = snap.get("long_ratio", "N/A")
+    short_ratio = snap.get("short_ratio", "N/A")
+
+    context = f"""
+<b>Live Market Context for ${symbol}</b><br>
+• Price: ${price}<br>
+• 24h Change: {change}%<br>
+• High: ${high} / Low: ${low}<br>
+• Volume (24h): ${volume}<br>
+• Funding Rate: {funding if funding != 'N/A' else 'N/A'}<br>
+• Long/Short Ratio: {long_ratio if long_ratio != 'N/A' else 'N/A'} Long / {short_ratio if short_ratio != 'N/A' else 'N/A'} Short
+""".strip()
+
+    if age is None:
+        context += "<br>• ⚠️ No live data for this symbol right now"
+    elif age > MAX_SNAPSHOT_AGE:
+        context += f"<br>• ⚠️ Stale: last update {int(age)}s ago"
+    return context
+
+
 def get_market_context(symbol: str = "BTC") -> str:
     """
     Returns a string summary with:
@@ -18,60 +208,77 @@ def get_market_context(symbol: str = "BTC") -> str:
     - Volume
     - Funding rate (if futures)
     - Long/Short ratio (if futures)
+
+    Served from the in-memory snapshot when the service is running (O(1), no I/O);
+    falls back to direct REST calls in processes that never started it (scripts).
+    A stale or missing snapshot is served marked as such while a REST refill runs.
     """
-    spot_symbol = f"{symbol}USDT"
-    price = "N/A"
-    change = "N/A"
-    high = "N/A"
-    low = "N/A"
-    volume = "N/A"
-    funding = "N/A"
-    long_ratio = "N/A"
-    short_ratio = "N/A"
+    if not _service_started:
+        return fetch_market_context_rest(symbol)
+    TRACKED.add(symbol)  # picked up by the next long/short refresh
+    _stats["lookups"] += 1
+    snap = snapshots.get(symbol, {})
+    age = snapshot_age(snap)
+    if age is None or age > MAX_SNAPSHOT_AGE:
+        _stats["missing" if age is None else "stale"] += 1
+        _schedule_refill(symbol)
+    return format_market_context(symbol, snap, age)
 
-    try:
-        # 24h ticker
-        ticker_res = requests.get(
-            f"https://api.binance.com/api/v3/ticker/24hr?symbol={spot_symbol}",
-            timeout=5
-        )
-        if ticker_res.ok:
-            t = ticker_res.json()
-            price = t.get("lastPrice", "N/A")
-            change = t.get("priceChangePercent", "N/A")
-            high = t.get("highPrice", "N/A")
-            low = t.get("lowPrice", "N/A")
-            volume = t.get("quoteVolume", "N/A")
-
-        # Funding rate
-        funding_res = requests.get(
-            f"https://fapi.binance.com/fapi/v1/fundingRate?symbol={spot_symbol}&limit=1",
-            timeout=5
-        )
-        if funding_res.ok:
-            funding = float(funding_res.json()[0]["fundingRate"])
-
-        # Long/Short ratio
-        ls_res = requests.get(
-            f"https://fapi.binance.com/futures/data/globalLongShortAccountRatio?symbol={spot_symbol}&period=5m&limit=1",
-            timeout=5
-        )
-        if ls_res.ok:
-            ls = ls_res.json()[0]
-            long_ratio = float(ls["longAccountRatio"])
-            short_ratio = float(ls["shortAccountRatio"])
 
+def market_context_stats() -> dict:
+    ages = {s: snapshot_age(snap) for s, snap in list(snapshots.items()) if s in TRACKED}
+    return {
+        **_stats,
+        "max_age_s": MAX_SNAPSHOT_AGE,
+        "symbols": len(snapshots),
+        "tracked_age_s": {s: round(a, 1) if a is not None else None for s, a in ages.items()},
+    }
+
+
+def fetch_market_context_rest(symbol: str = "BTC") -> str:
+    """Legacy path: three blocking REST calls. Only used outside the API process."""
+    try:
+        snap = fetch_snapshot_rest(symbol)
     except Exception as e:
         return f"**Market Context Unavailable**\nError: {str(e)}"
+    return format_market_context(symbol, snap)
 
-    context = f"""
-<b>Live Market Context for ${symbol}</b><br>
-• Price: ${price}<br>
-• 24h Change: {change}%<br>
-• High: ${high} / Low: ${low}<br>
-• Volume (24h): ${volume}<br>
-• Funding Rate: {funding if funding != 'N/A' else 'N/A'}<br>
-• Long/Short Ratio: {long_ratio if long_ratio != 'N/A' else 'N/A'} Long / {short_ratio if short_ratio != 'N/A' else 'N/A'} Short
-""".strip()
 
-    return context
+def fetch_snapshot_rest(symbol: str = "BTC") -> dict:
+    """Snapshot fields for one symbol from three blocking REST calls."""
+    spot_symbol = f"{symbol}USDT"
+    snap = {}
+
+    # 24h ticker
+    ticker_res = requests.get(
+        f"https://api.binance.com/api/v3/ticker/24hr?symbol={spot_symbol}",
+        timeout=5
+    )
+    if ticker_res.ok:
+        t = ticker_res.json()
+        snap["price"] = t.get("lastPrice", "N/A")
+        snap["change"] = t.get("priceChangePercent", "N/A")
+        snap["high"] = t.get("highPrice", "N/A")
+        snap["low"] = t.get("lowPrice", "N/A")
+        snap["volume"] = t.get("quoteVolume", "N/A")
+        snap["ticker_at"] = t.get("closeTime")
+
+    # Funding rate
+    funding_res = requests.get(
+        f"https://fapi.binance.com/fapi/v1/fundingRate?symbol={spot_symbol}&limit=1",
+        timeout=5
+    )
+    if funding_res.ok:
+        snap["funding"] = float(funding_res.json()[0]["fundingRate"])
+
+    # Long/Short ratio
+    ls_res = requests.get(
+        f"https://fapi.binance.com/futures/data/globalLongShortAccountRatio?symbol={spot_symbol}&period=5m&limit=1",
+        timeout=5
+    )
+    if ls_res.ok:
+        ls = ls_res.json()[0]
+        snap["long_ratio"] = float(ls["longAccountRatio"])
+        snap["short_ratio"] = float(ls["shortAccountRatio"])
+
+    return snap
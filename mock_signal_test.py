@@ -1,27 +1,15 @@
 # mock_signal_test.py
+# Runs against the in-memory backend unless HYPEWAVE_STORAGE=mongo is set explicitly,
+# so it no longer writes mock trades into the production collections.
+import os
+os.environ.setdefault("HYPEWAVE_STORAGE", "memory")
+
 from winrate_checker import get_winrate, update_winrate
 from datetime import datetime, timezone
-from bson import ObjectId
-from db import client  # ✅ Use correct MongoDB client from .env
-from winrate_checker import simulate_bulk_winrate_tests
-
-
+from storage import get_storage
 
-signals = client["hypewave"]["signals"]
 
-print("\n[🧪] Inserting 2 mock trades manually...")
-
-# === Local insert version of log_signal ===
-def log_signal_direct(user_id: str, input_data: dict, output_data: dict, extra_meta: dict = None):
-    entry = {
-        "user_id": user_id,
-        "input": input_data,
-        "output": output_data,
-        "created_at": datetime.now(timezone.utc)
-    }
-    if extra_meta:
-        entry.update(extra_meta)
-    signals.insert_one(entry)
+print(f"\n[🧪] Inserting 2 mock trades manually... (storage: {os.environ['HYPEWAVE_STORAGE']})")
 
 # Trade 1: WIN
 trade_1 = {
@@ -55,8 +43,9 @@ trade_2 = {
     }
 }
 
-log_signal_direct("test", trade_1["input"], trade_1["output"], extra_meta={"status": "WIN", "resolved_at": datetime.now(timezone.utc)})
-log_signal_direct("test", trade_2["input"], trade_2["output"], extra_meta={"status": "LOSS", "resolved_at": datetime.now(timezone.utc)})
+storage = get_storage()
+storage.log_signal("test", trade_1["input"], trade_1["output"], extra_meta={"status": "WIN", "resolved_at": datetime.now(timezone.utc)})
+storage.log_signal("test", trade_2["input"], trade_2["output"], extra_meta={"status": "LOSS", "resolved_at": datetime.now(timezone.utc)})
 
 # Fake finalize for test purposes
 update_winrate(True)   # WIN
@@ -70,4 +59,8 @@ print(f"Wins: {winrate['wins']}")
 print(f"Winrate: {winrate['winrate']}%")
 
 # === Optional Bulk Simulation ===
-simulate_bulk_winrate_tests(50, 0.6)
+total, win_ratio = 50, 0.6
+print(f"\n[🧪] Simulating {total} trades with ~{int(win_ratio * 100)}% winrate...")
+for i in range(total):
+    update_winrate(i < int(total * win_ratio))
+print(f"Final: {get_winrate()}")
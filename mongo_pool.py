@@ -0,0 +1,219 @@
+# mongo_pool.py
+# One place that builds MongoDB clients. Every process (API, tracker, scrapers,
+# monitors) asks for a named profile instead of calling MongoClient() itself,
+# so pool sizing, timeouts, compression and read preference are tuned together.
+#
+# Profiles:
+#   api     -> request handlers (largest pool, fail fast on saturation)
+#   feed    -> public read-only feeds; secondaryPreferred offloads the primary
+#   worker  -> long-running background processes (tracker, closer, monitors)
+#   script  -> one-shot CLIs / cron jobs
+#
+# Any knob can be overridden per profile from the env, e.g.
+#   MONGO_API_MAX_POOL_SIZE=200  MONGO_FEED_READ_PREFERENCE=secondary
+# and MONGO_COMPRESSORS applies to all profiles (add "snappy" if python-snappy is installed).
+
+import os
+import threading
+from collections import deque
+
+from dotenv import load_dotenv
+from pymongo import AsyncMongoClient, MongoClient, monitoring
+from pymongo.server_api import ServerApi
+
+load_dotenv()
+
+MONGO_URI = os.getenv("MONGO_DB_URI")
+DEFAULT_PROFILE = os.getenv("MONGO_PROFILE", "api")
+
+COMMON = {
+    "compressors": os.getenv("MONGO_COMPRESSORS", "zstd,zlib"),
+    "zlibCompressionLevel": 6,
+    "serverSelectionTimeoutMS": 5000,
+    "connectTimeoutMS": 5000,
+    "socketTimeoutMS": 20000,
+    "maxIdleTimeMS": 60000,
+    "retryWrites": True,
+    "retryReads": True,
+}
+
+PROFILES = {
+    "api":    {"maxPoolSize": 100, "minPoolSize": 10, "waitQueueTimeoutMS": 2000, "readPreference": "primary"},
+    "feed":   {"maxPoolSize": 50, "minPoolSize": 5, "waitQueueTimeoutMS": 2000,
+               "readPreference": "secondaryPreferred", "maxStalenessSeconds": 120},
+    "worker": {"maxPoolSize": 20, "minPoolSize": 2, "waitQueueTimeoutMS": 10000, "readPreference": "primary"},
+    "script": {"maxPoolSize": 5, "minPoolSize": 0, "waitQueueTimeoutMS": 30000,
+               "serverSelectionTimeoutMS": 15000, "readPreference": "primary"},
+}
+
+_ENV_KEYS = {
+    "maxPoolSize": int,
+    "minPoolSize": int,
+    "waitQueueTimeoutMS": int,
+    "serverSelectionTimeoutMS": int,
+    "connectTimeoutMS": int,
+    "socketTimeoutMS": int,
+    "maxStalenessSeconds": int,
+    "readPreference": str,
+}
+
+
+def _snake_upper(key: str) -> str:
+    out = "".join(f"_{c}" if c.isupper() else c for c in key)
+    return out.upper().replace("_M_S", "_MS")
+
+
+def profile_options(profile: str) -> dict:
+    """Merged client kwargs for a profile (COMMON < PROFILES[profile] < env overrides)."""
+    if profile not in PROFILES:
+        raise ValueError(f"Unknown Mongo profile: {profile!r} (expected one of {sorted(PROFILES)})")
+    opts = {**COMMON, **PROFILES[profile]}
+    for key, cast in _ENV_KEYS.items():
+        val = os.getenv(f"MONGO_{profile.upper()}_{_snake_upper(key)}")
+        if val:
+            opts[key] = cast(val)
+    if opts.get("readPreference") == "primary":
+        opts.pop("maxStalenessSeconds", None)  # only valid with secondary reads
+    opts["appname"] = f"hypewave-{profile}"
+    return opts
+
+
+# --- Pool metrics ---
+
+class PoolMetrics(monitoring.ConnectionPoolListener):
+    """Checkout / wait / saturation counters for one profile's pool(s)."""
+
+    def __init__(self, profile: str, window: int = 2048):
+        self.profile = profile
+        self._lock = threading.Lock()
+        self._waits_ms = deque(maxlen=window)
+        self.checkout_started = 0
+        self.checked_out = 0
+        self.checked_in = 0
+        self.checkout_failed = {}
+        self.connections_created = 0
+        self.connections_closed = 0
+        self.pools_cleared = 0
+
+    # waiting = started but not yet resolved; in_use = out but not back
+    def snapshot(self) -> dict:
+        with self._lock:
+            waits = sorted(self._waits_ms)
+            failed = sum(self.checkout_failed.values())
+            return {
+                "profile": self.profile,
+                "checkouts": self.checked_out,
+                "checkout_failed": dict(self.checkout_failed),
+                "in_use": self.checked_out - self.checked_in,
+                "waiting": self.checkout_started - self.checked_out - failed,
+                "open_connections": self.connections_created - self.connections_closed,
+                "pools_cleared": self.pools_cleared,
+                "wait_ms_p50": _pct(waits, 0.50),
+                "wait_ms_p95": _pct(waits, 0.95),
+                "wait_ms_max": waits[-1] if waits else 0.0,
+            }
+
+    def pool_created(self, event):
+        pass
+
+    def pool_ready(self, event):
+        pass
+
+    def pool_cleared(self, event):
+        with self._lock:
+            self.pools_cleared += 1
+
+    def pool_closed(self, event):
+        pass
+
+    def connection_created(self, event):
+        with self._lock:
+            self.connections_created += 1
+
+    def connection_ready(self, event):
+        pass
+
+    def connection_closed(self, event):
+        with self._lock:
+            self.connections_closed += 1
+
+    def connection_check_out_started(self, event):
+        with self._lock:
+            self.checkout_started += 1
+
+    def connection_check_out_failed(self, event):
+        with self._lock:
+            self.checkout_failed[event.reason] = self.checkout_failed.get(event.reason, 0) + 1
+            if event.duration is not None:
+                self._waits_ms.append(event.duration * 1000)
+
+    def connection_checked_out(self, event):
+        with self._lock:
+            self.checked_out += 1
+            if event.duration is not None:
+                self._waits_ms.append(event.duration * 1000)
+
+    def connection_checked_in(self, event):
+        with self._lock:
+            self.checked_in += 1
+
+
+def _pct(sorted_vals: list, q: float) -> float:
+    if not sorted_vals:
+        return 0.0
+    return round(sorted_vals[min(len(sorted_vals) - 1, int(q * len(sorted_vals)))], 3)
+
+
+# --- Factory ---
+
+_lock = threading.Lock()
+_clients = {}
+_metrics = {}
+
+
+def _metrics_for(label: str) -> PoolMetrics:
+    if label not in _metrics:
+        _metrics[label] = PoolMetrics(label)
+    return _metrics[label]
+
+
+def get_client(profile: str = DEFAULT_PROFILE, uri: str = None) -> MongoClient:
+    """Process-wide sync client for a profile. connect=False: no monitor threads or sockets until first use."""
+    key = ("sync", profile, uri)
+    with _lock:
+        if key not in _clients:
+            _clients[key] = MongoClient(
+                uri or MONGO_URI,
+                server_api=ServerApi('1'),
+                connect=False,
+                event_listeners=[_metrics_for(profile)],
+                **profile_options(profile),
+            )
+        return _clients[key]
+
+
+def get_async_client(profile: str = DEFAULT_PROFILE, uri: str = None) -> AsyncMongoClient:
+    """Async counterpart for code running on the API event loop."""
+    key = ("async", profile, uri)
+    with _lock:
+        if key not in _clients:
+            _clients[key] = AsyncMongoClient(
+                uri or MONGO_URI,
+                server_api=ServerApi('1'),
+                connect=False,
+                event_listeners=[_metrics_for(f"{profile}:async")],
+                **profile_options(profile),
+            )
+        return _clients[key]
+
+
+def pool_metrics() -> dict:
+    """Snapshot of every pool used in this process ("api", "api:async", ...), plus its config."""
+    out = {}
+    for label, m in list(_metrics.items()):
+        snap = m.snapshot()
+        opts = profile_options(label.split(":")[0])
+        snap["max_pool_size"] = opts["maxPoolSize"]
+        snap["saturation"] = round(snap["in_use"] / opts["maxPoolSize"], 3) if opts["maxPoolSize"] else None
+        out[label] = snap
+    return out
@@ -0,0 +1,204 @@
+# news_feed.py
+# Read path for /news/latest: N source collections merged newest-first.
+#
+# Paging   every source is sorted on (date desc, _id desc) and cut at the same
+#          opaque `before` cursor (cursors.py); the sorted runs are fetched in
+#          parallel and lazily k-way merged (heapq.merge), so a page costs one
+#          bounded index scan per source at any depth.
+# Head     the newest HEAD_SIZE items live in memory. A change stream over the
+#          source collections (ingestion runs in other processes) feeds ingest()
+#          / remove(), so the first page is served with no DB round trip. Where
+#          change streams aren't available, the head is reloaded every
+#          HEAD_REFRESH_SECONDS instead. `listeners` see every streamed change
+#          (event_broker pushes them to SSE clients).
+# Avatars  resolved from a per-source table (latest known avatar_url), warmed at
+#          startup and updated on ingest, instead of rescanning every page.
+
+import asyncio
+import heapq
+import os
+import threading
+from datetime import datetime
+from itertools import islice
+
+from cursors import encode_cursor, keyset_filter
+from db import format_news_doc
+
+SOURCES = [s.strip() for s in os.getenv("NEWS_SOURCES", "telegram_news,truthsocial_news").split(",") if s.strip()]
+HEAD_SIZE = int(os.getenv("NEWS_HEAD_SIZE", "100"))
+HEAD_REFRESH_SECONDS = float(os.getenv("NEWS_HEAD_REFRESH", "5"))
+MAX_PAGE = 100
+
+NEWS_PROJECTION = {"text": 1, "link": 1, "date": 1, "source": 1, "display_name": 1,
+                   "media_url": 1, "media": 1, "avatar_url": 1, "album_id": 1}
+_SORT = [("date", -1), ("_id", -1)]
+
+
+def _key(doc: dict):
+    return (doc.get("date") or datetime.min, doc["_id"])
+
+
+class NewsFeed:
+    def __init__(self, db=None, sources: list = None, head_size: int = HEAD_SIZE):
+        self._db = db
+        self.sources = sources or SOURCES
+        self.head_size = head_size
+        self._lock = threading.Lock()
+        self._head = []            # raw docs, newest first
+        self._head_ids = set()
+        self._head_ready = False   # False until loaded, and while the change feed is down
+        self._avatars = {}         # source -> latest avatar_url
+        self.listeners = []        # fn(op, item) for every change seen on the stream (event_broker)
+        self._stats = {"head_pages": 0, "db_pages": 0, "ingested": 0, "removed": 0,
+                       "head_reloads": 0, "stream_errors": 0}
+
+    @property
+    def db(self):
+        if self._db is None:
+            import db_async as adb
+            self._db = adb.feed_db
+        return self._db
+
+    # --- reads ---
+
+    async def page(self, before: str = None, limit: int = 24) -> tuple[list, str]:
+        """(items, next_before). The first page comes from memory when the head is live."""
+        limit = max(1, min(limit, MAX_PAGE))
+        if before is None and self._head_ready and limit <= self.head_size:
+            with self._lock:
+                docs = self._head[:limit]
+            self._stats["head_pages"] += 1
+        else:
+            docs = await self._merged(before, limit)
+            self._stats["db_pages"] += 1
+        return self._format(docs), self._next_before(docs, limit)
+
+    async def _merged(self, before: str, limit: int) -> list:
+        flt = keyset_filter(before, "date") if before else {}
+        runs = await asyncio.gather(*(
+            self.db[name].find(flt, NEWS_PROJECTION).sort(_SORT).limit(limit).to_list(length=limit)
+            for name in self.sources
+        ))
+        # each run is already sorted: lazy k-way merge, stop after `limit`
+        return list(islice(heapq.merge(*runs, key=_key, reverse=True), limit))
+
+    def _format(self, docs: list) -> list:
+        return [format_news_doc(d, self._avatars.get(d.get("source"))) for d in docs]
+
+    @staticmethod
+    def _next_before(docs: list, limit: int):
+        if len(docs) == limit and docs[-1].get("date"):
+            return encode_cursor(docs[-1]["date"], docs[-1]["_id"])
+        return None
+
+    # --- head maintenance ---
+
+    def ingest(self, doc: dict):
+        """New or updated news doc (album parts, edits): upsert it into the head."""
+        if doc.get("source") and doc.get("avatar_url"):
+            self._avatars[doc["source"]] = doc["avatar_url"]
+        doc = {k: doc.get(k) for k in ("_id", *NEWS_PROJECTION) if k in doc}
+        with self._lock:
+            if doc["_id"] in self._head_ids:
+                self._head = [d for d in self._head if d["_id"] != doc["_id"]]
+            elif len(self._head) >= self.head_size and _key(doc) <= _key(self._head[-1]):
+                return  # older than anything on the head
+            # newest-first, HEAD_SIZE items: a linear walk is cheaper than keeping a key list in sync
+            i = 0
+            while i < len(self._head) and _key(self._head[i]) > _key(doc):
+                i += 1
+            self._head.insert(i, doc)
+            self._head_ids.add(doc["_id"])
+            while len(self._head) > self.head_size:
+                self._head_ids.discard(self._head.pop()["_id"])
+            self._stats["ingested"] += 1
+
+    def _notify(self, op: str, doc: dict):
+        if not self.listeners:
+            return
+        item = self._format([doc])[0]
+        for fn in self.listeners:
+            try:
+                fn(op, item)
+            except Exception as e:
+                print(f"[news] listener error: {e}")
+
+    def remove(self, _id):
+        with self._lock:
+            if _id in self._head_ids:
+                self._head = [d for d in self._head if d["_id"] != _id]
+                self._head_ids.discard(_id)
+                self._stats["removed"] += 1
+                self._head_ready = False  # a slot opened up: refill from the DB on the next reload
+
+    async def reload(self):
+        docs = await self._merged(None, self.head_size)
+        with self._lock:
+            self._head = docs
+            self._head_ids = {d["_id"] for d in docs}
+            self._head_ready = True
+        self._stats["head_reloads"] += 1
+
+    async def warm_avatars(self):
+        """Latest avatar_url per source, once per collection."""
+        pipeline = [
+            {"$match": {"avatar_url": {"$type": "string"}}},
+            {"$sort": {"date": -1}},
+            {"$group": {"_id": "$source", "avatar_url": {"$first": "$avatar_url"}}},
+        ]
+        for name in self.sources:
+            cursor = await self.db[name].aggregate(pipeline)
+            async for row in cursor:
+                if row["_id"]:
+                    self._avatars.setdefault(row["_id"], row["avatar_url"])
+
+    async def follow_forever(self):
+        """Keep the head live: change stream over the sources, polling reload as fallback."""
+        try:
+            await self.warm_avatars()
+        except Exception as e:
+            print(f"[news] avatar warm failed: {e}")
+        pipeline = [{"$match": {"ns.coll": {"$in": self.sources}}}]
+        while True:
+            try:
+                async with await self.db.watch(pipeline, full_document="updateLookup") as stream:
+                    await self.reload()  # after the stream is open, so no change falls in between
+                    print(f"📰 [news] head live ({len(self._head)} items, {len(self.sources)} sources)")
+                    async for change in stream:
+                        op = change["operationType"]
+                        if op in ("insert", "update", "replace") and change.get("fullDocument"):
+                            self.ingest(change["fullDocument"])
+                            self._notify(op, change["fullDocument"])
+                        elif op == "delete":
+                            self.remove(change["documentKey"]["_id"])
+                            if not self._head_ready:
+                                await self.reload()
+                        elif op in ("drop", "rename", "dropDatabase", "invalidate"):
+                            break
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                self._stats["stream_errors"] += 1
+                if self._stats["stream_errors"] == 1:
+                    print(f"[news] change stream unavailable, polling every {HEAD_REFRESH_SECONDS}s: {e}")
+                try:
+                    await self.reload()
+                except Exception as e:
+                    self._head_ready = False
+                    print(f"[news] head reload failed: {e}")
+            await asyncio.sleep(HEAD_REFRESH_SECONDS)
+
+    def stats(self) -> dict:
+        s = dict(self._stats)
+        with self._lock:
+            s["head_items"] = len(self._head)
+        s["head_ready"] = self._head_ready
+        s["sources"] = list(self.sources)
+        s["avatars"] = len(self._avatars)
+        pages = s["head_pages"] + s["db_pages"]
+        s["head_hit_rate"] = round(s["head_pages"] / pages, 3) if pages else None
+        return s
+
+
+# Process-wide feed used by api.py
+news_feed = NewsFeed()
@@ -0,0 +1,120 @@
+# password_pool.py
+# Dedicated, bounded worker pool for bcrypt (register / login / password change).
+#
+# bcrypt costs ~0.25s of CPU per call at 12 rounds. Run through FastAPI's default
+# threadpool, a burst of logins holds every one of its tokens and every sync
+# endpoint queues behind them. Here hashing gets its own pool instead:
+#
+#   workers   HASH_POOL_WORKERS threads (HASH_POOL=process for processes); at most
+#             that many bcrypt calls run at once, whatever the login rate.
+#   queue     up to HASH_MAX_QUEUE callers wait for a worker, each for at most
+#             HASH_QUEUE_TIMEOUT seconds; beyond either, 503 + Retry-After
+#             instead of an ever-growing backlog.
+#   rehash    verify() also returns a new hash when the stored one was made with
+#             another BCRYPT_ROUNDS, computed in the same worker call.
+
+import asyncio
+import os
+import threading
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+from fastapi import HTTPException
+
+from auth_utils import hash_password, verify_and_update_password
+
+POOL_KIND = os.getenv("HASH_POOL", "thread")
+POOL_WORKERS = int(os.getenv("HASH_POOL_WORKERS", str(max(1, min(2, (os.cpu_count() or 1) // 2)))))
+MAX_QUEUE = int(os.getenv("HASH_MAX_QUEUE", "64"))
+QUEUE_TIMEOUT = float(os.getenv("HASH_QUEUE_TIMEOUT", "5"))
+
+
+def _busy(retry_after: float):
+    return HTTPException(
+        status_code=503,
+        detail="Too many sign-ins right now, try again shortly.",
+        headers={"Retry-After": str(max(1, int(retry_after + 0.999)))},
+    )
+
+
+class PasswordPool:
+    def __init__(self, workers: int = POOL_WORKERS, max_queue: int = MAX_QUEUE,
+                 queue_timeout: float = QUEUE_TIMEOUT, kind: str = POOL_KIND):
+        self.workers = workers
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self.kind = kind
+        self._pool = None
+        self._pool_lock = threading.Lock()
+        self._slots = None        # asyncio.Semaphore(workers), made on first use (needs the loop)
+        self.waiting = 0
+        self.busy = 0
+        self._waits = deque(maxlen=1000)    # seconds spent queued, recent calls
+        self._stats = {"hashed": 0, "verified": 0, "rehashed": 0, "failed_verifies": 0,
+                       "shed_queue_full": 0, "queue_timeouts": 0, "work_s_total": 0.0}
+
+    def _get_pool(self):
+        if self._pool is None:
+            with self._pool_lock:
+                if self._pool is None:
+                    cls = ProcessPoolExecutor if self.kind == "process" else ThreadPoolExecutor
+                    self._pool = cls(max_workers=self.workers)
+        return self._pool
+
+    async def _run(self, fn, *args):
+        if self._slots is None:
+            self._slots = asyncio.Semaphore(self.workers)
+        if self.waiting >= self.max_queue + max(0, self.workers - self.busy):
+            self._stats["shed_queue_full"] += 1
+            raise _busy(self.queue_timeout)
+        self.waiting += 1
+        t0 = time.monotonic()
+        try:
+            await asyncio.wait_for(self._slots.acquire(), self.queue_timeout)
+        except asyncio.TimeoutError:
+            self._stats["queue_timeouts"] += 1
+            raise _busy(self.queue_timeout)
+        finally:
+            self.waiting -= 1
+        t1 = time.monotonic()
+        self._waits.append(t1 - t0)
+        self.busy += 1
+        try:
+            return await asyncio.get_running_loop().run_in_executor(self._get_pool(), fn, *args)
+        finally:
+            self.busy -= 1
+            self._stats["work_s_total"] += time.monotonic() - t1
+            self._slots.release()
+
+    async def hash(self, password: str) -> str:
+        h = await self._run(hash_password, password)
+        self._stats["hashed"] += 1
+        return h
+
+    async def verify(self, password: str, hashed: str):
+        """(matches, new hash or None). Persist the new hash when there is one."""
+        ok, new_hash = await self._run(verify_and_update_password, password, hashed)
+        self._stats["verified"] += 1
+        if not ok:
+            self._stats["failed_verifies"] += 1
+        if new_hash:
+            self._stats["rehashed"] += 1
+        return ok, new_hash
+
+    def stats(self) -> dict:
+        s = dict(self._stats)
+        waits = sorted(self._waits)
+        calls = s["hashed"] + s["verified"]
+        s["pool"] = f"{self.kind}x{self.workers}"
+        s["waiting"] = self.waiting
+        s["busy"] = self.busy
+        s["queue_wait_ms_p50"] = round(waits[len(waits) // 2] * 1000, 1) if waits else None
+        s["queue_wait_ms_p95"] = round(waits[int(len(waits) * 0.95)] * 1000, 1) if waits else None
+        s["avg_bcrypt_ms"] = round(s["work_s_total"] / calls * 1000, 1) if calls else None
+        s["work_s_total"] = round(s["work_s_total"], 2)
+        return s
+
+
+# Process-wide pool used by auth_routes.py
+passwords = PasswordPool()
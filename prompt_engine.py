@@ -1,3 +1,8 @@
+import os
+import threading
+import time
+
+
 def build_chart_prompt(bias: str, timeframe: str, intent: str) -> str:
     return f"""
     You are Hypewave AI — a pro CT trader.
@@ -18,4 +23,146 @@ def build_chart_prompt(bias: str, timeframe: str, intent: str) -> str:
     Entry Zone: [Price or range]
     Invalidation: [Stop level]
     Notes: [One-line tactical insight]
-    """
\ No newline at end of file
+    """
+
+# --- /chat prompt layout ---
+# Ordered for provider prompt caching (OpenAI caches the longest shared prefix):
+#   1. CHAT_STATIC_PREFIX     identical for every request
+#   2. per-symbol market block rebuilt at most every SYMBOL_BLOCK_TTL seconds and
+#                              shared by every user asking about that symbol
+#   3. conversation memory     per user (chat_memory.py), bounded by its token budget
+#   4. the user's message      always last
+# Anything volatile placed before the static text would make every prompt unique.
+# Note: 1 + 2 come to ~250 tokens today, under PROVIDER_CACHE_MIN_TOKENS, so the
+# provider caches nothing yet (cacheable_tokens stays 0 under "prompt" in /metrics/llm); the
+# order only starts paying once the shared prefix grows past that threshold.
+
+SYMBOL_BLOCK_TTL = float(os.getenv("PROMPT_SYMBOL_BLOCK_TTL", "15"))
+PROVIDER_CACHE_MIN_TOKENS = 1024   # OpenAI: prompts shorter than this are never cached
+PROVIDER_CACHE_INCREMENT = 128     # ...and hits are counted in 128-token steps
+
+CHAT_STATIC_PREFIX = """
+You are Hypewave AI, your friendly trading assistant.
+
+Goals:
+- Answer any trading or market-related question confidently.
+- Reference live market data.
+- Offer clear and actionable insights.
+- Format responses in markdown with clear sections.
+
+The next system message holds the live data for the symbol the user is asking about.
+""".strip()
+
+try:
+    import tiktoken
+    _enc = tiktoken.get_encoding("o200k_base")
+
+    def count_tokens(text: str) -> int:
+        return len(_enc.encode(text))
+except ImportError:  # optional: fall back to the usual ~4 chars/token estimate
+    def count_tokens(text: str) -> int:
+        return max(1, len(text) // 4)
+
+_PREFIX_TOKENS = count_tokens(CHAT_STATIC_PREFIX)
+
+_block_lock = threading.Lock()
+_symbol_blocks = {}  # symbol -> (built_at_monotonic, text, tokens)
+_prompt_stats = {"builds": 0, "block_hits": 0, "block_rebuilds": 0,
+                 "prompt_tokens": 0, "stable_prefix_tokens": 0, "cacheable_tokens": 0}
+
+
+def build_symbol_block(symbol: str) -> str:
+    """Live price summary + market context for one symbol (uncached)."""
+    from market_data_ws import get_latest_ohlc
+    from market_context import get_market_context
+
+    ohlc_list = get_latest_ohlc(f"{symbol}USDT", "1h") or []
+    price_data = ohlc_list[-1] if isinstance(ohlc_list, list) and ohlc_list else {}
+
+    price_summary = (
+        f"**Live Price Data for ${symbol}:**\n"
+        f"- Price: ${price_data.get('close', 'N/A')}\n"
+        f"- Open: {price_data.get('open', 'N/A')} | High: {price_data.get('high', 'N/A')} | Low: {price_data.get('low', 'N/A')}\n"
+        f"- Volume: {price_data.get('volume', 'N/A')}\n"
+    )
+    return f"""
+**Live Data Summary:**
+{price_summary}
+
+**Market Context:**
+{get_market_context(symbol)}
+""".strip()
+
+
+def get_symbol_block(symbol: str) -> tuple[str, int, bool]:
+    """(text, tokens, cache_hit). Rebuilt at most every SYMBOL_BLOCK_TTL seconds per symbol."""
+    now = time.monotonic()
+    entry = _symbol_blocks.get(symbol)
+    if entry and now - entry[0] < SYMBOL_BLOCK_TTL:
+        return entry[1], entry[2], True
+    with _block_lock:
+        entry = _symbol_blocks.get(symbol)  # another thread may have rebuilt it meanwhile
+        if entry and now - entry[0] < SYMBOL_BLOCK_TTL:
+            return entry[1], entry[2], True
+        text = build_symbol_block(symbol)
+        entry = (now, text, count_tokens(text))
+        _symbol_blocks[symbol] = entry
+    return entry[1], entry[2], False
+
+
+def provider_cacheable(stable_tokens: int, total_tokens: int) -> int:
+    if total_tokens < PROVIDER_CACHE_MIN_TOKENS or stable_tokens < PROVIDER_CACHE_MIN_TOKENS:
+        return 0
+    extra = stable_tokens - PROVIDER_CACHE_MIN_TOKENS
+    return PROVIDER_CACHE_MIN_TOKENS + extra - extra % PROVIDER_CACHE_INCREMENT
+
+
+def build_chat_messages(symbol: str, user_text: str, extra_user_parts: list | None = None,
+                        history: list | None = None) -> tuple[list, dict]:
+    """
+    Messages for /chat in cache-friendly order, plus per-request prompt stats:
+    stable_prefix_tokens (static prefix + shared symbol block) and the part of
+    it the provider can actually cache.
+    """
+    block, block_tokens, hit = get_symbol_block(symbol)
+    user_tokens = count_tokens(user_text)
+    history = history or []
+    history_tokens = sum(count_tokens(m["content"]) for m in history)
+
+    messages = [
+        {"role": "system", "content": CHAT_STATIC_PREFIX},
+        {"role": "system", "content": block},
+        *history,
+    ]
+    if extra_user_parts:
+        messages.append({"role": "user", "content": [{"type": "text", "text": user_text}, *extra_user_parts]})
+    else:
+        messages.append({"role": "user", "content": user_text})
+
+    stable = _PREFIX_TOKENS + block_tokens
+    total = stable + history_tokens + user_tokens
+    stats = {
+        "symbol": symbol,
+        "prompt_tokens": total,
+        "stable_prefix_tokens": stable,
+        "cacheable_tokens": provider_cacheable(stable, total),
+        "history_tokens": history_tokens,
+        "symbol_block_cached": hit,
+    }
+    with _block_lock:
+        _prompt_stats["builds"] += 1
+        _prompt_stats["block_hits" if hit else "block_rebuilds"] += 1
+        _prompt_stats["prompt_tokens"] += total
+        _prompt_stats["stable_prefix_tokens"] += stable
+        _prompt_stats["cacheable_tokens"] += stats["cacheable_tokens"]
+    return messages, stats
+
+
+def prompt_metrics() -> dict:
+    with _block_lock:
+        s = dict(_prompt_stats)
+    s["symbol_block_ttl_s"] = SYMBOL_BLOCK_TTL
+    s["static_prefix_tokens"] = _PREFIX_TOKENS
+    s["provider_cache_min_tokens"] = PROVIDER_CACHE_MIN_TOKENS
+    s["stable_fraction"] = round(s["stable_prefix_tokens"] / s["prompt_tokens"], 3) if s["prompt_tokens"] else None
+    return s
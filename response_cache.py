@@ -0,0 +1,248 @@
+# response_cache.py
+# Shared response cache for public GET endpoints (same bytes for every caller).
+#
+# ASGI middleware in front of the routes listed in ROUTE_TTLS:
+#   - key = path + the route's own query params (ROUTE_PARAMS; anything else is
+#     ignored by the route, so it's left out of the key); entries live for the route's TTL
+#   - bounded by entry count and by total body bytes (RESPONSE_CACHE_MAX_BYTES)
+#   - single-flight: concurrent misses on one key share one computation
+#   - ETag on every cached route, If-None-Match -> 304 with no body
+#   - Cache-Control: public, max-age=<seconds left>, so clients/CDNs can reuse it
+#   - invalidate(route, ...) for writers; a computation that started before an
+#     invalidation isn't stored (it may have read the old data)
+# Only 200s without a top-level "error" are stored. Per-route hit ratio and
+# bytes saved are in stats() (/metrics/response-cache).
+
+import asyncio
+import hashlib
+import os
+import time
+from collections import OrderedDict
+from urllib.parse import parse_qsl, urlencode
+
+ROUTE_TTLS = {
+    "/economic-calendar": float(os.getenv("CACHE_TTL_CALENDAR", "300")),   # scraper writes weekly
+    "/news/latest": float(os.getenv("CACHE_TTL_NEWS", "5")),
+    "/signals/latest": float(os.getenv("CACHE_TTL_SIGNALS", "10")),
+    "/signals/winrate": float(os.getenv("CACHE_TTL_WINRATE", "30")),
+    "/alerts/live": float(os.getenv("CACHE_TTL_ALERTS", "10")),
+}
+# query params each route reads; the rest can't change the response
+ROUTE_PARAMS = {
+    "/economic-calendar": ("offset",),
+    "/news/latest": ("limit", "before"),
+    "/signals/latest": ("skip", "limit", "min_confidence", "before", "fields"),
+    "/signals/winrate": (),
+    "/alerts/live": ("limit",),
+}
+MAX_ENTRIES = int(os.getenv("RESPONSE_CACHE_MAX_ENTRIES", "2000"))
+MAX_BODY_BYTES = int(os.getenv("RESPONSE_CACHE_MAX_BODY", str(1024 * 1024)))
+MAX_BYTES = int(os.getenv("RESPONSE_CACHE_MAX_BYTES", str(64 * 1024 * 1024)))
+KEPT_HEADERS = {b"content-type", b"x-next-before"}   # replayed from the original response
+
+# which live events (event_broker kinds) make which routes stale
+ROUTES_BY_EVENT = {
+    "news": ("/news/latest",),
+    "signal": ("/signals/latest", "/signals/winrate"),
+    "alert": ("/alerts/live",),
+}
+
+
+def _etag(body: bytes) -> bytes:
+    return b'"' + hashlib.blake2b(body, digest_size=12).hexdigest().encode() + b'"'
+
+
+def _etag_matches(if_none_match: bytes, etag: bytes) -> bool:
+    if if_none_match.strip() == b"*":
+        return True
+    for tag in if_none_match.split(b","):
+        tag = tag.strip()
+        if tag.startswith(b"W/"):
+            tag = tag[2:]
+        if tag == etag:
+            return True
+    return False
+
+
+class _Entry:
+    __slots__ = ("route", "body", "headers", "etag", "expires")
+
+    def __init__(self, route, body, headers, etag, expires):
+        self.route = route
+        self.body = body
+        self.headers = headers
+        self.etag = etag
+        self.expires = expires
+
+
+class ResponseCache:
+    def __init__(self, route_ttls: dict = None, max_entries: int = MAX_ENTRIES, max_bytes: int = MAX_BYTES,
+                 route_params: dict = None):
+        self.route_ttls = dict(route_ttls or ROUTE_TTLS)
+        self.route_params = dict(ROUTE_PARAMS if route_params is None else route_params)
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()   # key -> _Entry (LRU)
+        self._bytes = 0                 # sum of cached body sizes
+        self._inflight = {}             # key -> Future[_Entry | None]
+        self._generation = {r: 0 for r in self.route_ttls}
+        self._stats = {r: {"requests": 0, "hits": 0, "coalesced": 0, "misses": 0, "not_modified": 0,
+                           "stores": 0, "invalidations": 0, "bytes_from_cache": 0, "bytes_not_sent": 0}
+                       for r in self.route_ttls}
+
+    # --- writer hooks ---
+
+    def invalidate(self, *routes: str):
+        """Drop every cached response of these routes (all query variants)."""
+        for route in routes:
+            if route not in self._generation:
+                continue
+            self._generation[route] += 1
+            self._stats[route]["invalidations"] += 1
+            for key in [k for k, e in self._entries.items() if e.route == route]:
+                self._drop(key)
+
+    def on_event(self, type_: str, data: dict = None):
+        """event_broker listener: live events invalidate the routes they change."""
+        self.invalidate(*ROUTES_BY_EVENT.get(type_.split(".")[0], ()))
+
+    # --- lookup / store ---
+
+    def key(self, route: str, query: str) -> str:
+        """route?<the route's known params, sorted>. Last value wins for repeats, as in the route itself."""
+        pairs = parse_qsl(query, keep_blank_values=True)
+        known = self.route_params.get(route)
+        if known is not None:
+            pairs = dict((k, v) for k, v in pairs if k in known).items()
+        return f"{route}?{urlencode(sorted(pairs))}"
+
+    def _drop(self, key: str):
+        e = self._entries.pop(key, None)
+        if e is not None:
+            self._bytes -= len(e.body)
+
+    def _get(self, key: str):
+        e = self._entries.get(key)
+        if e is None:
+            return None
+        if e.expires <= time.monotonic():
+            self._drop(key)
+            return None
+        self._entries.move_to_end(key)
+        return e
+
+    def _put(self, key: str, entry: _Entry):
+        self._drop(key)
+        self._entries[key] = entry
+        self._bytes += len(entry.body)
+        while len(self._entries) > self.max_entries or self._bytes > self.max_bytes:
+            self._drop(next(iter(self._entries)))
+        self._stats[entry.route]["stores"] += 1
+
+    def stats(self) -> dict:
+        out = {}
+        for route, s in self._stats.items():
+            s = dict(s)
+            served = s["hits"] + s["coalesced"]
+            s["hit_ratio"] = round(served / s["requests"], 3) if s["requests"] else None
+            s["bytes_saved"] = s["bytes_from_cache"] + s["bytes_not_sent"]
+            s["ttl_s"] = self.route_ttls[route]
+            out[route] = s
+        return {"routes": out, "entries": len(self._entries), "mb": round(self._bytes / (1024 * 1024), 2),
+                "inflight": len(self._inflight)}
+
+
+class ResponseCacheMiddleware:
+    """Pure ASGI (no BaseHTTPMiddleware): add it before CORS so CORS headers stay per-request."""
+
+    def __init__(self, app, cache: ResponseCache):
+        self.app = app
+        self.cache = cache
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["method"] != "GET":
+            return await self.app(scope, receive, send)
+        route = scope["path"].rstrip("/") or "/"
+        ttl = self.cache.route_ttls.get(route)
+        if ttl is None:
+            return await self.app(scope, receive, send)
+
+        cache = self.cache
+        stats = cache._stats[route]
+        stats["requests"] += 1
+        key = cache.key(route, scope.get("query_string", b"").decode("latin-1"))
+        if_none_match = dict(scope["headers"]).get(b"if-none-match")
+
+        entry = cache._get(key)
+        if entry is not None:
+            stats["hits"] += 1
+            return await self._replay(entry, if_none_match, send, stats, b"HIT")
+
+        fut = cache._inflight.get(key)
+        if fut is not None:
+            entry = await asyncio.shield(fut)
+            if entry is not None:
+                stats["coalesced"] += 1
+                return await self._replay(entry, if_none_match, send, stats, b"HIT")
+            # the leader's response wasn't cacheable: compute our own below
+
+        stats["misses"] += 1
+        leader = key not in cache._inflight
+        if leader:
+            fut = asyncio.get_running_loop().create_future()
+            cache._inflight[key] = fut
+        generation = cache._generation[route]
+
+        start, chunks = {}, []
+
+        async def capture(message):
+            if message["type"] == "http.response.start":
+                start.update(message)
+            elif message["type"] == "http.response.body":
+                chunks.append(message.get("body", b""))
+
+        entry = None
+        try:
+            await self.app(scope, receive, capture)
+            body = b"".join(chunks)
+            headers = [(k, v) for k, v in start.get("headers", []) if k.lower() in KEPT_HEADERS]
+            # errors are returned as 200 {"error": ...} on these routes: never keep those
+            if (start.get("status") == 200 and len(body) <= MAX_BODY_BYTES
+                    and not body.startswith(b'{"error"') and generation == cache._generation[route]):
+                entry = _Entry(route, body, headers, _etag(body), time.monotonic() + ttl)
+                cache._put(key, entry)
+        finally:
+            if leader:
+                cache._inflight.pop(key, None)
+                if not fut.done():
+                    fut.set_result(entry)   # None: followers compute their own
+
+        if entry is None:
+            # not cacheable: pass the original response through untouched
+            await send(start)
+            await send({"type": "http.response.body", "body": b"".join(chunks)})
+            return
+        await self._replay(entry, if_none_match, send, stats, b"MISS", count_bytes=False)
+
+    async def _replay(self, entry: _Entry, if_none_match, send, stats, state: bytes, count_bytes: bool = True):
+        max_age = max(0, int(entry.expires - time.monotonic()))
+        headers = [
+            (b"etag", entry.etag),
+            (b"cache-control", f"public, max-age={max_age}".encode()),
+            (b"x-cache", state),
+        ]
+        if if_none_match and _etag_matches(if_none_match, entry.etag):
+            stats["not_modified"] += 1
+            stats["bytes_not_sent"] += len(entry.body)
+            await send({"type": "http.response.start", "status": 304, "headers": headers})
+            await send({"type": "http.response.body", "body": b""})
+            return
+        if count_bytes:
+            stats["bytes_from_cache"] += len(entry.body)
+        headers += entry.headers + [(b"content-length", str(len(entry.body)).encode())]
+        await send({"type": "http.response.start", "status": 200, "headers": headers})
+        await send({"type": "http.response.body", "body": entry.body})
+
+
+# Process-wide cache used by api.py
+response_cache = ResponseCache()
@@ -4,13 +4,13 @@ import logging
 import re
 from datetime import datetime, timezone, timedelta
 from typing import List, Optional
-from openai import OpenAI
+import llm_gateway
 from winrate_checker import update_winrate
 
-from db import log_signal, client as mongo_client
+from db import log_signal
 from market_data_ws import get_latest_ohlc
+from storage import get_storage
 
-client = OpenAI()
 logger = logging.getLogger(__name__)
 logger.setLevel(logging.INFO)
 
@@ -22,11 +22,9 @@ if not logger.hasHandlers():
 
 TIMEFRAMES = ["5m", "15m", "1h", "4h"]
 CONFIDENCE_THRESHOLD = 60
-signals_coll = mongo_client["hypewave"]["signals"]
-signal_control_coll = mongo_client["hypewave"]["signal_control"]
 
 def should_skip_symbol(symbol: str) -> bool:
-    entry = signal_control_coll.find_one({"symbol": symbol})
+    entry = get_storage().get_signal_control(symbol)
     now = datetime.now(timezone.utc)
 
     next_check = entry.get("next_check_at") if entry else None
@@ -45,11 +43,7 @@ def update_signal_control(symbol: str, status: str, notes: str, next_check_minut
         "last_status": status,
         "notes": notes
     }
-    signal_control_coll.update_one(
-        {"symbol": symbol},
-        {"$set": control_entry},
-        upsert=True
-    )
+    get_storage().set_signal_control(symbol, control_entry)
 
 def generate_alerts_for_symbol(symbol: str) -> List[str]:
     alerts = set()
@@ -75,10 +69,7 @@ def generate_alerts_for_symbol(symbol: str) -> List[str]:
             update_signal_control(symbol, "no_trade", result["thesis"], result["next_check"])
             return []
 
-        recent = signals_coll.find_one(
-            {"input.symbol": symbol, "output.trade": result["trade"]},
-            sort=[("created_at", -1)]
-        )
+        recent = get_storage().latest_signal(symbol, result["trade"])
 
         skip_due_to_duplicate = False
         if recent:
@@ -134,16 +125,14 @@ Use this exact format:
 **Thesis:** [brief rationale]
 """.strip() + f"\n\n{candles_by_tf}"
 
-    response = client.chat.completions.create(
-        model="gpt-4o",
-        messages=[
+    raw = llm_gateway.complete(
+        "signals",
+        [
             {"role": "system", "content": "You are a highly accurate trading assistant."},
             {"role": "user", "content": prompt}
         ],
         max_tokens=800
-    )
-
-    raw = response.choices[0].message.content.strip()
+    ).strip()
     logger.info("[GPT] %s", raw)
 
     def extract(pattern):
@@ -0,0 +1,263 @@
+# signal_votes.py
+# Voting on signals: one atomic round trip per vote + coalesced counter writes.
+#
+#   record_vote()   find_one_and_update upsert on signal_votes (unique signal_id+user_id),
+#                   returning the previous vote. The (prev -> new) transition gives an
+#                   exact counter delta even under concurrent flips by the same user.
+#   counters        deltas for signals.feedback.{up,down} accumulate in memory and are
+#                   flushed every VOTE_FLUSH_SECONDS as one unordered bulk of $inc, so a
+#                   hot signal takes one write per flush instead of one per vote.
+#   reconcile()     the vote records are the source of truth. Signals whose deltas may
+#                   have been lost or applied twice (a flush that failed ambiguously, a
+#                   worker that died with deltas in memory) get their counters recomputed
+#                   from signal_votes once their votes have been quiet for
+#                   VOTE_RECONCILE_QUIET_SECONDS, i.e. every worker has flushed them.
+#                   Anonymous /signals/feedback counts have no vote record; they're kept
+#                   in feedback_anon as well and added back in.
+#   feedback()      current counts = the signal_watcher view (or one read) + unflushed deltas.
+
+import asyncio
+import os
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+
+from pymongo import ReturnDocument, UpdateOne
+from pymongo.errors import BulkWriteError, DuplicateKeyError
+
+FLUSH_SECONDS = float(os.getenv("VOTE_FLUSH_SECONDS", "1"))
+RECONCILE_QUIET_SECONDS = float(os.getenv("VOTE_RECONCILE_QUIET_SECONDS", str(max(30.0, 10 * FLUSH_SECONDS))))
+RECONCILE_LOOKBACK_HOURS = float(os.getenv("VOTE_RECONCILE_LOOKBACK_HOURS", "24"))
+
+# pending-delta key -> counter field it is flushed into
+_FIELDS = {"up": "feedback.up", "down": "feedback.down",
+           "anon_up": "feedback_anon.up", "anon_down": "feedback_anon.down"}
+
+
+def vote_delta(prev, vote: int) -> dict:
+    """Counter change for a user's vote going prev -> vote (prev None: first vote)."""
+    if prev == vote:
+        return {}
+    delta = {"up": 1} if vote == 1 else {"down": 1}
+    if prev == 1:
+        delta["up"] = -1
+    elif prev == -1:
+        delta["down"] = -1
+    return delta
+
+
+async def record_vote(votes_coll, signal_id, user_id: str, vote: int):
+    """Upsert the user's vote; returns their previous vote (None if this is the first)."""
+    now = datetime.now(timezone.utc)
+    for attempt in (1, 2):
+        try:
+            before = await votes_coll.find_one_and_update(
+                {"signal_id": signal_id, "user_id": user_id},
+                {"$set": {"vote": vote, "updated_at": now}, "$setOnInsert": {"created_at": now}},
+                projection={"vote": 1},
+                upsert=True,
+                return_document=ReturnDocument.BEFORE,
+            )
+            return before["vote"] if before else None
+        except DuplicateKeyError:
+            # two first votes raced on the unique index: the loser retries as an update
+            if attempt == 2:
+                raise
+
+
+class VoteCounters:
+    def __init__(self, coll=None, votes_coll=None, flush_seconds: float = FLUSH_SECONDS,
+                 quiet_seconds: float = RECONCILE_QUIET_SECONDS):
+        self._coll = coll
+        self._votes_coll = votes_coll
+        self.flush_seconds = flush_seconds
+        self.quiet_seconds = quiet_seconds
+        self._lock = threading.Lock()
+        self._pending = {}     # signal _id -> {"up": n, "down": n, "anon_up": n, "anon_down": n}
+        self._flushing = {}    # same, for the batch currently being written
+        self._dirty = set()    # signals whose counters must be recomputed from signal_votes
+        self._flush_lock = asyncio.Lock()   # one bulk in flight: a shutdown flush waits for the loop's
+        self._next_reconcile = 0.0
+        self._stats = {"deltas": 0, "flushes": 0, "signals_written": 0, "errors": 0,
+                       "requeued": 0, "reconciled": 0, "anon_lost": 0}
+
+    @property
+    def coll(self):
+        if self._coll is None:
+            import db_async as adb
+            self._coll = adb.collection
+        return self._coll
+
+    @property
+    def votes_coll(self):
+        if self._votes_coll is None:
+            import db_async as adb
+            self._votes_coll = adb.votes_coll
+        return self._votes_coll
+
+    def add(self, signal_id, delta: dict, anon: bool = False):
+        """Queue a counter change. anon: /signals/feedback, which has no vote record."""
+        if not delta:
+            return
+        with self._lock:
+            bucket = self._pending.setdefault(signal_id, dict.fromkeys(_FIELDS, 0))
+            for k, v in delta.items():
+                bucket[k] += v
+                if anon:
+                    bucket[f"anon_{k}"] += v
+            self._stats["deltas"] += 1
+
+    def _requeue(self, sid, d: dict):
+        # caller holds the lock
+        bucket = self._pending.setdefault(sid, dict.fromkeys(_FIELDS, 0))
+        for k, v in d.items():
+            bucket[k] += v
+
+    def unflushed(self, signal_id) -> dict:
+        with self._lock:
+            out = {"up": 0, "down": 0}
+            for src in (self._pending, self._flushing):
+                d = src.get(signal_id, {})
+                for k in out:
+                    out[k] += d.get(k, 0)
+            return out
+
+    async def flush(self) -> int:
+        async with self._flush_lock:
+            return await self._flush()
+
+    async def _flush(self) -> int:
+        with self._lock:
+            if not self._pending:
+                return 0
+            batch, self._pending = self._pending, {}
+            self._flushing = batch
+        sids = [sid for sid, d in batch.items() if any(d.values())]
+        ops = [
+            UpdateOne({"_id": sid}, {"$inc": {_FIELDS[k]: v for k, v in batch[sid].items() if v}})
+            for sid in sids
+        ]
+        try:
+            if ops:
+                await self.coll.bulk_write(ops, ordered=False)
+            self._stats["flushes"] += 1
+            self._stats["signals_written"] += len(ops)
+        except BulkWriteError as e:
+            # $inc isn't idempotent: put back only the ops the server reports as not applied
+            failed = {err["index"] for err in e.details.get("writeErrors", [])}
+            self._stats["errors"] += 1
+            self._stats["requeued"] += len(failed)
+            self._stats["signals_written"] += len(ops) - len(failed)
+            print(f"[votes] counter flush: {len(failed)}/{len(ops)} signals failed, requeued")
+            with self._lock:
+                for i in failed:
+                    self._requeue(sids[i], batch[sids[i]])
+        except Exception as e:
+            # no way to tell what was applied: don't requeue (it could double count), recompute
+            # these signals from the vote records instead; anonymous counts can't be recovered
+            self._stats["errors"] += 1
+            self._stats["anon_lost"] += sum(batch[sid]["anon_up"] + batch[sid]["anon_down"] for sid in sids)
+            print(f"[votes] counter flush failed ({len(ops)} signals), will reconcile: {e}")
+            with self._lock:
+                self._dirty.update(sids)
+        finally:
+            with self._lock:
+                self._flushing = {}
+        return len(ops)
+
+    async def reconcile(self, signal_ids=None, since: datetime = None) -> int:
+        """
+        Recompute feedback.{up,down} from signal_votes (+ feedback_anon) for `signal_ids`,
+        or for every signal voted on since `since`. Signals with votes newer than the quiet
+        window (their deltas may still be in some worker's memory) are left for later.
+        """
+        if signal_ids is None:
+            signal_ids = await self.votes_coll.distinct("signal_id", {"updated_at": {"$gte": since}})
+        signal_ids = list(signal_ids)
+        if not signal_ids:
+            return 0
+        counts = {sid: {"up": 0, "down": 0, "last": None} for sid in signal_ids}
+        cursor = await self.votes_coll.aggregate([
+            {"$match": {"signal_id": {"$in": signal_ids}}},
+            {"$group": {
+                "_id": "$signal_id",
+                "up": {"$sum": {"$cond": [{"$eq": ["$vote", 1]}, 1, 0]}},
+                "down": {"$sum": {"$cond": [{"$eq": ["$vote", -1]}, 1, 0]}},
+                "last": {"$max": "$updated_at"},
+            }},
+        ])
+        async for row in cursor:
+            counts[row["_id"]] = row
+
+        quiet_before = datetime.now(timezone.utc) - timedelta(seconds=self.quiet_seconds)
+        ops, done, later = [], [], []
+        with self._lock:
+            for sid, c in counts.items():
+                last = c["last"]
+                if last is not None and last.tzinfo is None:
+                    last = last.replace(tzinfo=timezone.utc)
+                if (last is not None and last >= quiet_before) or sid in self._pending or sid in self._flushing:
+                    later.append(sid)
+                    continue
+                done.append(sid)
+                ops.append(UpdateOne({"_id": sid}, [{"$set": {
+                    "feedback.up": {"$add": [c["up"], {"$ifNull": ["$feedback_anon.up", 0]}]},
+                    "feedback.down": {"$add": [c["down"], {"$ifNull": ["$feedback_anon.down", 0]}]},
+                }}]))
+        if ops:
+            await self.coll.bulk_write(ops, ordered=False)
+        with self._lock:
+            self._dirty.difference_update(done)
+            self._dirty.update(later)
+        self._stats["reconciled"] += len(ops)
+        if ops or later:
+            print(f"[votes] reconciled {len(ops)} signals from vote records ({len(later)} deferred)")
+        return len(ops)
+
+    async def reconcile_recent(self):
+        """Startup: signals voted on within the lookback may have lost deltas in a crash."""
+        since = datetime.now(timezone.utc) - timedelta(hours=RECONCILE_LOOKBACK_HOURS)
+        try:
+            await self.reconcile(since=since)
+        except Exception as e:
+            print(f"[votes] startup reconcile failed: {e}")
+
+    async def flush_forever(self):
+        while True:
+            await asyncio.sleep(self.flush_seconds)
+            try:
+                await self.flush()
+                if self._dirty and time.monotonic() >= self._next_reconcile:
+                    self._next_reconcile = time.monotonic() + self.quiet_seconds / 2
+                    with self._lock:
+                        dirty = list(self._dirty)
+                    await self.reconcile(dirty)
+            except Exception as e:
+                print(f"[votes] flush loop error: {e}")
+
+    def stats(self) -> dict:
+        with self._lock:
+            s = dict(self._stats)
+            s["pending_signals"] = len(self._pending)
+            s["dirty_signals"] = len(self._dirty)
+        s["writes_saved"] = max(0, s["deltas"] - s["signals_written"] - s["pending_signals"])
+        return s
+
+
+async def feedback(signals_coll, signal_id):
+    """Current {"up", "down"} for a signal (None if it doesn't exist), including unflushed votes."""
+    from signal_watcher import signal_watcher
+
+    doc = signal_watcher.view.get(signal_id) if signal_watcher.view.ready else None
+    if doc is None:
+        doc = await signals_coll.find_one({"_id": signal_id}, {"feedback": 1})
+        if doc is None:
+            return None
+    base = doc.get("feedback")
+    base = base if isinstance(base, dict) else {}
+    pending = vote_counters.unflushed(signal_id)
+    return {k: (base.get(k) or 0) + pending[k] for k in ("up", "down")}
+
+
+# Process-wide counters used by api.py / db_async.py
+vote_counters = VoteCounters()
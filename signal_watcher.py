@@ -0,0 +1,327 @@
+# signal_watcher.py
+# Change-stream watcher on `signals` + an in-process materialized view of the feed.
+#
+# Signals are created by the AI loop, closed by the closer and voted on through
+# the API; this follows all of it from one change stream instead of re-querying:
+#
+#   view       the newest VIEW_SIZE feed signals (FEED_SOURCE), kept current by
+#              applying each event's updatedFields/removedFields in place, so
+#              status, outcome and feedback counters are live. /signals/latest
+#              serves its first page from here.
+#   listeners  fn(op, doc) per change (SSE push, response-cache invalidation).
+#   resume     the stream's resume token is saved to `stream_tokens` (coalesced
+#              through write_buffer); after a restart the stream resumes from it
+#              and replays what happened meanwhile. If the server no longer has
+#              that history, the token is dropped and the view rebuilt.
+#
+# Change streams need a replica set. Locally:
+#   mongod --replSet rs0 --dbpath /tmp/rs0 --port 27017 && mongosh --eval "rs.initiate()"
+#   MONGO_DB_URI="mongodb://localhost:27017/?replicaSet=rs0" python signal_watcher.py
+
+import asyncio
+import bisect
+import os
+import threading
+from datetime import datetime, timezone
+
+from write_behind import write_buffer
+
+FEED_SOURCE = "AI Multi-Timeframe Engine"
+VIEW_SIZE = int(os.getenv("SIGNAL_VIEW_SIZE", "500"))
+TOKEN_ID = "signals"
+RETRY_MAX_SECONDS = 60
+# server says the token's history is gone (ChangeStreamHistoryLost / fatal / invalid resume)
+_UNRESUMABLE = {260, 280, 286}
+
+
+def _key(doc: dict):
+    return (doc.get("created_at") or datetime.min, doc["_id"])
+
+
+def _child(container, part: str, create: bool):
+    if isinstance(container, list) and part.isdigit():
+        i = int(part)
+        return container[i] if i < len(container) else None
+    if isinstance(container, dict):
+        if create and not isinstance(container.get(part), (dict, list)):
+            container[part] = {}
+        return container.get(part)
+    return None
+
+
+def _set_path(doc: dict, path: str, value):
+    """Apply one updatedFields entry ("feedback.up", "media.2", ...) in place."""
+    *parents, last = path.split(".")
+    for p in parents:
+        doc = _child(doc, p, create=True)
+        if doc is None:
+            return
+    if isinstance(doc, list) and last.isdigit():
+        i = int(last)
+        if i < len(doc):
+            doc[i] = value
+        elif i == len(doc):
+            doc.append(value)
+    elif isinstance(doc, dict):
+        doc[last] = value
+
+
+def _unset_path(doc: dict, path: str):
+    *parents, last = path.split(".")
+    for p in parents:
+        doc = _child(doc, p, create=False)
+        if doc is None:
+            return
+    if isinstance(doc, dict):
+        doc.pop(last, None)
+
+
+def project(doc: dict, projection: dict | None) -> dict:
+    """Apply a simple inclusion projection ({"a": 1, "b.c": 1}) in memory, like Mongo would."""
+    if projection is None:
+        return doc
+    out = {"_id": doc["_id"]}
+    for path in projection:
+        src, dst = doc, out
+        parts = path.split(".")
+        for p in parts[:-1]:
+            src = src.get(p) if isinstance(src, dict) else None
+            if not isinstance(src, dict):
+                break
+            dst = dst.setdefault(p, {})
+        else:
+            if parts[-1] in src:
+                dst[parts[-1]] = src[parts[-1]]
+    return out
+
+
+class SignalView:
+    """Newest feed signals, by (created_at, _id)."""
+
+    def __init__(self, size: int = VIEW_SIZE):
+        self.size = size
+        self._lock = threading.Lock()
+        self._docs = {}       # _id -> doc
+        self._keys = []       # ascending (created_at, _id); newest at the end
+        self.ready = False
+        self.complete = False  # the view holds every feed signal there is
+
+    def load(self, docs: list):
+        with self._lock:
+            self._docs = {d["_id"]: d for d in docs}
+            self._keys = sorted(_key(d) for d in docs)
+            self.complete = len(docs) < self.size
+            self.ready = True
+
+    def upsert(self, doc: dict) -> bool:
+        if (doc.get("output") or {}).get("source") != FEED_SOURCE:
+            return False
+        with self._lock:
+            old = self._docs.get(doc["_id"])
+            if old is not None:
+                self._keys.remove(_key(old))
+            elif len(self._keys) >= self.size and _key(doc) < self._keys[0]:
+                return False  # older than the window
+            self._docs[doc["_id"]] = doc
+            bisect.insort(self._keys, _key(doc))
+            while len(self._keys) > self.size:
+                _, oldest = self._keys.pop(0)
+                self._docs.pop(oldest, None)
+                self.complete = False
+        return True
+
+    def apply_update(self, _id, updated: dict, removed: list) -> bool:
+        with self._lock:
+            doc = self._docs.get(_id)
+            if doc is None:
+                return False
+            reordered = "created_at" in updated
+            if reordered:
+                self._keys.remove(_key(doc))
+            for path, value in updated.items():
+                _set_path(doc, path, value)
+            for path in removed:
+                _unset_path(doc, path)
+            if reordered:
+                bisect.insort(self._keys, _key(doc))
+        return True
+
+    def remove(self, _id) -> bool:
+        with self._lock:
+            doc = self._docs.pop(_id, None)
+            if doc is None:
+                return False
+            self._keys.remove(_key(doc))
+            self.complete = False  # a slot opened up that only the DB can refill
+        return True
+
+    def get(self, _id):
+        return self._docs.get(_id)
+
+    def latest(self, min_confidence: int, limit: int):
+        """Newest `limit` signals at or above min_confidence, or None if the view can't tell."""
+        if not self.ready:
+            return None
+        out = []
+        with self._lock:
+            for _, _id in reversed(self._keys):
+                doc = self._docs[_id]
+                if ((doc.get("output") or {}).get("confidence") or 0) >= min_confidence:
+                    out.append(doc)
+                    if len(out) == limit:
+                        return out
+        return out if self.complete else None  # ran out of window before filling the page
+
+    def __len__(self):
+        return len(self._keys)
+
+
+class SignalWatcher:
+    def __init__(self, db=None, tokens=None, size: int = VIEW_SIZE):
+        self._db = db
+        self._tokens = tokens
+        self.view = SignalView(size)
+        self.listeners = []    # fn(op, doc): op in insert|update|replace|delete; doc may be partial for delete
+        self._token = None
+        self._stats = {"events": 0, "applied": 0, "outside_view": 0, "view_hits": 0, "view_misses": 0,
+                       "resumed": 0, "rebuilds": 0, "stream_errors": 0, "lost_history": 0}
+
+    @property
+    def db(self):
+        if self._db is None:
+            import db_async as adb
+            self._db = adb.db
+        return self._db
+
+    # --- snapshot + stream ---
+
+    async def _snapshot(self):
+        docs = await self.db["signals"].find({"output.source": FEED_SOURCE}) \
+            .sort([("created_at", -1), ("_id", -1)]).limit(self.view.size).to_list(length=self.view.size)
+        self.view.load(docs)
+        self._stats["rebuilds"] += 1
+
+    async def _load_token(self):
+        if self._tokens is not None:
+            return self._tokens.get(TOKEN_ID)
+        doc = await self.db["stream_tokens"].find_one({"_id": TOKEN_ID})
+        return doc["token"] if doc else None
+
+    def _save_token(self, token):
+        self._token = token
+        if self._tokens is not None:
+            self._tokens[TOKEN_ID] = token
+            return
+        # coalesced per key by the write-behind buffer: at most one write per flush
+        write_buffer.update("stream_tokens", TOKEN_ID, {"_id": TOKEN_ID},
+                            {"$set": {"token": token, "updated_at": datetime.now(timezone.utc)}}, upsert=True)
+
+    def handle(self, change: dict):
+        """Apply one change event to the view and notify listeners."""
+        op = change["operationType"]
+        self._stats["events"] += 1
+        doc = None
+        if op in ("insert", "replace"):
+            doc = change.get("fullDocument")
+            hit = doc is not None and self.view.upsert(doc)
+        elif op == "update":
+            _id = change["documentKey"]["_id"]
+            desc = change.get("updateDescription") or {}
+            hit = self.view.apply_update(_id, desc.get("updatedFields", {}), desc.get("removedFields", []))
+            doc = self.view.get(_id) or {"_id": _id, **desc.get("updatedFields", {})}
+        elif op == "delete":
+            doc = {"_id": change["documentKey"]["_id"]}
+            hit = self.view.remove(doc["_id"])
+        else:
+            return
+        self._stats["applied" if hit else "outside_view"] += 1
+        for fn in self.listeners:
+            try:
+                fn(op, doc)
+            except Exception as e:
+                print(f"[signals-watch] listener error: {e}")
+
+    async def follow_forever(self):
+        from pymongo.errors import OperationFailure
+
+        delay = 1
+        while True:
+            try:
+                token = self._token or await self._load_token()
+                kwargs = {"resume_after": token} if token else {}
+                async with await self.db["signals"].watch(**kwargs) as stream:
+                    # snapshot once the stream is open: events replayed on top converge to the same state
+                    await self._snapshot()
+                    if token:
+                        self._stats["resumed"] += 1
+                    print(f"📡 [signals-watch] view live ({len(self.view)} signals"
+                          f"{', resumed from saved token' if token else ''})")
+                    delay = 1
+                    async for change in stream:
+                        self.handle(change)
+                        self._save_token(stream.resume_token)
+                        if change["operationType"] in ("drop", "rename", "invalidate"):
+                            self._token = None
+                            break
+            except asyncio.CancelledError:
+                raise
+            except OperationFailure as e:
+                if e.code in _UNRESUMABLE:
+                    # history behind the token is gone: start over from a fresh snapshot
+                    self._stats["lost_history"] += 1
+                    print(f"[signals-watch] saved token not resumable, rebuilding: {e}")
+                    self._token = None
+                    await self._forget_token()
+                    continue
+                self._stream_failed(e)
+            except Exception as e:
+                self._stream_failed(e)
+            await asyncio.sleep(delay)
+            delay = min(delay * 2, RETRY_MAX_SECONDS)
+
+    def _stream_failed(self, e):
+        self._stats["stream_errors"] += 1
+        self.view.ready = False  # readers go to Mongo until the stream is back
+        print(f"[signals-watch] stream error: {e}")
+
+    async def _forget_token(self):
+        if self._tokens is not None:
+            self._tokens.pop(TOKEN_ID, None)
+            return
+        try:
+            await self.db["stream_tokens"].delete_one({"_id": TOKEN_ID})
+        except Exception as e:
+            print(f"[signals-watch] could not drop token: {e}")
+
+    # --- reads ---
+
+    def latest(self, min_confidence: int, limit: int):
+        docs = self.view.latest(min_confidence, limit)
+        self._stats["view_hits" if docs is not None else "view_misses"] += 1
+        return docs
+
+    def stats(self) -> dict:
+        s = dict(self._stats)
+        s["view_size"] = len(self.view)
+        s["view_ready"] = self.view.ready
+        s["view_complete"] = self.view.complete
+        s["has_token"] = self._token is not None
+        return s
+
+
+# Process-wide watcher used by api.py
+signal_watcher = SignalWatcher()
+
+
+if __name__ == "__main__":
+    # Tail the feed against a (local) replica set and print what the view sees.
+    def _print(op, doc):
+        out = doc.get("output") or {}
+        print(f"{op:8} {doc['_id']} status={doc.get('status')} outcome={doc.get('outcome')} "
+              f"feedback={doc.get('feedback')} trade={out.get('trade')}")
+
+    async def _main():
+        signal_watcher.listeners.append(_print)
+        await signal_watcher.follow_forever()
+
+    asyncio.run(_main())
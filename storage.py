@@ -0,0 +1,465 @@
+# storage.py
+# Repository layer for the collections behind db.py, signal_engine,
+# cleanup_signals and winrate_checker.
+#
+#   HYPEWAVE_STORAGE=mongo   (default) -> MongoStorage over the pooled client
+#   HYPEWAVE_STORAGE=memory            -> MemoryStorage, no network at all
+#
+# Callers always go through get_storage(); benchmarks and offline scripts can
+# swap the backend with set_storage(MemoryStorage()).
+
+import heapq
+import os
+import threading
+from abc import ABC, abstractmethod
+from datetime import datetime, timezone
+
+from bson import ObjectId
+from dotenv import load_dotenv
+
+load_dotenv()
+
+STORAGE_BACKEND = os.getenv("HYPEWAVE_STORAGE", "mongo")
+DB_NAME = "hypewave"
+WAIVER_VERSION = os.getenv("WAIVER_VERSION", "2025-08-23")
+# at most one last_seen write per user per this many seconds
+LAST_SEEN_WRITE_INTERVAL = int(os.getenv("LAST_SEEN_WRITE_INTERVAL", "60"))
+
+NEWS_PUSH_TOKEN_FILTER = {
+    "expo_push_token": {"$exists": True, "$ne": None, "$type": "string"},
+    "$or": [
+        {"notification_prefs.news": True},
+        {"notification_prefs.news": {"$exists": False}}
+    ]
+}
+
+# What the closer considers "open and closable"
+OPEN_SIGNAL_FILTER = {
+    "status": "open",
+    "output.tp": {"$exists": True},
+    "output.sl": {"$exists": True},
+    "input.symbol": {"$exists": True},
+    "output.trade": {"$in": ["LONG", "SHORT"]}
+}
+
+
+# --- Document builders (shared by every backend and by db_async) ---
+
+def _signal_upsert(user_id: str, input_data: dict, output_data: dict, extra_meta: dict = None):
+    """Build the (filter, update) pair used to upsert a signal."""
+    entry = {
+        "user_id": user_id,
+        "input": input_data,
+        "output": output_data,
+        "created_at": datetime.now(timezone.utc)
+    }
+
+    if extra_meta:
+        entry.update(extra_meta)
+
+    unique_filter = {
+        "user_id": user_id,
+        "input.symbol": input_data.get("symbol"),
+        "output.result": output_data.get("result"),
+        "output.timeframe": output_data.get("timeframe"),
+        "output.source": output_data.get("source")
+    }
+
+    update = {
+        "$set": {k: v for k, v in entry.items() if k != "created_at"},
+        "$setOnInsert": {"created_at": entry["created_at"]},
+    }
+    return unique_filter, update
+
+
+def _alert_upsert(user_id: str, input_data: dict, output_data: dict):
+    entry = {
+        "user_id": user_id,
+        "input": input_data,
+        "output": output_data,
+        "created_at": datetime.now(timezone.utc)
+    }
+
+    unique_filter = {
+        "user_id": user_id,
+        "input.symbol": input_data.get("symbol"),
+        "output.result": output_data.get("result"),
+        "output.timeframe": output_data.get("timeframe"),
+        "output.source": output_data.get("source")
+    }
+    return unique_filter, {"$setOnInsert": entry}
+
+
+def _new_user_doc(email: str, password_hash: str, extra: dict = {}):
+    return {
+        "email": email,
+        "password_hash": password_hash,
+        "created_at": datetime.now(timezone.utc),
+        "preferences": {},
+        "sessions": [],
+        "login_method": extra.get("login_method", "email"),
+        "username": extra.get("username", email.split("@")[0]),
+        "avatar_url": extra.get("avatar_url", ""),
+        "waiver": {"signed": False, "version": WAIVER_VERSION, "at": None},
+    }
+
+
+# --- Interface ---
+
+class Storage(ABC):
+    """Every method maps to one helper the app already had; a backend missing one fails at construction."""
+
+    # signals
+    @abstractmethod
+    def log_signal(self, user_id: str, input_data: dict, output_data: dict, extra_meta: dict = None):
+        """Upsert a signal (deduped on user / symbol / result / timeframe / source)."""
+
+    @abstractmethod
+    def latest_signal(self, symbol: str, trade: str):
+        """Most recently created signal for (symbol, side), or None."""
+
+    @abstractmethod
+    def open_signals(self):
+        """Iterate signals matching OPEN_SIGNAL_FILTER."""
+
+    @abstractmethod
+    def close_signal(self, signal_id, fields: dict) -> bool:
+        """Set closing fields if the signal is still open. True if this call closed it."""
+
+    @abstractmethod
+    def inc_feedback(self, signal_id: str, feedback: str):
+        """Count one anonymous "up" / "down" in the signal's feedback and feedback_anon counters."""
+
+    # alerts / chats / news
+    @abstractmethod
+    def log_alert(self, user_id: str, input_data: dict, output_data: dict):
+        """Upsert an alert."""
+
+    @abstractmethod
+    def log_chat(self, entry: dict):
+        """Append one chat log entry."""
+
+    @abstractmethod
+    def recent_news(self, coll: str, limit: int) -> list:
+        """Newest `limit` items of a news collection."""
+
+    # users
+    @abstractmethod
+    def get_user_by_email(self, email: str):
+        """User doc for the email, or None."""
+
+    @abstractmethod
+    def get_user_by_id(self, user_id: str):
+        """User doc for the id, or None."""
+
+    @abstractmethod
+    def create_user(self, doc: dict) -> str:
+        """Insert a user doc; returns its id as a string."""
+
+    @abstractmethod
+    def update_user_last_seen(self, user_id: str):
+        """Stamp last_seen with the current time."""
+
+    @abstractmethod
+    def set_user_fields(self, user_id: str, fields: dict):
+        """$set the given fields on the user."""
+
+    @abstractmethod
+    def news_push_tokens(self) -> list:
+        """Expo push tokens of users subscribed to news."""
+
+    # signal_control
+    @abstractmethod
+    def get_signal_control(self, symbol: str):
+        """The symbol's signal_control entry, or None."""
+
+    @abstractmethod
+    def set_signal_control(self, symbol: str, entry: dict):
+        """Create or update the symbol's signal_control entry."""
+
+    # stats
+    @abstractmethod
+    def record_trade_result(self, is_win: bool):
+        """Count one closed trade (and a win if it was one)."""
+
+    @abstractmethod
+    def get_winrate_stats(self):
+        """The raw winrate stats doc, or None."""
+
+
+# --- MongoDB ---
+
+class MongoStorage(Storage):
+    def __init__(self, db=None):
+        self._db = db
+
+    @property
+    def db(self):
+        if self._db is None:
+            from mongo_pool import get_client
+            self._db = get_client()[DB_NAME]
+        return self._db
+
+    def log_signal(self, user_id, input_data, output_data, extra_meta=None):
+        unique_filter, update = _signal_upsert(user_id, input_data, output_data, extra_meta)
+        self.db["signals"].update_one(unique_filter, update, upsert=True)
+
+    def latest_signal(self, symbol, trade):
+        return self.db["signals"].find_one(
+            {"input.symbol": symbol, "output.trade": trade},
+            sort=[("created_at", -1)]
+        )
+
+    def open_signals(self):
+        return self.db["signals"].find(OPEN_SIGNAL_FILTER)
+
+    def close_signal(self, signal_id, fields):
+        res = self.db["signals"].update_one(
+            {"_id": ObjectId(signal_id), "status": "open"},
+            {"$set": fields}
+        )
+        return res.modified_count == 1
+
+    def inc_feedback(self, signal_id, feedback):
+        self.db["signals"].update_one({"_id": ObjectId(signal_id)}, {"$inc": {f"feedback.{feedback}": 1, f"feedback_anon.{feedback}": 1}})
+
+    def log_alert(self, user_id, input_data, output_data):
+        unique_filter, update = _alert_upsert(user_id, input_data, output_data)
+        self.db["alerts"].update_one(unique_filter, update, upsert=True)
+
+    def log_chat(self, entry):
+        from write_behind import write_buffer
+        write_buffer.insert("chats", entry)
+
+    def recent_news(self, coll, limit):
+        return list(self.db[coll].find().sort("date", -1).limit(limit))
+
+    def get_user_by_email(self, email):
+        return self.db["users"].find_one({"email": email})
+
+    def get_user_by_id(self, user_id):
+        return self.db["users"].find_one({"_id": ObjectId(user_id)})
+
+    def create_user(self, doc):
+        return str(self.db["users"].insert_one(doc).inserted_id)
+
+    def update_user_last_seen(self, user_id):
+        # coalesced + throttled in the write-behind buffer
+        from write_behind import write_buffer
+        write_buffer.update(
+            "users", user_id,
+            {"_id": ObjectId(user_id)},
+            {"$set": {"last_seen": datetime.now(timezone.utc)}},
+            min_interval=LAST_SEEN_WRITE_INTERVAL,
+        )
+
+    def set_user_fields(self, user_id, fields):
+        self.db["users"].update_one({"_id": ObjectId(user_id)}, {"$set": fields}, upsert=False)
+
+    def news_push_tokens(self):
+        cursor = self.db["users"].find(NEWS_PUSH_TOKEN_FILTER, {"expo_push_token": 1})
+        return [doc["expo_push_token"] for doc in cursor if doc.get("expo_push_token")]
+
+    def get_signal_control(self, symbol):
+        return self.db["signal_control"].find_one({"symbol": symbol})
+
+    def set_signal_control(self, symbol, entry):
+        self.db["signal_control"].update_one({"symbol": symbol}, {"$set": entry}, upsert=True)
+
+    def record_trade_result(self, is_win):
+        # one round trip: bump counters and recompute the percentage server-side
+        self.db["stats"].update_one(
+            {"_id": "winrate"},
+            [
+                {"$set": {
+                    "wins": {"$add": [{"$ifNull": ["$wins", 0]}, 1 if is_win else 0]},
+                    "total_trades": {"$add": [{"$ifNull": ["$total_trades", 0]}, 1]},
+                    "last_updated": "$$NOW",
+                }},
+                {"$set": {"winrate": {"$round": [
+                    {"$multiply": [{"$divide": ["$wins", "$total_trades"]}, 100]}, 2]}}},
+            ],
+            upsert=True,
+        )
+
+    def get_winrate_stats(self):
+        return self.db["stats"].find_one({"_id": "winrate"})
+
+
+# --- In-memory ---
+
+class MemoryStorage(Storage):
+    """
+    Dict-backed implementation with the same semantics as MongoStorage.
+    Secondary lookups the hot paths need (upsert key, latest per symbol/side,
+    open set) are maintained as indexes so everything stays O(1) at scale.
+    """
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        self.signals = {}          # _id -> doc
+        self._signal_keys = {}     # upsert key -> _id
+        self._latest = {}          # (symbol, trade) -> _id
+        self._open = set()         # _ids matching OPEN_SIGNAL_FILTER
+        self.alerts = {}
+        self.chats = []
+        self.news = {}             # coll -> [docs]
+        self.users = {}
+        self._user_emails = {}
+        self.signal_control = {}
+        self.stats = {}
+
+    @staticmethod
+    def _key(flt: dict) -> tuple:
+        return tuple(sorted(flt.items()))
+
+    @staticmethod
+    def _is_open(doc: dict) -> bool:
+        out = doc.get("output", {})
+        return (
+            doc.get("status") == "open"
+            and "tp" in out and "sl" in out
+            and "symbol" in doc.get("input", {})
+            and out.get("trade") in ("LONG", "SHORT")
+        )
+
+    def log_signal(self, user_id, input_data, output_data, extra_meta=None):
+        unique_filter, update = _signal_upsert(user_id, input_data, output_data, extra_meta)
+        key = self._key(unique_filter)
+        with self._lock:
+            sid = self._signal_keys.get(key)
+            if sid is None:
+                sid = ObjectId()
+                doc = {"_id": sid, **update["$setOnInsert"]}
+                self.signals[sid] = doc
+                self._signal_keys[key] = sid
+                self._latest[(input_data.get("symbol"), output_data.get("trade"))] = sid
+            doc = self.signals[sid]
+            doc.update(update["$set"])
+            if self._is_open(doc):
+                self._open.add(sid)
+            else:
+                self._open.discard(sid)
+
+    def latest_signal(self, symbol, trade):
+        with self._lock:
+            sid = self._latest.get((symbol, trade))
+            return dict(self.signals[sid]) if sid is not None else None
+
+    def open_signals(self):
+        with self._lock:
+            return [dict(self.signals[sid]) for sid in self._open]
+
+    def close_signal(self, signal_id, fields):
+        sid = ObjectId(signal_id)
+        with self._lock:
+            if sid not in self._open:
+                return False
+            self.signals[sid].update(fields)
+            self._open.discard(sid)
+            return True
+
+    def inc_feedback(self, signal_id, feedback):
+        with self._lock:
+            doc = self.signals.get(ObjectId(signal_id))
+            if doc is not None:
+                for field in ("feedback", "feedback_anon"):
+                    counts = doc.setdefault(field, {"up": 0, "down": 0})
+                    counts[feedback] = counts.get(feedback, 0) + 1
+
+    def log_alert(self, user_id, input_data, output_data):
+        unique_filter, update = _alert_upsert(user_id, input_data, output_data)
+        with self._lock:
+            self.alerts.setdefault(self._key(unique_filter), {"_id": ObjectId(), **update["$setOnInsert"]})
+
+    def log_chat(self, entry):
+        with self._lock:
+            self.chats.append({"_id": ObjectId(), **entry})
+
+    def add_news(self, coll: str, doc: dict):
+        """Ingestion hook for offline runs (the Mongo side is written by the tracker/scrapers)."""
+        with self._lock:
+            self.news.setdefault(coll, []).append({"_id": ObjectId(), **doc})
+
+    def recent_news(self, coll, limit):
+        with self._lock:
+            docs = list(self.news.get(coll, []))
+        return heapq.nlargest(limit, docs, key=lambda d: d.get("date") or datetime.min)
+
+    def get_user_by_email(self, email):
+        with self._lock:
+            uid = self._user_emails.get(email)
+            return dict(self.users[uid]) if uid is not None else None
+
+    def get_user_by_id(self, user_id):
+        with self._lock:
+            doc = self.users.get(ObjectId(user_id))
+            return dict(doc) if doc else None
+
+    def create_user(self, doc):
+        with self._lock:
+            uid = ObjectId()
+            self.users[uid] = {"_id": uid, **doc}
+            if doc.get("email"):
+                self._user_emails[doc["email"]] = uid
+            return str(uid)
+
+    def update_user_last_seen(self, user_id):
+        self.set_user_fields(user_id, {"last_seen": datetime.now(timezone.utc)})
+
+    def set_user_fields(self, user_id, fields):
+        with self._lock:
+            doc = self.users.get(ObjectId(user_id))
+            if doc is not None:
+                doc.update(fields)
+
+    def news_push_tokens(self):
+        with self._lock:
+            return [
+                u["expo_push_token"] for u in self.users.values()
+                if isinstance(u.get("expo_push_token"), str)
+                and u.get("notification_prefs", {}).get("news", True) is True
+            ]
+
+    def get_signal_control(self, symbol):
+        with self._lock:
+            doc = self.signal_control.get(symbol)
+            return dict(doc) if doc else None
+
+    def set_signal_control(self, symbol, entry):
+        with self._lock:
+            self.signal_control.setdefault(symbol, {"_id": ObjectId()}).update(entry)
+
+    def record_trade_result(self, is_win):
+        with self._lock:
+            doc = self.stats.setdefault("winrate", {"_id": "winrate", "wins": 0, "total_trades": 0})
+            doc["wins"] += 1 if is_win else 0
+            doc["total_trades"] += 1
+            doc["last_updated"] = datetime.now(timezone.utc)
+            doc["winrate"] = round(doc["wins"] / doc["total_trades"] * 100, 2)
+
+    def get_winrate_stats(self):
+        with self._lock:
+            doc = self.stats.get("winrate")
+            return dict(doc) if doc else None
+
+
+# --- Selection ---
+
+_storage = None
+_storage_lock = threading.Lock()
+
+
+def get_storage() -> Storage:
+    global _storage
+    if _storage is None:
+        with _storage_lock:
+            if _storage is None:
+                _storage = MemoryStorage() if STORAGE_BACKEND == "memory" else MongoStorage()
+    return _storage
+
+
+def set_storage(storage: Storage):
+    """Swap the process-wide backend (benchmarks, offline scripts)."""
+    global _storage
+    _storage = storage
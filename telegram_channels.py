@@ -0,0 +1,162 @@
+# telegram_channels.py
+# Entity + avatar cache for telegram_tracker's channels.
+#
+# The tracker used to resolve the chat (get_entity: one request) and download +
+# re-upload its profile photo (Telegram download + Cloudinary upload) on every
+# message, for six channels whose avatars almost never change. Now:
+#
+#   entities  resolved once at startup (warm) and kept by chat id; the chat that
+#             arrives with the update itself is used when Telethon has it.
+#   avatars   one record per chat in `telegram_channels` {_id: chat_id, photo_id,
+#             avatar_url, ...}, loaded at startup. The photo is downloaded and
+#             uploaded again only when the entity's photo_id differs from the
+#             record's; otherwise the cached URL is used, no request at all.
+#   refresh   photo-change service messages and a slow periodic re-resolve
+#             (TG_AVATAR_REFRESH_SECONDS) pick up new photos.
+
+import asyncio
+import os
+import time
+from datetime import datetime, timezone
+from pathlib import Path
+
+REFRESH_SECONDS = float(os.getenv("TG_AVATAR_REFRESH_SECONDS", str(6 * 3600)))
+RETRY_SECONDS = 300   # after a failed download/upload, keep the old URL this long before retrying
+
+
+def photo_id(entity):
+    """Telegram's id for the entity's current profile photo (None: no photo)."""
+    return getattr(getattr(entity, "photo", None), "photo_id", None)
+
+
+def upload_avatar(path: str, source_key: str) -> str:
+    import cloudinary.uploader
+    up = cloudinary.uploader.upload(
+        path,
+        public_id=f"hypewave/avatars/telegram/{source_key}",
+        overwrite=True,
+        unique_filename=False,
+        resource_type="image",
+    )
+    return up.get("secure_url")
+
+
+class ChannelCache:
+    def __init__(self, coll, avatars_dir: Path, upload=upload_avatar):
+        self.coll = coll               # sync pymongo collection (the tracker runs on the sync client)
+        self.avatars_dir = Path(avatars_dir)
+        self.upload = upload
+        self.entities = {}             # chat_id -> entity
+        self.records = {}              # chat_id -> persisted avatar record
+        self._locks = {}               # chat_id -> asyncio.Lock: one download per photo change
+        self._retry_at = {}            # chat_id -> monotonic time a failed sync may be retried
+        self._stats = {"entity_hits": 0, "entity_from_update": 0, "entity_fetches": 0,
+                       "avatar_hits": 0, "avatar_syncs": 0, "avatar_errors": 0}
+
+    def load(self):
+        self.records = {doc["_id"]: doc for doc in self.coll.find({})}
+        print(f"🖼️ [tg-cache] {len(self.records)} channel avatars loaded")
+
+    async def warm(self, client, chats, chat_id_of, source_key_of):
+        """Startup: persisted avatars -> memory, resolve every tracked chat once, sync changed photos."""
+        await asyncio.to_thread(self.load)
+        for chat in chats:
+            try:
+                self._stats["entity_fetches"] += 1
+                entity = await client.get_entity(chat)
+                chat_id = chat_id_of(entity)
+                self.remember(chat_id, entity)
+                await self.avatar_url(client, chat_id, entity, source_key_of(entity))
+            except Exception as e:
+                print(f"[tg-cache] warm failed for {chat}: {e}")
+        print(f"🖼️ [tg-cache] warm: {len(self.entities)} chats resolved")
+
+    def remember(self, chat_id: int, entity):
+        self.entities[chat_id] = entity
+
+    async def entity(self, client, chat_id: int, from_update=None):
+        """The chat's entity: from the update when it carries one, else cached, else one get_entity."""
+        if from_update is not None and not getattr(from_update, "min", False):
+            self._stats["entity_from_update"] += 1
+            self.remember(chat_id, from_update)
+            return from_update
+        cached = self.entities.get(chat_id)
+        if cached is not None:
+            self._stats["entity_hits"] += 1
+            return cached
+        return await self.resolve(client, chat_id)
+
+    async def resolve(self, client, chat_id: int):
+        self._stats["entity_fetches"] += 1
+        entity = await client.get_entity(chat_id)
+        self.remember(chat_id, entity)
+        return entity
+
+    def _fresh(self, chat_id: int, pid):
+        rec = self.records.get(chat_id)
+        return rec is not None and rec.get("photo_id") == pid
+
+    async def avatar_url(self, client, chat_id: int, entity, source_key: str):
+        """Hosted avatar URL for the entity's current photo; uploads only when the photo changed."""
+        pid = photo_id(entity)
+        if self._fresh(chat_id, pid) or time.monotonic() < self._retry_at.get(chat_id, 0):
+            self._stats["avatar_hits"] += 1
+            return (self.records.get(chat_id) or {}).get("avatar_url")
+
+        lock = self._locks.setdefault(chat_id, asyncio.Lock())
+        async with lock:
+            if self._fresh(chat_id, pid):   # another message of the burst already did it
+                self._stats["avatar_hits"] += 1
+                return self.records[chat_id].get("avatar_url")
+            return await self._sync(client, chat_id, entity, pid, source_key)
+
+    async def _sync(self, client, chat_id, entity, pid, source_key):
+        url, tmp = None, None
+        try:
+            if pid is not None:
+                tmp = await client.download_profile_photo(entity, file=str(self.avatars_dir / f"{source_key}.jpg"))
+                if tmp:
+                    url = await asyncio.to_thread(self.upload, tmp, source_key)
+        except Exception as e:
+            self._stats["avatar_errors"] += 1
+            self._retry_at[chat_id] = time.monotonic() + RETRY_SECONDS
+            print(f"⚠️ [tg-cache] avatar sync failed for {source_key}: {e}")
+            return (self.records.get(chat_id) or {}).get("avatar_url")
+        finally:
+            try:
+                if tmp and Path(tmp).exists():
+                    os.remove(tmp)
+            except Exception:
+                pass
+
+        rec = {"_id": chat_id, "source": source_key, "photo_id": pid, "avatar_url": url,
+               "updated_at": datetime.now(timezone.utc)}
+        self.records[chat_id] = rec
+        self._retry_at.pop(chat_id, None)
+        self._stats["avatar_syncs"] += 1
+        try:
+            await asyncio.to_thread(self.coll.update_one, {"_id": chat_id}, {"$set": rec}, upsert=True)
+        except Exception as e:
+            print(f"⚠️ [tg-cache] could not persist avatar for {source_key}: {e}")
+        print(f"🖼️ [tg-cache] {source_key} avatar {'updated' if url else 'cleared'} (photo {pid})")
+        return url
+
+    async def refresh(self, client, chat_id: int, source_key_of):
+        """Re-resolve one chat (its photo may have changed) and sync its avatar if it did."""
+        entity = await self.resolve(client, chat_id)
+        return await self.avatar_url(client, chat_id, entity, source_key_of(entity))
+
+    async def refresh_forever(self, client, source_key_of):
+        while True:
+            await asyncio.sleep(REFRESH_SECONDS)
+            for chat_id in list(self.entities):
+                try:
+                    await self.refresh(client, chat_id, source_key_of)
+                except Exception as e:
+                    print(f"[tg-cache] refresh failed for {chat_id}: {e}")
+
+    def stats(self) -> dict:
+        s = dict(self._stats)
+        s["entities"] = len(self.entities)
+        s["avatars"] = len(self.records)
+        return s
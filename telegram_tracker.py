@@ -1,5 +1,5 @@
 # telegram_tracker.py  — PASTE OVER
-from telethon import TelegramClient, events
+from telethon import TelegramClient, events, utils
 from datetime import timezone
 from db import client, get_all_news_push_tokens
 import os, asyncio
@@ -9,6 +9,8 @@ from pathlib import Path
 import requests
 import faulthandler
 
+from telegram_channels import ChannelCache
+
 # Cloudinary
 import cloudinary, cloudinary.uploader
 
@@ -47,6 +49,9 @@ avatars_dir.mkdir(exist_ok=True)
 
 tg_client = TelegramClient(StringSession(session_string), api_id, api_hash)
 
+# chat entities + hosted avatars, persisted in telegram_channels (re-uploaded only when the photo changes)
+channels = ChannelCache(client["hypewave"]["telegram_channels"], avatars_dir)
+
 
 def canonicalize_source_fields(entity, message_id: int):
     """
@@ -70,6 +75,10 @@ def canonicalize_source_fields(entity, message_id: int):
     return source_key, title, handle, link
 
 
+def source_key_of(entity) -> str:
+    return canonicalize_source_fields(entity, 0)[0]
+
+
 # ---- Expo push helpers ----
 EXPO_PUSH_URL = "https://exp.host/--/api/v2/push/send"
 
@@ -123,7 +132,8 @@ def broadcast_news_push(
 async def handler(event):
     try:
         msg = event.message
-        entity = await tg_client.get_entity(event.chat_id)
+        # the update usually carries the chat; otherwise the cached entity (no request)
+        entity = await channels.entity(tg_client, event.chat_id, event.chat)
 
         # --- Stable source/display/link fields (never None) ---
         source_key, display_name, handle, deep_link = canonicalize_source_fields(entity, msg.id)
@@ -134,28 +144,12 @@ async def handler(event):
             preview = preview[:90] + "…"
         print(f"📨 [{source_key}] {preview or '[no text]'}")
 
-        # --- Avatar upload (best-effort) ---
+        # --- Avatar: cached URL unless the channel's photo id changed (best-effort) ---
         avatar_url = None
-        tmp = None
         try:
-            tmp = await tg_client.download_profile_photo(entity, file=str(avatars_dir / f"{source_key}.jpg"))
-            if tmp:
-                up = cloudinary.uploader.upload(
-                    tmp,
-                    public_id=f"hypewave/avatars/telegram/{source_key}",
-                    overwrite=True,
-                    unique_filename=False,
-                    resource_type="image",
-                )
-                avatar_url = up.get("secure_url")
+            avatar_url = await channels.avatar_url(tg_client, event.chat_id, entity, source_key)
         except Exception as e:
-            print("⚠️ avatar download/upload error:", e)
-        finally:
-            try:
-                if tmp and Path(tmp).exists():
-                    os.remove(tmp)
-            except Exception:
-                pass
+            print("⚠️ avatar cache error:", e)
 
         # --- Media upload (image/gif/video) ---
         media_item = None
@@ -269,10 +263,23 @@ async def handler(event):
         print("❌ handler error:", e)
 
 
+@tg_client.on(events.ChatAction(chats=channel_usernames))
+async def chat_action_handler(event):
+    # a channel changed (or removed) its photo: re-resolve it and re-upload once
+    if not event.new_photo:
+        return
+    try:
+        await channels.refresh(tg_client, event.chat_id, source_key_of)
+    except Exception as e:
+        print("⚠️ avatar refresh error:", e)
+
+
 async def main():
     print("[Telegram Tracker] Starting Telegram client...")
     await tg_client.start()
     print("[Telegram Tracker] Connected.")
+    await channels.warm(tg_client, channel_usernames, utils.get_peer_id, source_key_of)
+    asyncio.create_task(channels.refresh_forever(tg_client, source_key_of))
     await tg_client.run_until_disconnected()
 
 
@@ -0,0 +1,185 @@
+# test_jwks_cache.py
+# jwks_cache against locally generated RSA keys and a fake JWKS endpoint (no network).
+#
+#   python -m pytest -q test_jwks_cache.py
+#   python test_jwks_cache.py
+
+import asyncio
+import base64
+import time
+
+import rsa
+from jose import jwt
+
+import jwks_cache
+from jwks_cache import InvalidIdToken, KeySet
+
+ISSUER = "https://accounts.google.com"
+AUD = "ios-client-id"
+
+
+def _b64(n: int) -> str:
+    return base64.urlsafe_b64encode(n.to_bytes((n.bit_length() + 7) // 8, "big")).rstrip(b"=").decode()
+
+
+def _keypair(kid: str):
+    pub, priv = rsa.newkeys(1024)   # small keys keep the suite fast; size doesn't matter here
+    return {"kty": "RSA", "kid": kid, "use": "sig", "alg": "RS256", "n": _b64(pub.n), "e": _b64(pub.e)}, \
+        priv.save_pkcs1().decode()
+
+
+KEY_A, PRIV_A = _keypair("kid-a")
+KEY_B, PRIV_B = _keypair("kid-b")
+
+
+def token(priv=PRIV_A, kid="kid-a", **claims):
+    now = int(time.time())
+    body = {"iss": ISSUER, "aud": AUD, "sub": "123", "email": "t@example.com", "email_verified": True,
+            "iat": now, "exp": now + 600, **claims}
+    return jwt.encode(body, priv, algorithm="RS256", headers={"kid": kid})
+
+
+class FakeEndpoint:
+    def __init__(self, *keys, max_age=None, delay=0.01):
+        self.keys = list(keys)
+        self.max_age = max_age
+        self.delay = delay
+        self.calls = 0
+        self.fail = False
+
+    async def __call__(self, uri):
+        self.calls += 1
+        await asyncio.sleep(self.delay)
+        if self.fail:
+            raise ConnectionError("provider down")
+        return {"keys": list(self.keys)}, self.max_age
+
+
+def keyset(endpoint, **kw):
+    return KeySet("google", "https://example.invalid/certs", (ISSUER, "accounts.google.com"), fetch=endpoint, **kw)
+
+
+def run(coro):
+    return asyncio.run(coro)
+
+
+def test_verifies_locally_and_fetches_once():
+    ep = FakeEndpoint(KEY_A)
+    ks = keyset(ep)
+
+    async def go():
+        for _ in range(20):
+            claims = await ks.verify(token(), {AUD})
+            assert claims["email"] == "t@example.com"
+    run(go())
+    assert ep.calls == 1
+
+
+def test_cold_start_is_single_flight():
+    ep = FakeEndpoint(KEY_A, delay=0.05)
+    ks = keyset(ep)
+
+    async def go():
+        return await asyncio.gather(*(ks.verify(token(), {AUD}) for _ in range(50)))
+    assert len(run(go())) == 50
+    assert ep.calls == 1
+
+
+def test_rotation_refetches_once_for_unknown_kid():
+    ep = FakeEndpoint(KEY_A)
+    ks = keyset(ep, min_refetch=0)
+
+    async def go():
+        await ks.verify(token(), {AUD})
+        ep.keys = [KEY_A, KEY_B]   # provider rotates in a new key
+        out = await asyncio.gather(*(ks.verify(token(PRIV_B, "kid-b"), {AUD}) for _ in range(30)))
+        assert all(c["sub"] == "123" for c in out)
+    run(go())
+    assert ep.calls == 2
+
+
+def test_unknown_kid_refetch_is_rate_limited():
+    ep = FakeEndpoint(KEY_A)
+    ks = keyset(ep, min_refetch=3600)
+
+    async def go():
+        await ks.verify(token(), {AUD})
+        for _ in range(20):
+            try:
+                await ks.verify(token(kid="junk"), {AUD})
+                raise AssertionError("accepted an unknown kid")
+            except InvalidIdToken:
+                pass
+    run(go())
+    assert ep.calls == 1
+
+
+def test_rejects_bad_tokens():
+    ks = keyset(FakeEndpoint(KEY_A))
+    now = int(time.time())
+    bad = {
+        "wrong audience": token(aud="someone-else"),
+        "wrong issuer": token(iss="https://evil.example"),
+        "expired": token(exp=now - 3600, iat=now - 7200),
+        "signed by another key": token(PRIV_B, "kid-a"),
+        "tampered": token()[:-4] + "AAAA",
+        "hs256": jwt.encode({"iss": ISSUER, "aud": AUD, "exp": now + 60}, "secret", algorithm="HS256",
+                            headers={"kid": "kid-a"}),
+        "garbage": "not-a-jwt",
+    }
+
+    async def go():
+        for name, tok in bad.items():
+            try:
+                await ks.verify(tok, {AUD})
+            except InvalidIdToken:
+                continue
+            raise AssertionError(f"{name} token was accepted")
+    run(go())
+
+
+def test_any_audience_when_none_configured():
+    ks = keyset(FakeEndpoint(KEY_A))
+    assert run(ks.verify(token(aud="whatever"), set()))["aud"] == "whatever"
+
+
+def test_outage_keeps_last_good_keys():
+    ep = FakeEndpoint(KEY_A, max_age=0)   # keys are immediately stale
+    ks = keyset(ep, min_refetch=0)
+
+    async def go():
+        await ks.verify(token(), {AUD})
+        ep.fail = True
+        claims = await ks.verify(token(), {AUD})   # refresh fails, cached key still verifies
+        assert claims["sub"] == "123"
+        assert ks.stats()["fetch_errors"] >= 1
+    run(go())
+
+
+def test_max_age_sets_expiry():
+    ks = keyset(FakeEndpoint(KEY_A, max_age=120))
+    run(ks.refresh())
+    assert 100 < ks.expires_at - time.monotonic() <= 120
+
+
+def test_cache_routes_by_provider():
+    ep = FakeEndpoint(KEY_A)
+    cache = jwks_cache.JWKSCache(fetch=ep)
+    apple = token(iss="https://appleid.apple.com", aud="com.hypewave.ai")
+
+    async def go():
+        assert (await cache.verify("apple", apple, {"com.hypewave.ai"}))["sub"] == "123"
+        try:
+            await cache.verify("google", apple, {"com.hypewave.ai"})
+            raise AssertionError("google accepted an apple-issued token")
+        except InvalidIdToken:
+            pass
+    run(go())
+
+
+if __name__ == "__main__":
+    tests = [(name, fn) for name, fn in list(globals().items()) if name.startswith("test_") and callable(fn)]
+    for name, fn in tests:
+        fn()
+        print(f"ok  {name}")
+    print(f"{len(tests)} passed")
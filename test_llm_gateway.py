@@ -0,0 +1,132 @@
+# test_llm_gateway.py
+# llm_gateway circuit breaker against a scripted in-process backend (no network).
+#
+#   python -m pytest -q test_llm_gateway.py
+#   python test_llm_gateway.py
+
+import asyncio
+
+import llm_gateway
+from llm_gateway import LLMUnavailable
+
+
+class ScriptedBackend:
+    """acomplete() fails, hangs or answers depending on `mode`."""
+
+    def __init__(self):
+        self.mode = "fail"
+        self.calls = 0
+
+    async def acomplete(self, route, messages, model, timeout, **kwargs):
+        self.calls += 1
+        if self.mode == "fail":
+            raise ConnectionError("provider down")
+        if self.mode == "hang":
+            await asyncio.sleep(3600)
+        return "ok", None
+
+
+def run(coro):
+    return asyncio.run(coro)
+
+
+def _open_route(name: str, backend: ScriptedBackend):
+    """Trip the breaker on `name`, then expire the cooldown so the next call is the half-open probe."""
+    r = llm_gateway._route(name)
+    backend.mode = "fail"
+
+    async def go():
+        for _ in range(llm_gateway.BREAKER_FAILURES):
+            try:
+                await llm_gateway.acomplete(name, [], timeout=5)
+            except ConnectionError:
+                pass
+    run(go())
+    assert r.snapshot()["circuit"] == "open"
+    r.open_until = 1.0  # in the past: half-open
+    return r
+
+
+def _setup():
+    backend = ScriptedBackend()
+    llm_gateway.set_backend(backend)
+    llm_gateway.MAX_RETRIES = 0
+    return backend
+
+
+def test_cancelled_probe_lets_next_call_through():
+    backend = _setup()
+    r = _open_route("test.cancel_probe", backend)
+    backend.mode = "hang"
+
+    async def go():
+        probe = asyncio.ensure_future(llm_gateway.acomplete("test.cancel_probe", [], timeout=5))
+        await asyncio.sleep(0.05)
+        assert r.probing
+        probe.cancel()
+        try:
+            await probe
+            raise AssertionError("probe was not cancelled")
+        except asyncio.CancelledError:
+            pass
+
+        backend.mode = "ok"
+        assert await llm_gateway.acomplete("test.cancel_probe", [], timeout=5) == "ok"
+    run(go())
+
+    snap = r.snapshot()
+    assert snap["circuit"] == "closed"
+    assert snap["in_flight"] == 0
+    assert snap["cancelled"] == 1
+
+
+def test_cancelled_call_is_not_a_provider_failure():
+    backend = _setup()
+    backend.mode = "hang"
+    r = llm_gateway._route("test.cancel_closed")
+
+    async def go():
+        for _ in range(llm_gateway.BREAKER_FAILURES + 1):
+            call = asyncio.ensure_future(llm_gateway.acomplete("test.cancel_closed", [], timeout=5))
+            await asyncio.sleep(0.01)
+            call.cancel()
+            try:
+                await call
+            except asyncio.CancelledError:
+                pass
+    run(go())
+
+    snap = r.snapshot()
+    assert snap["circuit"] == "closed"
+    assert snap["errors"] == 0
+    assert snap["in_flight"] == 0
+
+
+def test_probe_in_flight_still_short_circuits():
+    backend = _setup()
+    r = _open_route("test.probe_busy", backend)
+    backend.mode = "hang"
+
+    async def go():
+        probe = asyncio.ensure_future(llm_gateway.acomplete("test.probe_busy", [], timeout=5))
+        await asyncio.sleep(0.05)
+        try:
+            await llm_gateway.acomplete("test.probe_busy", [], timeout=5)
+            raise AssertionError("second call admitted while the probe was in flight")
+        except LLMUnavailable:
+            pass
+        probe.cancel()
+        try:
+            await probe
+        except asyncio.CancelledError:
+            pass
+    run(go())
+    assert r.snapshot()["in_flight"] == 0
+
+
+if __name__ == "__main__":
+    tests = [(name, fn) for name, fn in list(globals().items()) if name.startswith("test_") and callable(fn)]
+    for name, fn in tests:
+        fn()
+        print(f"ok  {name}")
+    print(f"{len(tests)} passed")
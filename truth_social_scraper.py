@@ -14,10 +14,11 @@ Fetches the single most recent Truth Social post and stores it in MongoDB, inclu
 import os
 import asyncio
 from datetime import datetime, timezone
-from pymongo import MongoClient
 from playwright.async_api import async_playwright
 
-client = MongoClient(os.getenv("MONGO_DB_URI"))
+from mongo_pool import get_client
+
+client = get_client("worker")
 collection = client["hypewave"]["truth_social"]
 
 async def fetch_latest_truthsocial():
@@ -1,41 +1,14 @@
 # winrate_checker.py
-from datetime import datetime, timezone
-from db import client  # ✅ Use the shared MongoDB client from .env
+from storage import get_storage  # ✅ Mongo or in-memory backend (HYPEWAVE_STORAGE)
 import random
 
-stats_coll = client["hypewave"]["stats"]
-
-# Ensure winrate stats doc exists
-def init_winrate_doc():
-    if not stats_coll.find_one({"_id": "winrate"}):
-        stats_coll.insert_one({
-            "_id": "winrate",
-            "wins": 0,
-            "total_trades": 0,
-            "winrate": 0.0,
-            "last_updated": datetime.now(timezone.utc)
-        })
-
-# Update with result (True = win, False = loss)
+# Update with result (True = win, False = loss) — single atomic write on Mongo
 def update_winrate(is_win: bool):
-    init_winrate_doc()
-    update = {
-        "$inc": {"total_trades": 1},
-        "$set": {"last_updated": datetime.now(timezone.utc)}
-    }
-    if is_win:
-        update["$inc"]["wins"] = 1
-
-    stats_coll.update_one({"_id": "winrate"}, update)
-
-    doc = stats_coll.find_one({"_id": "winrate"})
-    if doc and doc["total_trades"] > 0:
-        winrate = round((doc["wins"] / doc["total_trades"]) * 100, 2)
-        stats_coll.update_one({"_id": "winrate"}, {"$set": {"winrate": winrate}})
+    get_storage().record_trade_result(is_win)
 
 # Get current stats
 def get_winrate():
-    doc = stats_coll.find_one({"_id": "winrate"})
+    doc = get_storage().get_winrate_stats()
     if not doc:
         return {"total_trades": 0, "wins": 0, "winrate": 0.0}
     return {
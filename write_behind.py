@@ -0,0 +1,216 @@
+# write_behind.py
+# Write-behind buffer for fire-and-forget writes (chat logs, last_seen, ...).
+#
+# Callers enqueue and return immediately; a daemon thread flushes with one
+# unordered bulk_write per collection whenever MAX_BATCH ops are pending or
+# FLUSH_INTERVAL seconds have passed. Per-key updates are coalesced: a newer
+# update for the same key replaces (merges into) the pending one, and
+# `min_interval` drops repeats that arrive too soon after the last write.
+#
+# Anything still pending is flushed on shutdown (API lifespan + atexit). Once
+# stopped the flusher stays stopped: a late write (a last_seen during shutdown)
+# is written straight through by the caller instead.
+
+import atexit
+import os
+import threading
+import time
+
+from pymongo import InsertOne, UpdateOne
+from pymongo.errors import BulkWriteError
+
+from mongo_pool import get_client
+
+DB_NAME = "hypewave"
+MAX_BATCH = int(os.getenv("WRITE_BEHIND_MAX_BATCH", "500"))
+FLUSH_INTERVAL = float(os.getenv("WRITE_BEHIND_FLUSH_SECONDS", "2"))
+MAX_PENDING = int(os.getenv("WRITE_BEHIND_MAX_PENDING", "50000"))
+
+
+def _merge_updates(old: dict, new: dict) -> dict:
+    """Fold two update documents for the same key: $set/$setOnInsert last-wins, $inc sums."""
+    merged = {op: dict(fields) for op, fields in old.items()}
+    for op, fields in new.items():
+        bucket = merged.setdefault(op, {})
+        for k, v in fields.items():
+            if op == "$inc":
+                bucket[k] = bucket.get(k, 0) + v
+            else:
+                bucket[k] = v
+    return merged
+
+
+class WriteBehindBuffer:
+    def __init__(self, db=None, max_batch: int = MAX_BATCH, flush_interval: float = FLUSH_INTERVAL,
+                 max_pending: int = MAX_PENDING):
+        self._db = db
+        self.max_batch = max_batch
+        self.flush_interval = flush_interval
+        self.max_pending = max_pending
+
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._thread = None
+
+        self._inserts = []           # [(coll, doc)]
+        self._updates = {}           # (coll, key) -> (filter, update, upsert)
+        self._last_written = {}      # (coll, key) -> monotonic ts of last flushed write
+
+        self._stats = {"enqueued": 0, "coalesced": 0, "skipped": 0, "dropped": 0,
+                       "flushes": 0, "db_ops": 0, "errors": 0, "after_stop": 0}
+
+    @property
+    def db(self):
+        if self._db is None:
+            self._db = get_client()[DB_NAME]
+        return self._db
+
+    # --- enqueue (never blocks on I/O until stop()) ---
+
+    def insert(self, coll: str, doc: dict):
+        with self._lock:
+            if not self._admit():
+                return
+            self._inserts.append((coll, doc))
+        self._after_enqueue()
+
+    def update(self, coll: str, key, filter: dict, update: dict, upsert: bool = False, min_interval: float = 0):
+        """
+        Queue an update coalesced on (coll, key). With min_interval > 0, an update
+        arriving within that many seconds of the last flushed write for the key is skipped.
+        """
+        k = (coll, key)
+        with self._lock:
+            if k in self._updates:
+                f, u, up = self._updates[k]
+                self._updates[k] = (f, _merge_updates(u, update), up or upsert)
+                self._stats["enqueued"] += 1
+                self._stats["coalesced"] += 1
+                return
+            last = self._last_written.get(k)
+            if min_interval and last is not None and time.monotonic() - last < min_interval:
+                self._stats["skipped"] += 1
+                return
+            if not self._admit():
+                return
+            self._updates[k] = (filter, update, upsert)
+        self._after_enqueue()
+
+    def _admit(self) -> bool:
+        # caller holds self._lock
+        if len(self._inserts) + len(self._updates) >= self.max_pending:
+            self._stats["dropped"] += 1
+            return False
+        self._stats["enqueued"] += 1
+        return True
+
+    def _after_enqueue(self):
+        if self._stop.is_set():
+            # shutting down: no flusher any more, write it (and anything left) now
+            self._stats["after_stop"] += 1
+            self.flush()
+            return
+        self._ensure_started()
+        if len(self._inserts) + len(self._updates) >= self.max_batch:
+            self._wake.set()
+
+    # --- flushing ---
+
+    def flush(self) -> int:
+        """Write everything pending now. Returns the number of DB operations issued."""
+        with self._flush_lock:
+            with self._lock:
+                inserts, self._inserts = self._inserts, []
+                updates, self._updates = self._updates, {}
+            if not inserts and not updates:
+                return 0
+
+            by_coll = {}
+            for coll, doc in inserts:
+                by_coll.setdefault(coll, []).append(InsertOne(doc))
+            for (coll, _key), (flt, upd, upsert) in updates.items():
+                by_coll.setdefault(coll, []).append(UpdateOne(flt, upd, upsert=upsert))
+
+            issued = 0
+            failed = set()
+            for coll, ops in by_coll.items():
+                try:
+                    self.db[coll].bulk_write(ops, ordered=False)
+                except BulkWriteError as e:
+                    self._stats["errors"] += len(e.details.get("writeErrors", []))
+                    print(f"[write-behind] {coll}: {len(e.details.get('writeErrors', []))} write errors")
+                except Exception as e:
+                    # connection-level failure: put the batch back (bounded) and retry next tick
+                    self._stats["errors"] += 1
+                    print(f"[write-behind] {coll} flush failed, requeueing {len(ops)} ops:", e)
+                    self._requeue(coll, inserts, updates)
+                    failed.add(coll)
+                    continue
+                issued += len(ops)
+
+            now = time.monotonic()
+            with self._lock:
+                for k in updates:
+                    if k[0] not in failed:
+                        self._last_written[k] = now
+                self._prune_last_written(now)
+                self._stats["flushes"] += 1
+                self._stats["db_ops"] += issued
+            return issued
+
+    def _requeue(self, coll: str, inserts: list, updates: dict):
+        with self._lock:
+            room = self.max_pending - len(self._inserts) - len(self._updates)
+            back = [(c, d) for c, d in inserts if c == coll][:max(room, 0)]
+            self._inserts[:0] = back
+            for k, v in updates.items():
+                if k[0] == coll and k not in self._updates and len(self._updates) + len(self._inserts) < self.max_pending:
+                    self._updates[k] = v
+            lost = len([1 for c, _ in inserts if c == coll]) - len(back)
+            self._stats["dropped"] += max(lost, 0)
+
+    def _prune_last_written(self, now: float, horizon: float = 3600):
+        # caller holds self._lock; keep the throttle map bounded
+        if len(self._last_written) > 10_000:
+            self._last_written = {k: t for k, t in self._last_written.items() if now - t < horizon}
+
+    def _run(self):
+        while not self._stop.is_set():
+            self._wake.wait(self.flush_interval)
+            self._wake.clear()
+            try:
+                self.flush()
+            except Exception as e:
+                print("[write-behind] flush loop error:", e)
+
+    def _ensure_started(self):
+        if self._thread is None or not self._thread.is_alive():
+            with self._lock:
+                if not self._stop.is_set() and (self._thread is None or not self._thread.is_alive()):
+                    self._thread = threading.Thread(target=self._run, name="write-behind", daemon=True)
+                    self._thread.start()
+
+    def stop(self, timeout: float = 10):
+        """Stop the flusher for good and drain whatever is still pending. Safe to call twice."""
+        with self._lock:
+            self._stop.set()
+        self._wake.set()
+        if self._thread is not None and self._thread is not threading.current_thread():
+            self._thread.join(timeout)
+        self.flush()
+
+    def stats(self) -> dict:
+        with self._lock:
+            s = dict(self._stats)
+            s["pending"] = len(self._inserts) + len(self._updates)
+        # how many logical writes each DB op absorbed (skipped ones cost nothing)
+        requested = s["enqueued"] + s["skipped"]
+        s["ops_per_db_write"] = round(requested / s["db_ops"], 2) if s["db_ops"] else None
+        return s
+
+
+# Process-wide buffer used by db.py / db_async.py
+write_buffer = WriteBehindBuffer()
+atexit.register(write_buffer.stop)